@@ -0,0 +1,341 @@
+"""
+Асинхронные представления для частых GET-запросов: список и страница
+рецепта, теги, ингредиенты, список подписок.
+
+Под ASGI (gunicorn с UvicornWorker) запрос не занимает поток, пока ждет
+БД или медленного клиента. Разбор запроса, права, фильтры и
+сериализаторы берутся из ViewSet'ов api.views: экземпляр ViewSet
+создается так же, как при обычном вызове. Асинхронно выполняются
+аутентификация по токену, запросы к БД (acount, aiterator, aget) и кэш
+справочников. Фильтры django-filter и индекс ингредиентов проверяют
+значения запросами к БД, поэтому они вызываются через sync_to_async.
+Запросы других методов, HEAD и запросы в форматах кроме JSON передаются
+синхронному ViewSet'у.
+"""
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.http import Http404, HttpResponse
+from django.shortcuts import aget_object_or_404
+from django.urls import URLPattern, URLResolver
+from django.utils.cache import get_conditional_response
+from django.utils.translation import gettext_lazy as _
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    TokenAuthentication, get_authorization_header
+)
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .ingredient_index import fuzzy_ingredients, ingredient_index
+from .views import FgUserViewSet, IngredientViewSet, RecipeViewSet, TagViewSet
+from core.catalog import aget_catalog_version
+from core.constants import CATALOG_CACHE_TIMEOUT
+from core.middleware import mark_view_finished
+
+
+class AsyncTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с асинхронным запросом токена к БД."""
+
+    async def aauthenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        try:
+            key = auth[1].decode() if len(auth) == 2 else None
+        except UnicodeError:
+            key = None
+        if key is None:
+            # Ошибку формата заголовка TokenAuthentication выдает до
+            # запроса к БД.
+            return self.authenticate(request)
+        try:
+            token = await self.get_model().objects.select_related(
+                'user'
+            ).aget(key=key)
+        except self.get_model().DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        return token.user, token
+
+
+class AsyncReadView:
+    """
+    Асинхронные GET-действия read_actions ViewSet'а viewset.
+
+    Действие выполняет одноименный async-метод этого класса; остальные
+    действия маршрута выполняет сам ViewSet.
+    """
+
+    viewset = None
+    read_actions = ()
+
+    def __init__(self, view):
+        self.view = view
+
+    @classmethod
+    def as_view(cls, actions, **initkwargs):
+        """Представление маршрута, как ViewSet.as_view(actions)."""
+        sync_view = cls.viewset.as_view(actions, **initkwargs)
+
+        async def view(request, *args, **kwargs):
+            if (
+                request.method != 'GET'
+                or request.GET.get(api_settings.URL_FORMAT_OVERRIDE)
+                or 'format' in kwargs
+            ):
+                return await sync_to_async(sync_view)(
+                    request, *args, **kwargs
+                )
+            viewset = cls.make_viewset(
+                request, args, kwargs, actions, initkwargs
+            )
+            return await cls(viewset).get(request, sync_view, *args, **kwargs)
+
+        view.cls = cls.viewset
+        view.actions = actions
+        view.initkwargs = initkwargs
+        view.__name__ = view.__qualname__ = sync_view.__name__
+        return csrf_exempt(view)
+
+    @classmethod
+    def make_viewset(cls, request, args, kwargs, actions, initkwargs):
+        """Экземпляр ViewSet'а, как его создает ViewSet.as_view()."""
+        viewset = cls.viewset(**initkwargs)
+        viewset.action_map = actions
+        viewset.action = actions['get']
+        viewset.request = request
+        viewset.args = args
+        viewset.kwargs = kwargs
+        viewset.format_kwarg = None
+        viewset.headers = viewset.default_response_headers
+        viewset.authentication_classes = [
+            AsyncTokenAuthentication if auth_class is TokenAuthentication
+            else auth_class
+            for auth_class in viewset.authentication_classes
+        ]
+        return viewset
+
+    async def get(self, request, sync_view, *args, **kwargs):
+        view = self.view
+        request = view.initialize_request(request, *args, **kwargs)
+        view.request = request
+        try:
+            neg = view.perform_content_negotiation(request)
+            request.accepted_renderer, request.accepted_media_type = neg
+            if request.accepted_renderer.format != 'json':
+                return await sync_to_async(sync_view)(
+                    request._request, *args, **kwargs
+                )
+            version, scheme = view.determine_version(
+                request, *args, **kwargs
+            )
+            request.version, request.versioning_scheme = version, scheme
+            await self.authenticate(request)
+            view.check_permissions(request)
+            view.check_throttles(request)
+            response = await getattr(self, view.action)(request)
+        except Exception as exc:
+            response = view.handle_exception(exc)
+        response = view.finalize_response(request, response, *args, **kwargs)
+        return self.render(response)
+
+    async def authenticate(self, request):
+        """Пользователь по токену из заголовка Authorization."""
+        request._authenticator = None
+        request.user, request.auth = (
+            api_settings.UNAUTHENTICATED_USER(), None
+        )
+        for authenticator in request.authenticators:
+            if isinstance(authenticator, AsyncTokenAuthentication):
+                user_auth = await authenticator.aauthenticate(request)
+            else:
+                user_auth = await sync_to_async(authenticator.authenticate)(
+                    request
+                )
+            if user_auth is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth
+                return
+
+    @staticmethod
+    def render(response):
+        """
+        Готовый HttpResponse: отложенную отрисовку Response обработчик
+        ASGI выполнил бы в отдельном потоке.
+        """
+        if not hasattr(response, 'render'):
+            return response
+        mark_view_finished()
+        response.render()
+        rendered = HttpResponse(
+            response.content, status=response.status_code
+        )
+        for header, value in response.items():
+            rendered[header] = value
+        return rendered
+
+    async def filtered_queryset(self):
+        return await sync_to_async(self.view.filter_queryset)(
+            self.view.get_queryset()
+        )
+
+    async def get_object(self):
+        """Объект по lookup_field, как GenericAPIView.get_object()."""
+        view = self.view
+        lookup_url_kwarg = view.lookup_url_kwarg or view.lookup_field
+        try:
+            obj = await aget_object_or_404(
+                await self.filtered_queryset(),
+                **{view.lookup_field: view.kwargs[lookup_url_kwarg]}
+            )
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        view.check_object_permissions(view.request, obj)
+        return obj
+
+    async def paginated_response(self, queryset):
+        view = self.view
+        page = await view.paginator.apaginate_queryset(
+            queryset, view.request, view
+        )
+        return view.get_paginated_response(
+            view.get_serializer(page, many=True).data
+        )
+
+    async def list(self, request):
+        view = self.view
+        queryset = await self.filtered_queryset()
+        if view.paginator is not None:
+            return await self.paginated_response(queryset)
+        return Response(view.get_serializer(
+            [obj async for obj in queryset], many=True
+        ).data)
+
+    async def retrieve(self, request):
+        return Response(self.view.get_serializer(await self.get_object()).data)
+
+
+class AsyncCatalogView(AsyncReadView):
+    """Справочник с кэшем и ETag, как ReadonlyNonPaginated."""
+
+    read_actions = ('list', 'retrieve')
+
+    async def catalog_response(self, request, get_response):
+        view = self.view
+        cache_key, etag, last_modified = view.catalog_validators(
+            request, await aget_catalog_version(view.queryset.model)
+        )
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            content = await cache.aget(cache_key)
+            if content is None:
+                response = await get_response()
+                if response.status_code == 200:
+                    content = view.catalog_content(request, response)
+                    await cache.aset(
+                        cache_key, content, CATALOG_CACHE_TIMEOUT
+                    )
+            if content is not None:
+                response = HttpResponse(
+                    content, content_type='application/json'
+                )
+        return view.with_catalog_headers(response, etag, last_modified)
+
+    async def list(self, request):
+        return await self.catalog_response(
+            request, partial(super().list, request)
+        )
+
+    async def retrieve(self, request):
+        return await self.catalog_response(
+            request, partial(super().retrieve, request)
+        )
+
+
+class AsyncTagView(AsyncCatalogView):
+    viewset = TagViewSet
+
+
+class AsyncIngredientView(AsyncCatalogView):
+    viewset = IngredientViewSet
+
+    async def list(self, request):
+        """Как IngredientViewSet.list: индекс в памяти или БД."""
+        name = request.query_params.get('name', '').strip()
+        if name and request.query_params.get('fuzzy') in {'true', '1'}:
+            return await self.catalog_response(
+                request, partial(self.found, fuzzy_ingredients, name)
+            )
+        if 'search' in request.query_params:
+            return await super().list(request)
+        return await self.catalog_response(request, partial(
+            self.found, ingredient_index.search,
+            request.query_params.get('name', '')
+        ))
+
+    @staticmethod
+    async def found(search, name):
+        # Индекс перестраивается из БД при смене версии справочника.
+        result = await sync_to_async(search)(name)
+        if isinstance(result, bytes):
+            return HttpResponse(result, content_type='application/json')
+        return Response(result)
+
+
+class AsyncRecipeView(AsyncReadView):
+    viewset = RecipeViewSet
+    read_actions = ('list', 'retrieve')
+
+
+class AsyncSubscriptionView(AsyncReadView):
+    viewset = FgUserViewSet
+    read_actions = ('get_subscriptions_list',)
+
+    async def get_subscriptions_list(self, request):
+        return await self.paginated_response(
+            self.view.subscriptions_queryset()
+        )
+
+
+ASYNC_READ_VIEWS = {
+    view_class.viewset: view_class for view_class in (
+        AsyncIngredientView, AsyncRecipeView, AsyncSubscriptionView,
+        AsyncTagView,
+    )
+}
+
+
+def with_async_reads(patterns):
+    """
+    Копия маршрутов patterns (и вложенных), в которой представления
+    ViewSet'ов, GET-действие которых есть в ASYNC_READ_VIEWS, заменены на
+    асинхронные. Сами patterns не меняются.
+    """
+    result = []
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            pattern = URLResolver(
+                pattern.pattern, with_async_reads(pattern.url_patterns),
+                pattern.default_kwargs, pattern.app_name, pattern.namespace
+            )
+        else:
+            callback = pattern.callback
+            view_class = ASYNC_READ_VIEWS.get(getattr(callback, 'cls', None))
+            actions = getattr(callback, 'actions', None) or {}
+            if view_class and actions.get('get') in view_class.read_actions:
+                pattern = URLPattern(
+                    pattern.pattern,
+                    view_class.as_view(actions, **callback.initkwargs),
+                    pattern.default_args, pattern.name
+                )
+        result.append(pattern)
+    return result
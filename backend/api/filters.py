@@ -3,6 +3,7 @@ from django_filters.rest_framework import (
 )
 
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search_recipes
 
 
 class RecipeFilter(FilterSet):
@@ -17,10 +18,13 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    q = CharFilter(method='filter_q')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'is_favorited', 'is_in_shopping_cart', 'author')
+        fields = (
+            'tags', 'is_favorited', 'is_in_shopping_cart', 'author', 'q'
+        )
 
     def filter_is_favorited(self, queryset, name, is_favorited):
         """Дополнительная фильтрация, если установлен флаг is_favorited."""
@@ -34,6 +38,16 @@ class RecipeFilter(FilterSet):
             return queryset.filter(in_shoppingcart__user=self.request.user)
         return queryset
 
+    def filter_q(self, queryset, name, text):
+        """
+        Полнотекстовый поиск по названию, описанию, тегам и ингредиентам.
+
+        Результаты упорядочены по релевантности и листаются по номеру
+        страницы: cursor вместе с q — ошибка 400 (см. FgPagination).
+        В ленте, которая листается только курсором, q лишь фильтрует.
+        """
+        return search_recipes(queryset, text)
+
 
 class IngredientFilter(FilterSet):
     """Фильтр для ингредиентов."""
@@ -0,0 +1,315 @@
+import heapq
+import json
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from itertools import groupby
+from math import ceil
+from operator import itemgetter
+from threading import Lock
+
+from django.db import connection, transaction
+
+from core.catalog import get_catalog_version
+from core.constants import INGREDIENT_FUZZY_LIMIT, INGREDIENT_TRIGRAM_THRESHOLD
+from recipes.models import Ingredient
+
+
+RESULT_CACHE_SIZE = 1024
+
+WORD = re.compile(r'\w+')
+
+
+def _padded_words(text):
+    return [f'  {word} ' for word in WORD.findall(text)]
+
+
+def _grams(padded_words):
+    """Последовательность триграмм слов, уже дополненных пробелами."""
+    return [
+        padded[i:i + 3]
+        for padded in padded_words
+        for i in range(len(padded) - 2)
+    ]
+
+
+def trigrams(text):
+    """
+    Триграммы text, как в pg_trgm: каждое слово дополняется двумя
+    пробелами слева и одним справа.
+    """
+    return set(_grams(_padded_words(text)))
+
+
+def extent_similarity(query, grams):
+    """
+    Наибольшее сходство триграмм query с непрерывным отрезком
+    последовательности триграмм grams (как word_similarity в pg_trgm).
+    """
+    best = 0
+    for start, gram in enumerate(grams):
+        if gram not in query:
+            continue
+        extent = set()
+        shared = 0
+        for gram in grams[start:]:
+            if gram in extent:
+                continue
+            extent.add(gram)
+            if gram in query:
+                shared += 1
+                best = max(best, shared / (len(query) + len(extent) - shared))
+    return best
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов по префиксу названия в памяти процесса.
+
+    Названия хранятся в отсортированном массиве в casefold-виде, поиск
+    префикса выполняется через bisect. Индекс строится лениво при первом
+    обращении и перестраивается, когда меняется версия справочника
+    Ingredient (см. core.catalog), в том числе после изменений в других
+    процессах. Для каждого префикса кэшируется готовый JSON в байтах.
+
+    Для нечеткого поиска (fuzzy_search) при первом обращении строятся
+    инвертированные индексы: триграмма -> позиции названий с ней и
+    триграмма -> слова названий с ней.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._keys = None
+        self._rows = None
+        self._postings = None
+        self._words = None
+        self._word_postings = None
+        self._word_names = None
+        self._results = {}
+
+    def _build(self, version):
+        self._version = version
+        self._results = {}
+        self._postings = None
+        rows = sorted(
+            (name.casefold(), name, pk, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            ).order_by().iterator()
+        )
+        self._keys = [row[0] for row in rows]
+        self._rows = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _key, name, pk, measurement_unit in rows
+        ]
+
+    def _build_postings(self):
+        # Триграммы названия — объединение триграмм его слов, а слова
+        # в названиях повторяются: триграммы считаются по словарю.
+        postings = defaultdict(lambda: array('I'))
+        word_ids = {}
+        word_grams = []
+        word_names = []
+        for position, key in enumerate(self._keys):
+            grams = set()
+            for word in set(WORD.findall(key)):
+                word_id = word_ids.get(word)
+                if word_id is None:
+                    word_id = word_ids[word] = len(word_names)
+                    word_grams.append(trigrams(word))
+                    word_names.append(array('I'))
+                word_names[word_id].append(position)
+                grams |= word_grams[word_id]
+            for gram in grams:
+                postings[gram].append(position)
+        word_postings = defaultdict(lambda: array('I'))
+        for word_id, grams in enumerate(word_grams):
+            for gram in grams:
+                word_postings[gram].append(word_id)
+        self._postings = dict(postings)
+        self._words = list(word_ids)
+        self._word_postings = dict(word_postings)
+        self._word_names = word_names
+
+    def _refresh(self):
+        version = get_catalog_version(Ingredient)
+        if self._version != version:
+            self._build(version)
+
+    def _prefix_range(self, prefix):
+        start = bisect_left(self._keys, prefix)
+        end = start
+        while end < len(self._keys) and self._keys[end].startswith(prefix):
+            end += 1
+        return start, end
+
+    def search(self, prefix=''):
+        """Возвращает JSON (bytes) ингредиентов, начинающихся с prefix."""
+        prefix = prefix.strip().casefold()
+        with self._lock:
+            self._refresh()
+            content = self._results.get(prefix)
+            if content is not None:
+                return content
+            start, end = self._prefix_range(prefix)
+            content = json.dumps(
+                self._rows[start:end],
+                ensure_ascii=False,
+                separators=(',', ':'),
+            ).encode()
+            if len(self._results) >= RESULT_CACHE_SIZE:
+                self._results.clear()
+            self._results[prefix] = content
+            return content
+
+    def fuzzy_search(self, text, limit=INGREDIENT_FUZZY_LIMIT):
+        """
+        До limit ингредиентов, похожих на text.
+
+        Порядок как у Ingredient.objects.fuzzy_search(): начинающиеся с
+        text, затем содержащие его, затем похожие по триграммам
+        (word_similarity).
+        """
+        text = text.strip().casefold()
+        with self._lock:
+            self._refresh()
+            if self._postings is None:
+                self._build_postings()
+            start, end = self._prefix_range(text)
+            found = list(range(start, min(end, start + limit)))
+            for more in (self._containing, self._similar):
+                if len(found) >= limit:
+                    break
+                found += more(text, set(found), limit - len(found))
+            return [self._rows[position] for position in found]
+
+    def _containing(self, text, seen, limit):
+        """Позиции названий, содержащих text, в алфавитном порядке."""
+        # Такое название содержит все триграммы внутри слов text —
+        # кандидаты берутся из самого короткого списка позиций.
+        grams = {
+            word[i:i + 3]
+            for word in WORD.findall(text)
+            for i in range(len(word) - 2)
+        }
+        candidates = min(
+            (self._postings.get(gram, ()) for gram in grams), key=len
+        ) if grams else range(len(self._keys))
+        found = []
+        for position in candidates:
+            if position not in seen and text in self._keys[position]:
+                found.append(position)
+                if len(found) == limit:
+                    break
+        return found
+
+    def _similar(self, text, seen, limit):
+        """Позиции названий по убыванию word_similarity с text."""
+        query = trigrams(text)
+        if not query:
+            return []
+        # Сходство не больше shared / len(query), где shared — общие с
+        # запросом триграммы: кандидаты с меньшим needed отбрасываются.
+        needed = ceil(INGREDIENT_TRIGRAM_THRESHOLD * len(query))
+        width = len(WORD.findall(text))
+        if width == 1:
+            return self._similar_words(query, needed, seen, limit)
+        return self._similar_names(query, needed, width, seen, limit)
+
+    @staticmethod
+    def _candidates(postings, query, needed):
+        """Пары (-shared, элемент) с shared >= needed по возрастанию."""
+        shared = Counter()
+        for gram in query:
+            shared.update(postings.get(gram, ()))
+        return sorted(
+            (-count, item) for item, count in shared.items()
+            if count >= needed
+        )
+
+    def _similar_words(self, query, needed, seen, limit):
+        """
+        Запрос из одного слова: сходство названия — наибольшее сходство
+        его слов, поэтому оно считается по словарю слов, а не по всем
+        названиям.
+        """
+        matched = []
+        for _shared, word_id in self._candidates(
+            self._word_postings, query, needed
+        ):
+            similarity = extent_similarity(
+                query, _grams(_padded_words(self._words[word_id]))
+            )
+            if similarity >= INGREDIENT_TRIGRAM_THRESHOLD:
+                matched.append((-similarity, word_id))
+        matched.sort()
+        found = []
+        taken = set(seen)
+        for _similarity, group in groupby(matched, key=itemgetter(0)):
+            positions = sorted({
+                position
+                for _, word_id in group
+                for position in self._word_names[word_id]
+            } - taken)
+            found += positions[:limit - len(found)]
+            if len(found) >= limit:
+                break
+            taken.update(positions)
+        return found
+
+    def _similar_names(self, query, needed, width, seen, limit):
+        """
+        Запрос из нескольких слов: отрезок ищется в пределах width
+        подряд идущих слов названия. Кандидаты проверяются по убыванию
+        оценки shared / len(query), пока она не станет хуже худшего из
+        найденных.
+        """
+        windows = {}
+        found = []
+        for minus_shared, position in self._candidates(
+            self._postings, query, needed
+        ):
+            if position in seen:
+                continue
+            if len(found) == limit and (
+                -minus_shared / len(query), -position
+            ) <= found[0]:
+                break
+            words = _padded_words(self._keys[position])
+            similarity = 0
+            for start in range(max(1, len(words) - width + 1)):
+                window = tuple(words[start:start + width])
+                if window not in windows:
+                    windows[window] = extent_similarity(query, _grams(window))
+                similarity = max(similarity, windows[window])
+            if similarity >= INGREDIENT_TRIGRAM_THRESHOLD:
+                item = (similarity, -position)
+                if len(found) < limit:
+                    heapq.heappush(found, item)
+                elif item > found[0]:
+                    heapq.heapreplace(found, item)
+        return [-position for _, position in sorted(found, reverse=True)]
+
+
+ingredient_index = IngredientIndex()
+
+
+def fuzzy_ingredients(text, limit=INGREDIENT_FUZZY_LIMIT):
+    """
+    Нечеткий поиск ингредиентов: в PostgreSQL — запросом по GIN-индексу
+    pg_trgm, в остальных БД — по индексу в памяти.
+    """
+    if connection.vendor == 'postgresql':
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Порог оператора <% — только для этой транзакции.
+            cursor.execute(
+                'SELECT set_config('
+                '\'pg_trgm.word_similarity_threshold\', %s, true)',
+                [str(INGREDIENT_TRIGRAM_THRESHOLD)],
+            )
+            return list(Ingredient.objects.fuzzy_search(text).values(
+                'id', 'name', 'measurement_unit'
+            )[:limit])
+    return ingredient_index.fuzzy_search(text, limit)
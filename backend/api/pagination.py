@@ -1,11 +1,307 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
-from core.constants import MAX_PAGE_SIZE, PAGE_SIZE
+from core.constants import (
+    CURSOR_WITH_ORDERING, INVALID_CURSOR, MAX_PAGE_SIZE, PAGE_SIZE
+)
 
 
 class FgPagination(PageNumberPagination):
-    """Пагинация рецептов/пользователей."""
+    """
+    Пагинация рецептов/пользователей.
+
+    Режимы:
+    - ?page=N — по номеру страницы, с общим числом объектов count;
+    - ?page=N&count=false — по номеру страницы без COUNT(*), для
+      бесконечной прокрутки;
+    - ?cursor= — по ключу (keyset) из полей view.cursor_ordering,
+      без OFFSET и COUNT(*): следующая страница начинается после
+      последнего объекта текущей. Пустой cursor — первая страница.
+
+    Курсор хранит только позицию в порядке cursor_ordering, поэтому
+    запрос со своим порядком (поиск q — по релевантности) по курсору
+    отклоняется с ошибкой 400: иначе курсор и номер страницы выдавали бы
+    одни и те же результаты в разном порядке. Такие запросы листаются
+    по номеру страницы.
+
+    Во всех режимах размер страницы задается параметром limit.
+    """
 
     page_size = PAGE_SIZE
     page_size_query_param = 'limit'
     max_page_size = MAX_PAGE_SIZE
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    cursor_overrides_ordering = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        steps = self._paginate(queryset, request, view)
+        result = None
+        try:
+            while True:
+                query, queryset = steps.send(result)
+                result = (
+                    queryset.count() if query == 'count' else list(queryset)
+                )
+        except StopIteration as stop:
+            return stop.value
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        То же, что paginate_queryset, но COUNT(*) и объекты страницы
+        загружаются асинхронным ORM (acount, aiterator).
+        """
+        steps = self._paginate(queryset, request, view)
+        chunk_size = self.get_page_size(request) + 1
+        result = None
+        try:
+            while True:
+                query, queryset = steps.send(result)
+                if query == 'count':
+                    result = await queryset.acount()
+                else:
+                    result = [
+                        obj async for obj
+                        in queryset.aiterator(chunk_size=chunk_size)
+                    ]
+        except StopIteration as stop:
+            return stop.value
+
+    def _paginate(self, queryset, request, view):
+        """
+        Пагинация по шагам: генератор отдает запросы ('count', queryset)
+        или ('list', queryset) и получает через send() их результат,
+        а возвращает объекты страницы.
+        """
+        self.request = request
+        self.with_count = True
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering and self.cursor_requested(request):
+            self.check_cursor_ordering(queryset, ordering)
+            self.with_count = False
+            return self._paginate_by_cursor(queryset, request, ordering)
+        if request.query_params.get(self.count_query_param) in {
+            'false', '0'
+        }:
+            self.with_count = False
+            return self._paginate_without_count(queryset, request)
+        return self._paginate_with_count(queryset, request)
+
+    def cursor_requested(self, request):
+        """Нужна ли пагинация по курсору для запроса."""
+        return self.cursor_query_param in request.query_params
+
+    def check_cursor_ordering(self, queryset, ordering):
+        """Отклоняет курсор для запроса со своим порядком объектов."""
+        order_by = tuple(queryset.query.order_by)
+        if (
+            order_by and order_by != tuple(ordering)
+            and not self.cursor_overrides_ordering
+        ):
+            raise ValidationError({
+                self.cursor_query_param: [CURSOR_WITH_ORDERING]
+            })
+
+    def get_paginated_response(self, data):
+        if self.with_count:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict((
+            ('next', self.next_link),
+            ('previous', self.previous_link),
+            ('results', data),
+        )))
+
+    def _paginate_with_count(self, queryset, request):
+        """Страница по номеру с общим числом объектов, как в DRF."""
+        paginator = self.django_paginator_class(
+            queryset, self.get_page_size(request)
+        )
+        paginator.count = yield 'count', queryset
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            ))
+        self.page.object_list = yield 'list', self.page.object_list
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
+
+    def _paginate_without_count(self, queryset, request):
+        """Страница по номеру: page_size + 1 объектов вместо COUNT(*)."""
+        page_size = self.get_page_size(request)
+        try:
+            page_number = int(
+                request.query_params.get(self.page_query_param, 1)
+            )
+        except ValueError:
+            page_number = 0
+        if page_number < 1:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=request.query_params.get(self.page_query_param),
+                message='',
+            ))
+        offset = (page_number - 1) * page_size
+        objects = yield 'list', queryset[offset:offset + page_size + 1]
+
+        url = request.build_absolute_uri()
+        self.next_link = replace_query_param(
+            url, self.page_query_param, page_number + 1
+        ) if len(objects) > page_size else None
+        self.previous_link = None
+        if page_number == 2:
+            self.previous_link = remove_query_param(
+                url, self.page_query_param
+            )
+        elif page_number > 2:
+            self.previous_link = replace_query_param(
+                url, self.page_query_param, page_number - 1
+            )
+        return objects[:page_size]
+
+    def _paginate_by_cursor(self, queryset, request, ordering):
+        """
+        Страница после (или перед) позицией из курсора.
+
+        Курсор — позиция объекта (значения полей ordering) и
+        направление: вперед от последнего объекта страницы или назад от
+        первого.
+        """
+        page_size = self.get_page_size(request)
+        fields = self._cursor_fields(ordering)
+        position, reverse = self.get_cursor(request, queryset.model, ordering)
+        queryset = queryset.order_by(
+            *self.cursor_order_by(ordering, reverse)
+        ).filter(self.cursor_filter(ordering, position, reverse))
+        objects = yield 'list', queryset[:page_size + 1]
+        has_more = len(objects) > page_size
+        objects = objects[:page_size]
+        if reverse:
+            objects.reverse()
+
+        has_next, has_previous = has_more, position is not None
+        if reverse:
+            has_next, has_previous = has_previous, has_next
+        self.next_link = self._cursor_link(
+            objects[-1], fields, reverse=False
+        ) if objects and has_next else None
+        self.previous_link = self._cursor_link(
+            objects[0], fields, reverse=True
+        ) if objects and has_previous else None
+        return objects
+
+    def get_cursor(self, request, model, ordering):
+        """Позиция из курсора запроса (None — с начала) и направление."""
+        return self._decode_cursor(
+            request.query_params.get(self.cursor_query_param, ''),
+            model, self._cursor_fields(ordering)
+        )
+
+    @classmethod
+    def cursor_order_by(cls, ordering, reverse=False):
+        """Порядок выборки страницы: ordering или обратный ему."""
+        return [
+            f'{"-" if descending != reverse else ""}{name}'
+            for name, descending in cls._cursor_fields(ordering)
+        ]
+
+    @classmethod
+    def cursor_filter(cls, ordering, position, reverse=False):
+        """Условие на объекты после позиции (пустое для первой страницы)."""
+        if position is None:
+            return Q()
+        return cls._after_position(
+            cls._cursor_fields(ordering), position, reverse
+        )
+
+    @staticmethod
+    def _cursor_fields(ordering):
+        return tuple(
+            (name.lstrip('-'), name.startswith('-')) for name in ordering
+        )
+
+    @staticmethod
+    def _after_position(fields, position, reverse):
+        """
+        Условие "объект идет после position" в порядке fields.
+
+        Для (-pub_date, -id) вперед: pub_date <= v AND
+        (pub_date < v OR (pub_date = v AND id < i)); первое условие
+        позволяет использовать индекс по ведущему полю.
+        """
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(fields, position):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        leading_name, leading_descending = fields[0]
+        leading_lookup = 'lte' if leading_descending != reverse else 'gte'
+        return Q(**{f'{leading_name}__{leading_lookup}': position[0]}) & (
+            condition
+        )
+
+    def _cursor_link(self, obj, fields, reverse):
+        position = [
+            obj._meta.get_field(name).value_to_string(obj)
+            for name, _ in fields
+        ]
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param, self.encode_cursor(position, reverse)
+        )
+
+    @staticmethod
+    def encode_cursor(position, reverse=False):
+        """Курсор из позиции (строковые значения полей ordering)."""
+        return base64.urlsafe_b64encode(json.dumps(
+            {'p': position, 'r': reverse}, separators=(',', ':')
+        ).encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor, model, fields):
+        """Возвращает (позиция или None для первой страницы, назад ли)."""
+        if not cursor:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            position = data['p']
+            if len(position) != len(fields):
+                raise ValueError
+            position = tuple(
+                model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(fields, position)
+            )
+            if None in position:
+                raise ValueError
+            return position, bool(data['r'])
+        except (
+            TypeError, ValueError, KeyError, DjangoValidationError,
+            UnicodeDecodeError
+        ):
+            raise NotFound(INVALID_CURSOR)
+
+
+class FgCursorPagination(FgPagination):
+    """
+    Пагинация только по курсору (без cursor — первая страница).
+
+    Порядок всегда cursor_ordering: другого режима с иным порядком нет,
+    поэтому, например, поиск q в ленте только фильтрует объекты.
+    """
+
+    cursor_overrides_ordering = True
+
+    def cursor_requested(self, request):
+        return True
@@ -0,0 +1,234 @@
+import csv
+import json
+from abc import ABCMeta, abstractmethod
+from tempfile import SpooledTemporaryFile
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+from rest_framework.renderers import BaseRenderer
+
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def read_chunk(parts):
+    """
+    Склеивает очередные части документа из генератора parts, пока их
+    размер не достигнет STREAM_CHUNK_SIZE; None — документ закончился.
+    """
+    chunk, size = [], 0
+    for part in parts:
+        chunk.append(part)
+        size += len(part)
+        if size >= STREAM_CHUNK_SIZE:
+            break
+    if not chunk:
+        return None
+    return ''.join(chunk) if isinstance(chunk[0], str) else b''.join(chunk)
+
+
+class ShoppingListRenderer(BaseRenderer, metaclass=ABCMeta):
+    """
+    Базовый рендерер списка покупок.
+
+    Формат выбирается параметром ?format=, сам список отдается потоком:
+    stream() — генератор частей документа по строкам ingredients
+    (словари name, measurement_unit, total_amount), astream() — тот же
+    документ асинхронным генератором для ASGI. TXT и CSV отдаются по мере
+    чтения строк, PDF — только целиком собранным (см. ниже).
+    Ошибки API рендерятся как JSON.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'application/json'
+        return json.dumps(data, ensure_ascii=False).encode()
+
+    @abstractmethod
+    def stream(self, ingredients, user):
+        """Генератор частей документа (str или bytes)."""
+
+    async def astream(self, ingredients, user):
+        """
+        Части stream() по STREAM_CHUNK_SIZE: генератор (с чтением из БД)
+        продвигается в потоке sync_to_async, цикл событий не блокируется
+        и документ не собирается в памяти целиком.
+        """
+        parts = self.stream(ingredients, user)
+        read = sync_to_async(read_chunk)
+        try:
+            while (chunk := await read(parts)) is not None:
+                yield chunk
+        finally:
+            await sync_to_async(parts.close)()
+
+
+class ShoppingListTxtRenderer(ShoppingListRenderer):
+    """Список покупок в текстовом формате с псевдографикой."""
+
+    media_type = 'text/plain'
+    format = 'txt'
+
+    CREATED = '📅 Создан:'
+    END_TITLE = 'ПРИЯТНЫХ ПОКУПОК!'
+    PRODUCT = '   Товар '
+    TITLE = '🛒 СПИСОК ПОКУПОК 🛒'
+    TOTAL = '🥬 Всего ингредиентов:'
+    USER = '👤 Пользователь:'
+
+    WIDTH = 50
+    SCALE_WIDTH = 62
+    BORDER = '═' * WIDTH
+    HEADING_PADDING = 40
+    LINE = '─' * WIDTH
+    MAX_NAME_LENGTH = 30
+    TOTAL_WIDTH = 45
+
+    def stream(self, ingredients, user):
+        """Создает дизайн списка покупок построчно."""
+        date = timezone.localtime().strftime('%d.%m.%Y %H:%M')
+        user = user.get_full_name() or user.username
+
+        yield (
+            f'╔{self.BORDER}╗\n'
+            f'{self.TITLE:^{self.SCALE_WIDTH}}\n'
+            f'╚{self.BORDER}╝\n\n'
+            f'{self.USER} {user}\n'
+            f'{self.CREATED} {date}\n'
+            f'{self.TOTAL} {ingredients.count()}\n\n'
+            # Шапка таблицы ингредиентов
+            f'{self.PRODUCT}{"Кол-во":>{self.HEADING_PADDING}}\n'
+            f' {self.LINE}\n'
+        )
+
+        for ingredient in ingredients.iterator():
+            name = ingredient['name']
+            amount = int(ingredient['total_amount'])
+
+            # Обрезаем длинные названия ингредиентов
+            display_name = (
+                f'{name[:self.MAX_NAME_LENGTH - 2]}...'
+                if len(name) > self.MAX_NAME_LENGTH else name
+            )
+            # Название с единицей измерения в скобках, выравнивание
+            name_with_unit = (
+                f'☐ {display_name} ({ingredient["measurement_unit"]})'
+            )
+            space = ' ' * (self.TOTAL_WIDTH - len(name_with_unit))
+            yield f'{name_with_unit}{space}{amount}\n'
+
+        yield (
+            f' {self.LINE}\n'
+            'Отмечайте ☑ купленные товары\n'
+            '\n'
+            '\n'
+            f'╔{self.BORDER}╗\n'
+            f'{self.END_TITLE:^{self.SCALE_WIDTH}}\n'
+            f'╚{self.BORDER}╝\n'
+            '\n'
+            f'{"Foodgram 2025":^{self.SCALE_WIDTH}}\n'
+            f'{"Ваш помощник в мире рецептов":^{self.SCALE_WIDTH}}\n'
+        )
+
+
+class _Echo:
+    """Псевдобуфер для csv.writer: возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListCsvRenderer(ShoppingListRenderer):
+    """Список покупок в формате CSV."""
+
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients, user):
+        writer = csv.writer(_Echo())
+        # BOM, чтобы Excel распознал UTF-8
+        yield '\ufeff' + writer.writerow(
+            ('Ингредиент', 'Единица измерения', 'Количество')
+        )
+        for ingredient in ingredients.iterator():
+            yield writer.writerow((
+                ingredient['name'],
+                ingredient['measurement_unit'],
+                int(ingredient['total_amount']),
+            ))
+
+
+class ShoppingListPdfRenderer(ShoppingListRenderer):
+    """
+    Список покупок в формате PDF.
+
+    ReportLab держит документ в памяти и пишет его (с таблицей смещений
+    объектов) только в canvas.save(), поэтому PDF не стримится: первая
+    часть уходит клиенту после сборки всего документа. Готовый файл
+    пишется в SpooledTemporaryFile и отдается частями STREAM_CHUNK_SIZE.
+    """
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+    FONT_NAME = 'ShoppingListFont'
+    FONT_SIZE = 11
+    LINE_HEIGHT = 7 * mm
+    MARGIN = 20 * mm
+
+    def _register_font(self):
+        if self.FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(self.FONT_NAME, settings.SHOPPING_LIST_PDF_FONT)
+            )
+        return self.FONT_NAME
+
+    def stream(self, ingredients, user):
+        font = self._register_font()
+        width, height = A4
+        buffer = SpooledTemporaryFile(max_size=STREAM_CHUNK_SIZE * 16)
+        canvas = Canvas(buffer, pagesize=A4)
+        canvas.setTitle('Список покупок')
+
+        def new_page():
+            canvas.setFont(font, self.FONT_SIZE)
+            return height - self.MARGIN
+
+        y = new_page()
+        canvas.setFont(font, self.FONT_SIZE * 1.5)
+        canvas.drawString(self.MARGIN, y, 'Список покупок')
+        y -= self.LINE_HEIGHT
+        canvas.setFont(font, self.FONT_SIZE)
+        canvas.drawString(self.MARGIN, y, '{} · {}'.format(
+            user.get_full_name() or user.username,
+            timezone.localtime().strftime('%d.%m.%Y %H:%M'),
+        ))
+        y -= self.LINE_HEIGHT * 2
+
+        for ingredient in ingredients.iterator():
+            if y < self.MARGIN:
+                canvas.showPage()
+                y = new_page()
+            canvas.drawString(self.MARGIN, y, '☐ {} ({})'.format(
+                ingredient['name'], ingredient['measurement_unit']
+            ))
+            canvas.drawRightString(
+                width - self.MARGIN, y, str(int(ingredient['total_amount']))
+            )
+            y -= self.LINE_HEIGHT
+
+        canvas.save()
+        buffer.seek(0)
+        while chunk := buffer.read(STREAM_CHUNK_SIZE):
+            yield chunk
+        buffer.close()
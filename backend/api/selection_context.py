@@ -0,0 +1,73 @@
+from threading import Lock
+
+
+class SelectionContext:
+    """
+    Подписки, избранное и список покупок пользователя на время запроса.
+
+    При первом обращении загружает id авторов, на которых подписан
+    пользователь, id рецептов в избранном и в списке покупок в множества
+    целых чисел и переиспользует их для всех сериализаторов ответа.
+
+    Счетчики hits/misses общие для процесса: hit — ответ из уже
+    загруженного множества, miss — обращение, потребовавшее запроса в БД.
+    """
+
+    _stats_lock = Lock()
+    hits = 0
+    misses = 0
+
+    def __init__(self, user):
+        self.user = user
+        self._ids = {}
+
+    @classmethod
+    def for_request(cls, request):
+        """Возвращает контекст, привязанный к HttpRequest запроса."""
+        http_request = getattr(request, '_request', request)
+        context = getattr(http_request, '_selection_context', None)
+        if context is None or context.user != request.user:
+            context = cls(request.user)
+            http_request._selection_context = context
+        return context
+
+    @classmethod
+    def stats(cls):
+        """Возвращает счетчики попаданий и промахов процесса."""
+        with cls._stats_lock:
+            return {'hits': cls.hits, 'misses': cls.misses}
+
+    @classmethod
+    def _count(cls, hit):
+        with cls._stats_lock:
+            if hit:
+                cls.hits += 1
+            else:
+                cls.misses += 1
+
+    def _get_ids(self, name, queryset, field):
+        ids = self._ids.get(name)
+        self._count(hit=ids is not None)
+        if ids is None:
+            ids = self._ids[name] = frozenset(
+                queryset.values_list(field, flat=True)
+            )
+        return ids
+
+    def is_subscribed(self, author_id):
+        """Подписан ли пользователь на автора author_id."""
+        return self.user.is_authenticated and author_id in self._get_ids(
+            'follows', self.user.follows, 'following_id'
+        )
+
+    def is_favorited(self, recipe_id):
+        """Находится ли рецепт recipe_id в избранном пользователя."""
+        return self.user.is_authenticated and recipe_id in self._get_ids(
+            'favorites', self.user.favorites, 'recipe_id'
+        )
+
+    def is_in_shopping_cart(self, recipe_id):
+        """Находится ли рецепт recipe_id в списке покупок пользователя."""
+        return self.user.is_authenticated and recipe_id in self._get_ids(
+            'shoppingcarts', self.user.shoppingcarts, 'recipe_id'
+        )
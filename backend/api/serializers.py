@@ -1,18 +1,38 @@
 import base64
+import binascii
+from functools import partial
 
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.shortcuts import get_object_or_404
 from djoser.serializers import UserSerializer
+from PIL import Image
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+from rest_framework.settings import api_settings
 
+from .selection_context import SelectionContext
 from core.constants import (
-    ALREADY_ADDED, AMOUNT_MIN_VALUE, CANT_ADD_FOLLOWING, CANT_BE_EMPTY,
-    FOLLOWING_VALIDATION, NON_EXISTENT_FAV,
-    NON_EXISTENT_SUB, PROHIBITED_VALUE, REPEATED
+    ALREADY_ADDED, AMOUNT_MIN_VALUE, BATCH_MAX_SIZE, CANT_ADD_FOLLOWING,
+    CANT_BE_EMPTY, FOLLOWING_VALIDATION, IMAGE_MAX_BYTES, IMAGE_MAX_PIXELS,
+    IMAGE_TOO_LARGE, IMAGE_TOO_MANY_PIXELS, PROHIBITED_VALUE, REPEATED
 )
+from core.counters import change_counters
+from core.jobs import enqueue_image_variants
+from core.links import delete_links, insert_link, insert_links
+from core.middleware import ProfiledSerializerMixin
 from recipes.models import (
     Favorite, Ingredient, IngredientRecipe, Recipe, ShoppingCart, Tag
 )
+from recipes.search import index_recipes
+from recipes.selections import selections_changed
+from recipes.shopping_cart import (
+    add_recipe_to_totals, subtract_recipe_from_totals
+)
+from users.follows import follows_changed
 from users.models import Follow
 
 
@@ -20,34 +40,184 @@ User = get_user_model()
 
 
 class Base64ImageField(serializers.ImageField):
-    """Декодирует картинку и сохраняет ее как файл."""
+    """
+    Декодирует картинку и сохраняет ее как файл.
+
+    Размер проверяется до декодирования base64 (по длине строки),
+    разрешение — по заголовку изображения, до декодирования пикселей.
+    """
 
     def to_internal_value(self, image):
         if isinstance(image, str) and image.startswith('data:image'):
             format, imgstr = image.split(';base64,')
             ext = format.split('/')[-1]
-            image = ContentFile(base64.b64decode(imgstr), name=f'temp.{ext}')
+            # 4 символа base64 кодируют 3 байта.
+            self._check_size(len(imgstr) * 3 // 4)
+            try:
+                image = ContentFile(
+                    base64.b64decode(imgstr), name=f'temp.{ext}'
+                )
+            except binascii.Error:
+                self.fail('invalid_image')
+        self._check_size(getattr(image, 'size', 0))
+        self._check_pixels(image)
         return super().to_internal_value(image)
 
+    def _check_size(self, size):
+        if size > IMAGE_MAX_BYTES:
+            raise serializers.ValidationError(IMAGE_TOO_LARGE.format(
+                max_size=IMAGE_MAX_BYTES // (1024 * 1024)
+            ))
+
+    def _check_pixels(self, image):
+        if not hasattr(image, 'read'):
+            return
+        try:
+            with Image.open(image) as picture:
+                width, height = picture.size
+        except Image.DecompressionBombError:
+            width, height = IMAGE_MAX_PIXELS + 1, 1
+        except Exception:
+            # Некорректный файл отклонит проверка ImageField.
+            return
+        finally:
+            image.seek(0)
+        if width * height > IMAGE_MAX_PIXELS:
+            raise serializers.ValidationError(IMAGE_TOO_MANY_PIXELS.format(
+                max_pixels=IMAGE_MAX_PIXELS // 1_000_000
+            ))
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Карта уменьшенных копий изображения с абсолютными ссылками.
+
+    {'thumbnail': {'width': 320, 'height': 240,
+                   'webp': 'http://.../x_thumbnail.webp',
+                   'jpeg': 'http://.../x_thumbnail.jpeg'}, ...}
+    """
+
+    def to_representation(self, variants):
+        representation = {}
+        for name, variant in (variants or {}).items():
+            representation[name] = {
+                key: value if key in {'width', 'height'} else self._url(value)
+                for key, value in variant.items()
+            }
+        return representation
+
+    def _url(self, path):
+        url = default_storage.url(path)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField, которое берет объекты из загруженных заранее.
+
+    Список значений (many=True) или список вложенных сериализаторов с
+    BulkListSerializer перед проверкой элементов загружает объекты всех
+    pk одним in_bulk(). Ошибки те же, что у PrimaryKeyRelatedField; без
+    предзагрузки поле выполняет запрос на каждый pk.
+    """
+
+    objects = None
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        return BulkManyRelatedField(
+            child_relation=cls(*args, **kwargs),
+            **{
+                key: value for key, value in kwargs.items()
+                if key in MANY_RELATION_KWARGS
+            },
+        )
+
+    def _to_pk(self, data):
+        if isinstance(data, bool):
+            raise TypeError
+        return self.get_queryset().model._meta.pk.to_python(data)
 
-class FgUserSerializer(UserSerializer):
+    def preload(self, values):
+        """Загружает объекты для всех корректных pk из values."""
+        pks = set()
+        for value in values:
+            try:
+                pks.add(self._to_pk(value))
+            except (TypeError, ValueError, DjangoValidationError):
+                pass
+        self.objects = self.get_queryset().in_bulk(pks)
+
+    def to_internal_value(self, data):
+        if self.objects is None:
+            return super().to_internal_value(data)
+        try:
+            pk = self._to_pk(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in self.objects:
+            self.fail('does_not_exist', pk_value=data)
+        return self.objects[pk]
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Список BulkPrimaryKeyRelatedField: объекты — одним запросом."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.child_relation.preload(data)
+        try:
+            return super().to_internal_value(data)
+        finally:
+            self.child_relation.objects = None
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    Список вложенных сериализаторов: объекты каждого их поля
+    BulkPrimaryKeyRelatedField загружаются одним запросом на весь список.
+    """
+
+    def to_internal_value(self, data):
+        fields = {
+            name: field for name, field in self.child.fields.items()
+            if isinstance(field, BulkPrimaryKeyRelatedField)
+        }
+        if isinstance(data, list):
+            for name, field in fields.items():
+                field.preload(
+                    item[name] for item in data
+                    if isinstance(item, dict) and name in item
+                )
+        try:
+            return super().to_internal_value(data)
+        finally:
+            for field in fields.values():
+                field.objects = None
+
+
+class FgUserSerializer(ProfiledSerializerMixin, UserSerializer):
     """Сериализатор пользователя."""
 
     is_subscribed = serializers.SerializerMethodField()
+    avatar_variants = ImageVariantsField()
 
     class Meta(UserSerializer.Meta):
         model = User
         fields = (
             'id', 'username', 'first_name', 'last_name', 'email',
-            'is_subscribed', 'avatar'
+            'is_subscribed', 'avatar', 'avatar_variants'
         )
 
     def get_is_subscribed(self, user):
         """Получает значение для флага is_subscribed (fg_user на user)."""
-        fg_user = self.context.get('request').user
-        return fg_user.is_authenticated and fg_user.follows.filter(
-            following=user
-        ).exists()
+        is_subscribed = getattr(user, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
+        return SelectionContext.for_request(
+            self.context.get('request')
+        ).is_subscribed(user.id)
 
 
 class FgUserWithRecipesSerializer(FgUserSerializer):
@@ -64,7 +234,7 @@ class FgUserWithRecipesSerializer(FgUserSerializer):
         ).data
 
 
-class AvatarSerializer(UserSerializer):
+class AvatarSerializer(ProfiledSerializerMixin, UserSerializer):
     """Сериализатор аватара."""
 
     avatar = Base64ImageField()
@@ -73,8 +243,13 @@ class AvatarSerializer(UserSerializer):
         model = User
         fields = ('avatar',)
 
+    def update(self, instance, validated_data):
+        instance = super().update(instance, validated_data)
+        enqueue_image_variants(instance, 'avatar', 'avatar_variants')
+        return instance
+
 
-class FollowSerializer(serializers.ModelSerializer):
+class FollowSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     """
     Сериализатор для создания записи в БД (модель Follow).
 
@@ -95,33 +270,34 @@ class FollowSerializer(serializers.ModelSerializer):
         fields = ('user', 'following')
 
     def validate(self, attrs):
-        """Проверяет нет ли дублирования подписки и не подписка на себя."""
+        """Запрещает подписку на себя."""
         request = self.context['request']
-        user = request.user
         following_id = request.resolver_match.kwargs.get('id')
-        action = request.method
-
-        if action == 'DELETE':
-            if not user.follows.filter(following__id=following_id).exists():
-                raise serializers.ValidationError(NON_EXISTENT_SUB)
-        else:
-            if user.follows.filter(following__id=following_id).exists():
-                raise serializers.ValidationError(CANT_ADD_FOLLOWING)
-            if following_id == user.id:
-                raise serializers.ValidationError(FOLLOWING_VALIDATION)
+        if following_id == request.user.id:
+            raise serializers.ValidationError(FOLLOWING_VALIDATION)
         return attrs
 
+    @transaction.atomic
     def create(self, validated_data):
+        """
+        Подписывает одним INSERT ... ON CONFLICT DO NOTHING; повторная
+        подписка, в том числе одновременная, — ошибка 400.
+        """
         request = self.context['request']
         user = request.user
         following_id = request.resolver_match.kwargs.get('id')
-        return Follow.objects.create(
-            user=user,
-            following_id=following_id
-        )
-
-
-class TagSerializer(serializers.ModelSerializer):
+        if not insert_link(
+            Follow, 'following', user=user.id, following=following_id
+        ):
+            get_object_or_404(User, id=following_id)
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [CANT_ADD_FOLLOWING]
+            })
+        follows_changed(user.id, added=(following_id,))
+        return Follow(user=user, following_id=following_id)
+
+
+class TagSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     """Сериализатор тегов."""
 
     class Meta:
@@ -129,7 +305,9 @@ class TagSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class IngredientListSerializer(serializers.ModelSerializer):
+class IngredientListSerializer(
+    ProfiledSerializerMixin, serializers.ModelSerializer
+):
     """Сериализатор ингредиентов для вывода списка ингредиентов."""
 
     class Meta:
@@ -140,11 +318,12 @@ class IngredientListSerializer(serializers.ModelSerializer):
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор ингредиентов для добавления ингредиентов в рецепт."""
 
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = BulkPrimaryKeyRelatedField(queryset=Ingredient.objects.all())
 
     class Meta:
         model = IngredientRecipe
         fields = ('id', 'amount')
+        list_serializer_class = BulkListSerializer
 
     def validate_amount(self, amount):
         if amount < AMOUNT_MIN_VALUE:
@@ -167,14 +346,17 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeBriefSerializer(serializers.ModelSerializer):
+class RecipeBriefSerializer(
+    ProfiledSerializerMixin, serializers.ModelSerializer
+):
     """Сериализатор рецептов краткий."""
 
     image = Base64ImageField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class RecipeSerializer(RecipeBriefSerializer):
@@ -184,7 +366,7 @@ class RecipeSerializer(RecipeBriefSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     ingredients = IngredientInRecipeSerializer(many=True, write_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(),
         many=True
     )
@@ -197,17 +379,21 @@ class RecipeSerializer(RecipeBriefSerializer):
 
     def get_is_favorited(self, obj):
         """Получает значение для флага is_favorited."""
-        fg_user = self.context.get('request').user
-        return fg_user.is_authenticated and fg_user.favorites.filter(
-            recipe=obj
-        ).exists()
+        is_favorited = getattr(obj, 'is_favorited', None)
+        if is_favorited is not None:
+            return is_favorited
+        return SelectionContext.for_request(
+            self.context.get('request')
+        ).is_favorited(obj.id)
 
     def get_is_in_shopping_cart(self, obj):
         """Получает значение для флага is_in_shopping_cart."""
-        fg_user = self.context.get('request').user
-        return fg_user.is_authenticated and fg_user.shoppingcarts.filter(
-            recipe=obj
-        ).exists()
+        is_in_shopping_cart = getattr(obj, 'is_in_shopping_cart', None)
+        if is_in_shopping_cart is not None:
+            return is_in_shopping_cart
+        return SelectionContext.for_request(
+            self.context.get('request')
+        ).is_in_shopping_cart(obj.id)
 
     def validate_ingredients(self, ingredients):
         """Проверяет количество и состав ингредиентов."""
@@ -238,6 +424,7 @@ class RecipeSerializer(RecipeBriefSerializer):
             ) for ingredient in ingredients_data
         ])
 
+    @transaction.atomic
     def create(self, validated_data):
         """Добавляет рецепт в базу данных."""
         ingredients_data = validated_data.pop('ingredients', None)
@@ -247,97 +434,292 @@ class RecipeSerializer(RecipeBriefSerializer):
         recipe.tags.set(tags_data)
 
         self._bulk_create_ingredients(recipe, ingredients_data)
+        change_counters(
+            User.objects.filter(id=recipe.author_id), 'recipes_count'
+        )
+        index_recipes([recipe.id])
+        enqueue_image_variants(recipe, 'image', 'image_variants')
 
         return recipe
 
+    def _sync_ingredients(self, recipe, ingredients_data):
+        """
+        Приводит ингредиенты рецепта к ingredients_data: не больше одного
+        bulk_create, одного bulk_update и одного delete. Возвращает
+        (изменился ли состав, изменились ли количества).
+        """
+        current = {
+            row.ingredient_id: row
+            for row in IngredientRecipe.objects.filter(recipe=recipe)
+        }
+        wanted = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients_data
+        }
+        removed = [
+            row.id for ingredient_id, row in current.items()
+            if ingredient_id not in wanted
+        ]
+        added = [
+            IngredientRecipe(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in wanted.items()
+            if ingredient_id not in current
+        ]
+        changed = []
+        for ingredient_id, row in current.items():
+            amount = wanted.get(ingredient_id, row.amount)
+            if row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if not (removed or added or changed):
+            return False, False
+
+        subtract_recipe_from_totals(recipe.id)
+        if removed:
+            IngredientRecipe.objects.filter(id__in=removed).delete()
+        if added:
+            IngredientRecipe.objects.bulk_create(added)
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ('amount',))
+        add_recipe_to_totals(recipe.id)
+        return bool(removed or added), bool(changed)
+
+    def _sync_tags(self, recipe, tags_data):
+        """Приводит теги рецепта к tags_data; возвращает, изменились ли."""
+        through = Recipe.tags.through
+        current = set(
+            through.objects.filter(recipe=recipe).values_list(
+                'tag_id', flat=True
+            )
+        )
+        wanted = {tag.id for tag in tags_data}
+        if current == wanted:
+            return False
+        if current - wanted:
+            through.objects.filter(
+                recipe=recipe, tag_id__in=current - wanted
+            ).delete()
+        if wanted - current:
+            through.objects.bulk_create(
+                through(recipe=recipe, tag_id=tag_id)
+                for tag_id in wanted - current
+            )
+        return True
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """Обновляет рецепт в базе данных."""
+        """
+        Обновляет рецепт: пишет только изменившиеся поля, теги и
+        ингредиенты (PATCH без изменений ничего не записывает).
+        """
         ingredients_data = validated_data.pop('ingredients', None)
         tags_data = validated_data.pop('tags', None)
 
         self.validate_ingredients(ingredients_data)
         self.validate_tags(tags_data)
 
-        if tags_data:
-            instance.tags.set(tags_data)
-
-        if ingredients_data:
-            instance.ingredient_recipe.all().delete()
-
-        self._bulk_create_ingredients(instance, ingredients_data)
+        tags_changed = self._sync_tags(instance, tags_data)
+        composition_changed, _ = self._sync_ingredients(
+            instance, ingredients_data
+        )
 
-        return super().update(instance, validated_data)
+        fields = [
+            name for name, value in validated_data.items()
+            if getattr(instance, name) != value
+        ]
+        if fields:
+            for name in fields:
+                setattr(instance, name, validated_data[name])
+            instance.save(update_fields=fields)
+        # В индексе название, текст, теги и названия ингредиентов.
+        if tags_changed or composition_changed or {'name', 'text'} & set(
+            fields
+        ):
+            index_recipes([instance.id])
+        if 'image' in fields:
+            enqueue_image_variants(instance, 'image', 'image_variants')
+        return instance
 
     def to_representation(self, instance):
         """Добавляет информацию о тегах и ингредиентах в рецепте."""
+        author_is_subscribed = getattr(instance, 'author_is_subscribed', None)
+        if author_is_subscribed is not None:
+            instance.author.is_subscribed = author_is_subscribed
         representation = super().to_representation(instance)
         representation['tags'] = TagSerializer(
             instance.tags.all(), many=True).data
+        ingredients = instance.ingredient_recipe.all()
+        if 'ingredient_recipe' not in getattr(
+            instance, '_prefetched_objects_cache', {}
+        ):
+            # После создания и изменения предвыборки нет.
+            ingredients = ingredients.select_related('ingredient')
         representation['ingredients'] = IngredientRecipeSerializer(
-            instance.ingredient_recipe.all(), many=True).data
+            ingredients, many=True).data
         return representation
 
 
-class SelectionSerializer(serializers.ModelSerializer):
+class SelectionSerializer(
+    ProfiledSerializerMixin, serializers.ModelSerializer
+):
     """Сериализатор добавления рецепта в избранное/ список покупок."""
 
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+        read_only_fields = fields
 
+    @transaction.atomic
     def create(self, validated_data):
-        request = self.context.get('request')
-        user = request.user
-        recipe_id = request.resolver_match.kwargs.get('id')
-        action = request.resolver_match.url_name
-        option = user.favorites if 'favorite' in action else user.shoppingcarts
+        """
+        Добавляет рецепт recipe_id в model (Favorite или ShoppingCart)
+        пользователя user одним INSERT ... ON CONFLICT DO NOTHING;
+        повторное добавление, в том числе одновременное, — ошибка 400.
+        """
+        model = validated_data['model']
+        user = validated_data['user']
+        recipe_id = validated_data['recipe_id']
+
+        if not insert_link(model, 'recipe', user=user.id, recipe=recipe_id):
+            get_object_or_404(Recipe, id=recipe_id)
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [ALREADY_ADDED.format(
+                    selection=model._meta.verbose_name.lower()
+                )]
+            })
+        selections_changed(model, user.id, added=(recipe_id,))
+        return Recipe.objects.only(*self.Meta.fields).get(id=recipe_id)
+
 
-        return option.create(user=user, recipe_id=recipe_id)
+class BatchSerializer(ProfiledSerializerMixin, serializers.Serializer):
+    """
+    Пакетное добавление и удаление связей пользователя с объектами.
+
+    add и remove — списки id (не больше BATCH_MAX_SIZE). Существование
+    объектов проверяется одним запросом, связи добавляются одним INSERT и
+    удаляются одним DELETE. Результат — статус каждого id: added,
+    already_added, removed, not_added или not_found.
+
+    Подклассы задают модель связей model, поле target_field со ссылкой
+    на объект и links_changed(user_id, added, removed) — учет
+    добавленных и удаленных связей в счетчиках.
+    """
+
+    model = None
+    target_field = None
+    links_changed = None
+
+    add = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=BATCH_MAX_SIZE,
+        default=list,
+    )
+    remove = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=BATCH_MAX_SIZE,
+        default=list,
+    )
 
     def validate(self, attrs):
-        """Проверка от дублирования рецепта в избранном/списке покупок."""
-        request = self.context.get('request')
-        user = request.user
-        recipe_id = request.resolver_match.kwargs.get('id')
-        action = request.resolver_match.url_name
-        model = Favorite if 'favorite' in action else ShoppingCart
-
-        if request.method == 'DELETE':
-            if not model.objects.filter(
-                user=user, recipe__id=recipe_id
-            ).exists():
-                raise serializers.ValidationError(NON_EXISTENT_FAV.format(
-                    selection=model._meta.verbose_name.lower()
-                ))
-        else:
-            if model.objects.filter(user=user, recipe__id=recipe_id).exists():
-                raise serializers.ValidationError(ALREADY_ADDED.format(
-                    selection=model._meta.verbose_name.lower()
-                ))
+        ids = attrs['add'] + attrs['remove']
+        if not ids:
+            raise serializers.ValidationError(CANT_BE_EMPTY)
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError(REPEATED)
+        target = self.model._meta.get_field(
+            self.target_field
+        ).related_model
+        attrs['existing'] = set(
+            target.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
         return attrs
 
+    @transaction.atomic
+    def create(self, validated_data):
+        user = self.context['request'].user
+        existing = validated_data['existing']
+        added = insert_links(self.model, self.target_field, (
+            target_id for target_id in validated_data['add']
+            if target_id in existing
+        ), user=user.id)
+        removed = delete_links(self.model, self.target_field, (
+            target_id for target_id in validated_data['remove']
+            if target_id in existing
+        ), user=user.id)
+        self.links_changed(user.id, added, removed)
+
+        def status(target_id, done, done_status, failed_status):
+            if target_id in done:
+                return done_status
+            return failed_status if target_id in existing else 'not_found'
+
+        return {
+            'add': [
+                {'id': target_id, 'status': status(
+                    target_id, added, 'added', 'already_added'
+                )} for target_id in validated_data['add']
+            ],
+            'remove': [
+                {'id': target_id, 'status': status(
+                    target_id, removed, 'removed', 'not_added'
+                )} for target_id in validated_data['remove']
+            ],
+        }
+
+    def to_representation(self, instance):
+        return instance
+
+
+class FavoriteBatchSerializer(BatchSerializer):
+    """Пакетное добавление и удаление рецептов избранного."""
+
+    model = Favorite
+    target_field = 'recipe'
+    links_changed = staticmethod(partial(selections_changed, Favorite))
+
+
+class ShoppingCartBatchSerializer(BatchSerializer):
+    """Пакетное добавление и удаление рецептов списка покупок."""
+
+    model = ShoppingCart
+    target_field = 'recipe'
+    links_changed = staticmethod(partial(selections_changed, ShoppingCart))
+
+
+class FollowBatchSerializer(BatchSerializer):
+    """Пакетная подписка на пользователей и отписка от них."""
+
+    model = Follow
+    target_field = 'following'
+    links_changed = staticmethod(follows_changed)
+
+    def validate_add(self, ids):
+        if self.context['request'].user.id in ids:
+            raise serializers.ValidationError(FOLLOWING_VALIDATION)
+        return ids
+
 
 class SubscribtionSerializer(FgUserSerializer):
     """Сериализатор подписок пользователей."""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(
-        source='recipes.count',
-        read_only=True
-    )
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(FgUserSerializer.Meta):
         fields = FgUserSerializer.Meta.fields + ('recipes_count', 'recipes')
 
     def get_recipes(self, following):
         """Ограничивает количество выводимых рецептов, если recipes_limit."""
-        recipes_limit = self.context.get('recipes_limit')
-        recipes = following.recipes.all()
-        if recipes_limit:
-            try:
-                recipes = recipes[:int(recipes_limit)]
-            except (TypeError, ValueError):
-                pass
+        recipes = getattr(following, 'limited_recipes', None)
+        if recipes is None:
+            recipes = following.recipes.all()
+            recipes_limit = self.context.get('recipes_limit')
+            if recipes_limit:
+                recipes = recipes[:recipes_limit]
         return RecipeBriefSerializer(
             recipes, many=True, context=self.context
         ).data
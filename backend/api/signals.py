@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from import_export.signals import post_import
+
+from core.catalog import bump_catalog_version
+from recipes.models import Ingredient, Tag
+
+
+CATALOG_MODELS = (Ingredient, Tag)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def catalog_changed(sender, **kwargs):
+    """Повышает версию справочника при изменении записи."""
+    bump_catalog_version(sender)
+
+
+@receiver(post_import)
+def catalog_imported(model, **kwargs):
+    """Повышает версию справочника после импорта в админке."""
+    if model in CATALOG_MODELS:
+        bump_catalog_version(model)
@@ -0,0 +1,1250 @@
+import re
+import threading
+import warnings
+from collections import Counter
+from unittest import skipIf
+from unittest.mock import patch
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import SynchronousOnlyOperation
+from django.db import connection, connections
+from django.test import (
+    AsyncClient, RequestFactory, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, re_path, resolve
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+
+from . import urls as api_urls
+from .async_views import with_async_reads
+from .ingredient_index import ingredient_index
+from .selection_context import SelectionContext
+from .serializers import RecipeSerializer
+from core.links import delete_links, insert_link, insert_links
+from core.catalog import bump_catalog_version
+from core.constants import BATCH_MAX_SIZE
+from recipes.models import (
+    Favorite, Ingredient, IngredientRecipe, Recipe, ShoppingCart, Tag
+)
+from recipes.search import FTS_TABLE, index_recipes
+from recipes.shopping_cart import find_totals_mismatches, rebuild_totals
+from users.models import Follow
+
+
+User = get_user_model()
+
+PAGE_SIZES = (1, 10, 50)
+
+# Маршруты API с асинхронными представлениями чтения, как при
+# ASYNC_READ_VIEWS=True (AsyncReadViewsTests).
+urlpatterns = [
+    re_path(
+        r'^api/', include((with_async_reads(api_urls.urlpatterns), 'api'))
+    ),
+]
+
+
+def create_user(username):
+    return User.objects.create(
+        username=username, email=f'{username}@foodgram.ru',
+        first_name=username, last_name=username,
+    )
+
+
+def create_recipe(author, name, tags, ingredients):
+    recipe = Recipe.objects.create(
+        author=author, name=name, image='recipe_image/test.png',
+        text='Описание', cooking_time=10,
+    )
+    recipe.tags.set(tags)
+    IngredientRecipe.objects.bulk_create(
+        IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=5)
+        for ingredient in ingredients
+    )
+    return recipe
+
+
+class QueryCountTests(APITestCase):
+    """
+    Число SQL-запросов списков и страницы пользователя не зависит от
+    размера страницы и числа связанных объектов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(4)
+        ]
+        cls.reader = create_user('reader')
+        cls.token = Token.objects.create(user=cls.reader)
+        cls.authors = [
+            create_user(f'author{number}') for number in range(max(PAGE_SIZES))
+        ]
+        for number, author in enumerate(cls.authors):
+            recipe = create_recipe(
+                author, f'Рецепт {number}', tags[:2], ingredients[:3]
+            )
+            create_recipe(
+                author, f'Второй рецепт {number}', tags[2:], ingredients[3:]
+            )
+            Follow.objects.create(user=cls.reader, following=author)
+            if number % 2:
+                Favorite.objects.create(user=cls.reader, recipe=recipe)
+            else:
+                ShoppingCart.objects.create(user=cls.reader, recipe=recipe)
+
+    def authenticate(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def assert_constant_queries(self, path, expected, **params):
+        """Проверяет страницы размеров PAGE_SIZES и возвращает их."""
+        pages = []
+        for limit in PAGE_SIZES:
+            with self.subTest(path=path, limit=limit, **params):
+                with self.assertNumQueries(expected):
+                    response = self.client.get(
+                        path, {'limit': limit, **params}
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['results']), limit)
+                pages.append(response.json()['results'])
+        return pages
+
+    def test_recipe_list_anonymous(self):
+        # COUNT(*), рецепты с авторами, теги, ингредиенты.
+        self.assert_constant_queries('/api/recipes/', 4)
+
+    def test_recipe_list_authenticated(self):
+        # Токен и запросы анонима: флаги пользователя — подзапросы EXISTS.
+        self.authenticate()
+        self.assert_constant_queries('/api/recipes/', 5)
+
+    def test_subscriptions(self):
+        # Токен, COUNT(*), авторы, по recipes_limit рецептов каждого.
+        self.authenticate()
+        for recipes_limit, recipes in ((None, 2), (1, 1)):
+            params = {'recipes_limit': recipes_limit} if recipes_limit else {}
+            for page in self.assert_constant_queries(
+                '/api/users/subscriptions/', 4, **params
+            ):
+                for author in page:
+                    self.assertEqual(len(author['recipes']), recipes)
+
+    def test_user_list_anonymous(self):
+        self.assert_constant_queries('/api/users/', 2)
+
+    def test_user_list_authenticated(self):
+        # Токен, COUNT(*), пользователи, id авторов в подписках.
+        self.authenticate()
+        self.assert_constant_queries('/api/users/', 4)
+
+    def test_user_detail(self):
+        # У авторов 1, 10 и 50 подписчиков и по 2 рецепта.
+        self.authenticate()
+        followers = [
+            create_user(f'follower{number}')
+            for number in range(max(PAGE_SIZES))
+        ]
+        for number in PAGE_SIZES:
+            Follow.objects.bulk_create(
+                Follow(user=follower, following=self.authors[number - 1])
+                for follower in followers[:number]
+            )
+        for number in PAGE_SIZES:
+            author = self.authors[number - 1]
+            with self.subTest(followers=number):
+                with self.assertNumQueries(3):
+                    response = self.client.get(f'/api/users/{author.id}/')
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.json()['is_subscribed'])
+
+
+class UserSerializersTests(APITestCase):
+    """
+    Регистрация и смена пароля — сериализаторы djoser, остальные
+    действия с пользователями — FgUserSerializer.
+    """
+
+    def test_create_and_set_password(self):
+        response = self.client.post('/api/users/', {
+            'email': 'new@foodgram.ru', 'username': 'new',
+            'first_name': 'Новый', 'last_name': 'Пользователь',
+            'password': 'Sup3r-secret',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(set(response.json()), {
+            'email', 'username', 'first_name', 'last_name', 'id'
+        })
+        user = User.objects.get(email='new@foodgram.ru')
+        self.client.force_authenticate(user)
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'Sup3r-secret',
+            'new_password': 'An0ther-secret',
+        })
+        self.assertEqual(response.status_code, 204)
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('An0ther-secret'))
+        for path in ('/api/users/me/', f'/api/users/{user.id}/'):
+            self.assertIn('is_subscribed', self.client.get(path).json())
+        self.assertIn(
+            'is_subscribed', self.client.get('/api/users/').json()[
+                'results'
+            ][0]
+        )
+
+
+class SelectionContextTests(APITestCase):
+    """
+    Контекст запроса загружает каждое множество пользователя одним
+    запросом и отвечает из него для всех объектов ответа.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        tag = Tag.objects.create(name='Обед', slug='lunch')
+        cls.reader = create_user('reader')
+        cls.authors = [create_user(f'author{number}') for number in range(3)]
+        cls.recipes = [
+            create_recipe(author, f'Рецепт {number}', [tag], [])
+            for number, author in enumerate(cls.authors)
+        ]
+        Follow.objects.create(user=cls.reader, following=cls.authors[0])
+        Favorite.objects.create(user=cls.reader, recipe=cls.recipes[1])
+        ShoppingCart.objects.create(user=cls.reader, recipe=cls.recipes[2])
+
+    def setUp(self):
+        self.request = RequestFactory().get('/api/recipes/')
+        self.request.user = self.reader
+
+    def flags(self, context):
+        return [
+            (
+                context.is_subscribed(recipe.author_id),
+                context.is_favorited(recipe.id),
+                context.is_in_shopping_cart(recipe.id),
+            )
+            for recipe in self.recipes
+        ]
+
+    def test_flags_loaded_once(self):
+        context = SelectionContext.for_request(self.request)
+        before = SelectionContext.stats()
+        expected = [
+            (True, False, False), (False, True, False), (False, False, True)
+        ]
+        with self.assertNumQueries(3):
+            self.assertEqual(self.flags(context), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.flags(
+                SelectionContext.for_request(self.request)
+            ), expected)
+        after = SelectionContext.stats()
+        self.assertEqual(after['misses'] - before['misses'], 3)
+        self.assertEqual(after['hits'] - before['hits'], 15)
+
+    def test_user_change_resets_context(self):
+        context = SelectionContext.for_request(self.request)
+        self.flags(context)
+        self.request.user = AnonymousUser()
+        anonymous = SelectionContext.for_request(self.request)
+        self.assertIsNot(anonymous, context)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.flags(anonymous), [(False,) * 3] * 3)
+
+    def test_api_flags(self):
+        self.client.force_authenticate(self.reader)
+        response = self.client.get(
+            f'/api/users/{self.authors[0].id}/'
+        )
+        self.assertTrue(response.json()['is_subscribed'])
+        for recipe, favorited, in_cart in (
+            (self.recipes[1], True, False), (self.recipes[2], False, True)
+        ):
+            response = self.client.get(f'/api/recipes/{recipe.id}/')
+            self.assertEqual(
+                (
+                    response.json()['is_favorited'],
+                    response.json()['is_in_shopping_cart'],
+                ),
+                (favorited, in_cart)
+            )
+
+
+class CatalogCacheTests(APITestCase):
+    """
+    Ответы справочников кэшируются по версии: повышение версии меняет
+    ETag и сбрасывает закэшированный ответ.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, path, etag=None):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get(path, headers=headers)
+
+    def test_conditional_and_cached(self):
+        response = self.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get('/api/tags/', etag).status_code, 304)
+            cached = self.get('/api/tags/')
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['ETag'], etag)
+
+    def test_bump_invalidates(self):
+        response = self.get('/api/tags/')
+        etag = response['ETag']
+        # Изменение без сигналов, как при загрузке CSV: ответ из кэша
+        # остается прежним до повышения версии.
+        Tag.objects.filter(id=self.tag.id).update(name='Ужин')
+        self.assertEqual(self.get('/api/tags/', etag).status_code, 304)
+        bump_catalog_version(Tag)
+        response = self.get('/api/tags/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()[0]['name'], 'Ужин')
+
+    def test_save_invalidates(self):
+        etag = self.get('/api/tags/')['ETag']
+        Tag.objects.create(name='Обед', slug='lunch')
+        response = self.get('/api/tags/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {tag['slug'] for tag in response.json()}, {'breakfast', 'lunch'}
+        )
+
+
+class IngredientIndexTests(APITestCase):
+    """
+    Индекс ингредиентов в памяти ищет по префиксу без учета регистра и
+    перестраивается после изменения справочника.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('Картофель', 'картошка', 'Капуста', 'Свёкла'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self, prefix):
+        response = self.client.get('/api/ingredients/', {'name': prefix})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_casefold_prefix(self):
+        self.assertEqual(self.names('КАР'), ['Картофель', 'картошка'])
+        self.assertEqual(self.names(' ка '), [
+            'Капуста', 'Картофель', 'картошка'
+        ])
+        self.assertEqual(self.names('свёк'), ['Свёкла'])
+        self.assertEqual(self.names('мор'), [])
+
+    def test_rebuild_after_change(self):
+        self.assertEqual(self.names('мор'), [])
+        carrot = Ingredient.objects.create(
+            name='Морковь', measurement_unit='г'
+        )
+        self.assertEqual(self.names('мор'), ['Морковь'])
+        carrot.name = 'Лук'
+        carrot.save()
+        self.assertEqual(self.names('мор'), [])
+        self.assertEqual(self.names('лу'), ['Лук'])
+        carrot.delete()
+        self.assertEqual(self.names('лу'), [])
+
+    def test_fuzzy(self):
+        self.assertEqual(
+            [
+                ingredient['name']
+                for ingredient in ingredient_index.fuzzy_search('кортофель')
+            ],
+            ['Картофель']
+        )
+
+
+class FuzzyIngredientSearchTests(APITestCase):
+    """
+    Нечеткий поиск ингредиентов: сначала начинающиеся с запроса, затем
+    содержащие его, затем похожие с опечатками; не больше limit.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in (
+            'Картофель', 'Картофель молодой', 'Сладкий картофель',
+            'Капуста', 'Морковь', 'Соль',
+        ):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self, text):
+        response = self.client.get(
+            '/api/ingredients/', {'name': text, 'fuzzy': 'true'}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_prefix_then_contains(self):
+        self.assertEqual(self.names('КАРТОФЕЛЬ'), [
+            'Картофель', 'Картофель молодой', 'Сладкий картофель'
+        ])
+
+    def test_typos(self):
+        self.assertEqual(self.names('марковь'), ['Морковь'])
+        self.assertEqual(
+            set(self.names('кортофель')),
+            {'Картофель', 'Картофель молодой', 'Сладкий картофель'}
+        )
+        self.assertEqual(self.names('щщщ'), [])
+
+    def test_limit(self):
+        self.assertEqual(
+            len(ingredient_index.fuzzy_search('картофель', limit=2)), 2
+        )
+        self.assertEqual(
+            [
+                ingredient['name'] for ingredient in
+                ingredient_index.fuzzy_search('кортофель', limit=1)
+            ],
+            ['Картофель']
+        )
+
+
+class SearchPaginationTests(APITestCase):
+    """Поиск q упорядочен по релевантности и листается по номеру страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        tag = Tag.objects.create(name='Обед', slug='lunch')
+        ingredient = Ingredient.objects.create(
+            name='Картофель', measurement_unit='г'
+        )
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        Follow.objects.create(user=cls.reader, following=cls.author)
+        cls.recipes = [
+            create_recipe(cls.author, name, [tag], [ingredient])
+            for name in ('Борщ', 'Суп', 'Рагу', 'Солянка')
+        ]
+        # Самый старый из найденных рецептов — самый релевантный:
+        # «суп» в названии весит больше, чем в описании.
+        for recipe in cls.recipes[1:]:
+            recipe.text = 'Густой суп'
+            recipe.save(update_fields=('text',))
+        index_recipes()
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_page_modes_agree(self):
+        params = {'q': 'суп', 'limit': 2}
+        with_count = self.ids(self.client.get('/api/recipes/', params))
+        self.assertEqual(with_count, self.ids(self.client.get(
+            '/api/recipes/', {**params, 'count': 'false'}
+        )))
+        self.assertEqual(
+            with_count, [self.recipes[1].id, self.recipes[3].id]
+        )
+
+    def test_cursor_rejected(self):
+        response = self.client.get(
+            '/api/recipes/', {'q': 'суп', 'cursor': ''}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.json())
+
+    def test_feed_filters_by_date(self):
+        self.client.force_authenticate(self.reader)
+        self.assertEqual(
+            self.ids(self.client.get('/api/recipes/feed/', {'q': 'суп'})),
+            [recipe.id for recipe in reversed(self.recipes[1:])]
+        )
+
+
+class FeedMergeTests(APITestCase):
+    """Лента слиянием по пачкам авторов совпадает с обычной лентой."""
+
+    @classmethod
+    def setUpTestData(cls):
+        tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(2)
+        ]
+        ingredient = Ingredient.objects.create(
+            name='Картофель', measurement_unit='г'
+        )
+        cls.reader = create_user('reader')
+        for number in range(5):
+            author = create_user(f'author{number}')
+            if number < 4:
+                Follow.objects.create(user=cls.reader, following=author)
+            for recipe_number in range(3):
+                create_recipe(
+                    author, f'Рецепт {number}.{recipe_number}',
+                    tags[recipe_number % 2:], [ingredient]
+                )
+        cls.reader.following_count = 4
+        cls.reader.save(update_fields=('following_count',))
+
+    def pages(self, params):
+        """id рецептов всех страниц ленты по ссылкам next."""
+        pages = []
+        response = self.client.get('/api/recipes/feed/', params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([recipe['id'] for recipe in response.json()[
+                'results'
+            ]])
+            if not response.json()['next']:
+                return pages
+            response = self.client.get(response.json()['next'])
+
+    def test_merge_matches_join(self):
+        self.client.force_authenticate(self.reader)
+        for params in ({'limit': 5}, {'limit': 2, 'tags': 'tag1'}):
+            with self.subTest(**params):
+                recipes = Recipe.objects.feed(self.reader)
+                if 'tags' in params:
+                    recipes = recipes.filter(tags__slug=params['tags'])
+                expected = self.pages(params)
+                self.assertEqual(sum(map(len, expected)), recipes.count())
+                with patch('api.views.FEED_MERGE_THRESHOLD', 1), patch(
+                    'api.views.FEED_AUTHORS_CHUNK', 3
+                ):
+                    self.assertEqual(self.pages(params), expected)
+
+
+class BulkRelatedFieldsTests(APITestCase):
+    """
+    Теги и ингредиенты рецепта загружаются одним in_bulk() на поле,
+    ошибки — те же, что у PrimaryKeyRelatedField.
+    """
+
+    IMAGE = (
+        'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAf'
+        'FcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(5)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(10)
+        ]
+        cls.author = create_user('author')
+        cls.recipe = create_recipe(
+            cls.author, 'Рецепт', cls.tags[:1], cls.ingredients[:1]
+        )
+
+    def payload(self, tags, ingredients):
+        return {
+            'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 10,
+            'image': self.IMAGE, 'tags': tags,
+            'ingredients': [
+                {'id': ingredient, 'amount': 5} for ingredient in ingredients
+            ],
+        }
+
+    def serializer(self, data, instance=None):
+        request = APIRequestFactory().post('/api/recipes/')
+        request.user = self.author
+        return RecipeSerializer(
+            instance, data=data, context={'request': request}
+        )
+
+    def test_one_query_per_field(self):
+        data = self.payload(
+            [tag.id for tag in self.tags],
+            [ingredient.id for ingredient in self.ingredients],
+        )
+        for instance in (None, self.recipe):
+            with self.subTest(update=instance is not None):
+                serializer = self.serializer(data, instance)
+                with self.assertNumQueries(2):
+                    self.assertTrue(serializer.is_valid(), serializer.errors)
+                self.assertEqual(
+                    serializer.validated_data['tags'], self.tags
+                )
+                self.assertEqual(
+                    [
+                        item['id']
+                        for item in serializer.validated_data['ingredients']
+                    ],
+                    self.ingredients
+                )
+
+    def test_errors_match_primary_key_field(self):
+        class PlainSerializer(serializers.Serializer):
+            tags = serializers.PrimaryKeyRelatedField(
+                queryset=Tag.objects.all(), many=True
+            )
+            id = serializers.PrimaryKeyRelatedField(
+                queryset=Ingredient.objects.all()
+            )
+
+        tag, ingredient = self.tags[0].id, self.ingredients[0].id
+        for bad in (999, 'abc', True):
+            with self.subTest(bad=bad):
+                serializer = self.serializer(
+                    self.payload([tag, bad], [ingredient, bad])
+                )
+                self.assertFalse(serializer.is_valid())
+                expected_tags = PlainSerializer(
+                    data={'tags': [tag, bad], 'id': ingredient}
+                )
+                expected_tags.is_valid()
+                expected_id = PlainSerializer(
+                    data={'tags': [tag], 'id': bad}
+                )
+                expected_id.is_valid()
+                self.assertEqual(
+                    serializer.errors['tags'], expected_tags.errors['tags']
+                )
+                self.assertEqual(
+                    serializer.errors['ingredients'],
+                    [{}, {'id': expected_id.errors['id']}]
+                )
+        self.assertEqual(
+            [error.code for error in serializer.errors['tags']],
+            ['incorrect_type']
+        )
+        missing = serializers.PrimaryKeyRelatedField.default_error_messages[
+            'does_not_exist'
+        ].format(pk_value=999)
+        self.client.force_authenticate(self.author)
+        response = self.client.post(
+            '/api/recipes/', self.payload([tag, 999], [ingredient, 999]),
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {
+            'tags': [missing], 'ingredients': [{}, {'id': [missing]}],
+        })
+
+
+class RecipeUpdateWritesTests(APITestCase):
+    """PATCH рецепта пишет в базу только изменения."""
+
+    WRITE = re.compile(r'^(INSERT INTO|UPDATE|DELETE FROM) "?(\w+)"?')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(4)
+        ]
+        cls.author = create_user('author')
+        cls.recipe = create_recipe(
+            cls.author, 'Рецепт', cls.tags[:1], cls.ingredients[:2]
+        )
+        reader = create_user('reader')
+        ShoppingCart.objects.create(user=reader, recipe=cls.recipe)
+        rebuild_totals()
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+
+    def payload(self, tags, amounts):
+        return {
+            'name': self.recipe.name,
+            'text': self.recipe.text,
+            'cooking_time': self.recipe.cooking_time,
+            'tags': [tag.id for tag in tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in amounts.items()
+            ],
+        }
+
+    def patch_writes(self, payload):
+        """
+        Записи PATCH (операция, таблица) без обновления поискового
+        индекса и была ли запись в индекс.
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.id}/', payload, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.statements = [
+            query['sql'].split()[0] for query in context.captured_queries
+        ]
+        writes, indexed = Counter(), False
+        for query in context.captured_queries:
+            match = self.WRITE.match(query['sql'])
+            if not match:
+                continue
+            operation, table = match[1].split()[0], match[2]
+            if table == FTS_TABLE or 'search_vector' in query['sql']:
+                indexed = True
+            else:
+                writes[operation, table] += 1
+        self.assertEqual(find_totals_mismatches(), [])
+        return writes, indexed
+
+    def test_noop(self):
+        writes, indexed = self.patch_writes(self.payload(
+            self.tags[:1], dict.fromkeys(self.ingredients[:2], 5)
+        ))
+        self.assertEqual(writes, Counter())
+        self.assertFalse(indexed)
+        # Кроме чтения — только границы транзакции (в тестах — точки
+        # сохранения внутри транзакции теста).
+        self.assertLessEqual(set(self.statements), {
+            'SELECT', 'BEGIN', 'COMMIT', 'SAVEPOINT', 'RELEASE'
+        })
+
+    def test_one_amount(self):
+        writes, indexed = self.patch_writes(self.payload(
+            self.tags[:1], {self.ingredients[0]: 5, self.ingredients[1]: 7}
+        ))
+        self.assertEqual(writes, Counter({
+            ('UPDATE', 'recipes_ingredientrecipe'): 1,
+            ('UPDATE', 'recipes_shoppingcartingredient'): 1,
+            ('DELETE', 'recipes_shoppingcartingredient'): 1,
+            ('INSERT', 'recipes_shoppingcartingredient'): 1,
+        }))
+        self.assertFalse(indexed)
+
+    def test_full_replacement(self):
+        writes, indexed = self.patch_writes(self.payload(
+            self.tags[1:], dict.fromkeys(self.ingredients[2:], 3)
+        ))
+        self.assertEqual(writes, Counter({
+            ('DELETE', 'recipes_recipe_tags'): 1,
+            ('INSERT', 'recipes_recipe_tags'): 1,
+            ('DELETE', 'recipes_ingredientrecipe'): 1,
+            ('INSERT', 'recipes_ingredientrecipe'): 1,
+            ('UPDATE', 'recipes_shoppingcartingredient'): 1,
+            ('DELETE', 'recipes_shoppingcartingredient'): 1,
+            ('INSERT', 'recipes_shoppingcartingredient'): 1,
+        }))
+        self.assertTrue(indexed)
+
+
+class SequentialTogglesTests(APITestCase):
+    """
+    Повторное добавление и удаление связи — ошибка 400, несуществующий
+    объект — 404, счетчики сходятся (во всех БД, в том числе SQLite).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        tag = Tag.objects.create(name='Обед', slug='lunch')
+        ingredient = Ingredient.objects.create(
+            name='Картофель', measurement_unit='г'
+        )
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.recipes = [
+            create_recipe(cls.author, f'Рецепт {number}', [tag], [ingredient])
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        self.client.force_authenticate(self.reader)
+
+    def assert_toggles(self, path, missing_path, counted):
+        for method, status, count in (
+            ('post', 201, 1), ('post', 400, 1),
+            ('delete', 204, 0), ('delete', 400, 0),
+        ):
+            with self.subTest(path=path, method=method, status=status):
+                response = getattr(self.client, method)(path)
+                self.assertEqual(response.status_code, status)
+                if status == 400:
+                    self.assertIn('non_field_errors', response.json())
+                self.assertEqual(counted(), count)
+        for method in ('post', 'delete'):
+            self.assertEqual(
+                getattr(self.client, method)(missing_path).status_code, 404
+            )
+
+    def test_selections(self):
+        recipe = self.recipes[0]
+        for model, name in (
+            (Favorite, 'favorite'), (ShoppingCart, 'shopping_cart')
+        ):
+            def counted():
+                self.assertEqual(find_totals_mismatches(), [])
+                return getattr(
+                    Recipe.objects.get(id=recipe.id), model.recipe_counter
+                )
+
+            self.assert_toggles(
+                f'/api/recipes/{recipe.id}/{name}/',
+                f'/api/recipes/999/{name}/', counted
+            )
+            self.assertFalse(model.objects.exists())
+
+    def test_follow(self):
+        def counted():
+            reader = User.objects.get(id=self.reader.id)
+            author = User.objects.get(id=self.author.id)
+            self.assertEqual(reader.following_count, author.followers_count)
+            return author.followers_count
+
+        self.assert_toggles(
+            f'/api/users/{self.author.id}/subscribe/',
+            '/api/users/999/subscribe/', counted
+        )
+
+    def test_links(self):
+        first, second, third = (recipe.id for recipe in self.recipes)
+        self.assertTrue(
+            insert_link(Favorite, 'recipe', user=self.reader.id, recipe=first)
+        )
+        self.assertFalse(
+            insert_link(Favorite, 'recipe', user=self.reader.id, recipe=first)
+        )
+        self.assertEqual(insert_links(
+            Favorite, 'recipe', (first, second, 999), user=self.reader.id
+        ), {second})
+        self.assertEqual(
+            set(Favorite.objects.values_list('recipe', flat=True)),
+            {first, second}
+        )
+        self.assertEqual(delete_links(
+            Favorite, 'recipe', (second, third, 999), user=self.reader.id
+        ), {second})
+        self.assertEqual(delete_links(
+            Favorite, 'recipe', (first,), user=self.author.id
+        ), set())
+        self.assertEqual(
+            list(Favorite.objects.values_list('recipe', flat=True)), [first]
+        )
+
+
+class BatchEndpointsTests(APITestCase):
+    """
+    Пакетные изменения избранного, списка покупок и подписок: статус
+    каждого id и счетчики после пакета.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        tag = Tag.objects.create(name='Обед', slug='lunch')
+        ingredient = Ingredient.objects.create(
+            name='Картофель', measurement_unit='г'
+        )
+        cls.reader = create_user('reader')
+        cls.authors = [create_user(f'author{number}') for number in range(3)]
+        cls.recipes = [
+            create_recipe(author, f'Рецепт {number}', [tag], [ingredient])
+            for number, author in enumerate(cls.authors)
+        ]
+
+    def setUp(self):
+        self.client.force_authenticate(self.reader)
+
+    def batch(self, path, add=(), remove=(), status=200):
+        response = self.client.post(
+            path, {'add': list(add), 'remove': list(remove)}, format='json'
+        )
+        self.assertEqual(response.status_code, status, response.json())
+        return response.json()
+
+    @staticmethod
+    def statuses(result):
+        return {
+            key: [(item['id'], item['status']) for item in items]
+            for key, items in result.items()
+        }
+
+    def assert_mixed(self, path, ids, counted):
+        """Добавление и удаление по path; counted(id) — счетчик объекта."""
+        first, second, third = ids
+        self.batch(path, add=[first])
+        self.assertEqual(self.statuses(self.batch(
+            path, add=[first, second, 999], remove=[third]
+        )), {
+            'add': [
+                (first, 'already_added'), (second, 'added'),
+                (999, 'not_found'),
+            ],
+            'remove': [(third, 'not_added')],
+        })
+        self.assertEqual([counted(id) for id in ids], [1, 1, 0])
+        self.assertEqual(self.statuses(self.batch(
+            path, add=[third], remove=[first, 999]
+        )), {
+            'add': [(third, 'added')],
+            'remove': [(first, 'removed'), (999, 'not_found')],
+        })
+        self.assertEqual([counted(id) for id in ids], [0, 1, 1])
+
+    def test_selections(self):
+        ids = [recipe.id for recipe in self.recipes]
+        for model, name in (
+            (Favorite, 'favorite'), (ShoppingCart, 'shopping_cart')
+        ):
+            def counted(recipe_id):
+                self.assertEqual(find_totals_mismatches(), [])
+                return getattr(
+                    Recipe.objects.get(id=recipe_id), model.recipe_counter
+                )
+
+            with self.subTest(name=name):
+                self.assert_mixed(f'/api/recipes/{name}/batch/', ids, counted)
+                self.assertEqual(
+                    set(model.objects.values_list('recipe', flat=True)),
+                    set(ids[1:])
+                )
+
+    def test_subscriptions(self):
+        def counted(author_id):
+            reader = User.objects.get(id=self.reader.id)
+            self.assertEqual(
+                reader.following_count, reader.follows.count()
+            )
+            return User.objects.get(id=author_id).followers_count
+
+        self.assert_mixed(
+            '/api/users/subscriptions/batch/',
+            [author.id for author in self.authors], counted
+        )
+
+    def test_invalid(self):
+        path = '/api/users/subscriptions/batch/'
+        self.assertIn(
+            'add', self.batch(path, add=[self.reader.id], status=400)
+        )
+        first = self.authors[0].id
+        for add, remove in (([], []), ([first], [first]), ([first] * 2, [])):
+            with self.subTest(add=add, remove=remove):
+                self.assertIn('non_field_errors', self.batch(
+                    path, add=add, remove=remove, status=400
+                ))
+        self.assertIn('add', self.batch(
+            path, add=range(1, BATCH_MAX_SIZE + 2), status=400
+        ))
+        self.assertFalse(Follow.objects.exists())
+
+
+@skipIf(
+    connection.vendor == 'sqlite', 'SQLite выполняет записи по очереди.'
+)
+class ConcurrentTogglesTests(TransactionTestCase):
+    """
+    Одновременные добавления и удаления одной связи: ровно одно
+    успешное, остальные — ошибка 400, счетчики сходятся.
+    """
+
+    THREADS = 8
+
+    def setUp(self):
+        tag = Tag.objects.create(name='Обед', slug='lunch')
+        ingredient = Ingredient.objects.create(
+            name='Картофель', measurement_unit='г'
+        )
+        self.author = create_user('author')
+        self.reader = create_user('reader')
+        self.recipe = create_recipe(
+            self.author, 'Рецепт', [tag], [ingredient]
+        )
+
+    def run_parallel(self, method, path):
+        """Выполняет запрос reader из THREADS потоков одновременно."""
+        barrier = threading.Barrier(self.THREADS)
+        statuses = []
+
+        def request():
+            client = APIClient()
+            client.force_authenticate(self.reader)
+            barrier.wait()
+            try:
+                statuses.append(getattr(client, method)(path).status_code)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=request) for _ in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return Counter(statuses)
+
+    def assert_toggles(self, path, success, counted):
+        """Добавление и удаление по path; counted() — значение счетчиков."""
+        self.assertEqual(
+            self.run_parallel('post', path),
+            Counter({success: 1, 400: self.THREADS - 1})
+        )
+        self.assertEqual(counted(), 1)
+        self.assertEqual(
+            self.run_parallel('delete', path),
+            Counter({204: 1, 400: self.THREADS - 1})
+        )
+        self.assertEqual(counted(), 0)
+
+    def test_favorite(self):
+        self.assert_toggles(
+            f'/api/recipes/{self.recipe.id}/favorite/', 201,
+            lambda: Recipe.objects.get(id=self.recipe.id).favorites_count
+        )
+
+    def test_shopping_cart(self):
+        def counted():
+            self.assertEqual(find_totals_mismatches(), [])
+            return Recipe.objects.get(
+                id=self.recipe.id
+            ).shopping_carts_count
+
+        self.assert_toggles(
+            f'/api/recipes/{self.recipe.id}/shopping_cart/', 201, counted
+        )
+
+    def test_follow(self):
+        def counted():
+            reader = User.objects.get(id=self.reader.id)
+            author = User.objects.get(id=self.author.id)
+            self.assertEqual(
+                reader.following_count, author.followers_count
+            )
+            return author.followers_count
+
+        self.assert_toggles(
+            f'/api/users/{self.author.id}/subscribe/', 201, counted
+        )
+
+
+class DownloadShoppingCartTests(APITestCase):
+    """Список покупок отдается потоком без буферизации под WSGI и ASGI."""
+
+    FORMATS = (('txt', 'Картофель'), ('csv', 'Картофель'), ('pdf', '%PDF'))
+
+    @classmethod
+    def setUpTestData(cls):
+        tag = Tag.objects.create(name='Обед', slug='lunch')
+        ingredients = [
+            Ingredient.objects.create(name='Картофель', measurement_unit='г'),
+            *(
+                Ingredient.objects.create(
+                    name=f'Ингредиент {number}', measurement_unit='г'
+                )
+                for number in range(300)
+            ),
+        ]
+        cls.reader = create_user('reader')
+        cls.token = Token.objects.create(user=cls.reader)
+        recipe = create_recipe(cls.reader, 'Рецепт', [tag], ingredients)
+        ShoppingCart.objects.create(user=cls.reader, recipe=recipe)
+        rebuild_totals()
+
+    def assert_not_buffered(self, caught):
+        self.assertEqual(
+            [str(warning.message) for warning in caught
+             if 'StreamingHttpResponse' in str(warning.message)],
+            []
+        )
+
+    def test_wsgi(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        for format, expected in self.FORMATS:
+            with self.subTest(format=format):
+                with warnings.catch_warnings(record=True) as caught:
+                    warnings.simplefilter('always')
+                    response = self.client.get(
+                        '/api/recipes/download_shopping_cart/',
+                        {'format': format}
+                    )
+                    self.assertFalse(response.is_async)
+                    content = b''.join(response.streaming_content)
+                self.assert_not_buffered(caught)
+                self.assertIn(expected.encode(), content)
+
+    async def test_asgi(self):
+        client = AsyncClient()
+        for format, expected in self.FORMATS:
+            with self.subTest(format=format):
+                with warnings.catch_warnings(record=True) as caught:
+                    warnings.simplefilter('always')
+                    response = await client.get(
+                        '/api/recipes/download_shopping_cart/',
+                        {'format': format},
+                        headers={'Authorization': f'Token {self.token.key}'}
+                    )
+                    self.assertTrue(response.is_async)
+                    content = b''.join([part async for part in response])
+                self.assert_not_buffered(caught)
+                self.assertIn(expected.encode(), content)
+
+
+class AsyncReadViewsTests(APITestCase):
+    """
+    Асинхронные представления чтения отвечают так же, как синхронные
+    ViewSet'ы: тело, статус, ETag, 304 и аутентификация по токену.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name='Обед', slug='lunch')
+        cls.ingredient = Ingredient.objects.create(
+            name='Картофель', measurement_unit='г'
+        )
+        cls.reader = create_user('reader')
+        cls.token = Token.objects.create(user=cls.reader)
+        cls.authors = [create_user(f'author{number}') for number in range(2)]
+        cls.recipes = [
+            create_recipe(
+                cls.authors[number % 2], f'Рецепт {number}', [cls.tag],
+                [cls.ingredient]
+            )
+            for number in range(3)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, following=author)
+        Favorite.objects.create(user=cls.reader, recipe=cls.recipes[0])
+        ShoppingCart.objects.create(user=cls.reader, recipe=cls.recipes[1])
+
+    def setUp(self):
+        cache.clear()
+        # Версия справочника после очистки кэша между запросами остается
+        # прежней, и ETag ответов можно сравнивать.
+        patcher = patch('core.catalog.time')
+        patcher.start().time_ns.return_value = 1_700_000_000 * 10 ** 9
+        self.addCleanup(patcher.stop)
+
+    async def responses(self, path, data=None, **headers):
+        """Ответы синхронного и асинхронного представления на запрос."""
+        client = AsyncClient()
+        sync = await client.get(path, data, headers=headers)
+        # Каждое представление заполняет кэш справочника само.
+        await cache.aclear()
+        with override_settings(ROOT_URLCONF=__name__):
+            self.assertTrue(iscoroutinefunction(resolve(path).func))
+            response = await client.get(path, data, headers=headers)
+        return sync, response
+
+    async def assert_same(self, path, data=None, status=200, **headers):
+        sync, response = await self.responses(path, data, **headers)
+        self.assertEqual(
+            (response.status_code, response.json()),
+            (sync.status_code, sync.json())
+        )
+        self.assertEqual(response.status_code, status)
+        for header in ('ETag', 'Last-Modified', 'WWW-Authenticate'):
+            self.assertEqual(response.get(header), sync.get(header), header)
+        return response
+
+    async def test_anonymous(self):
+        recipe, tag, ingredient = self.recipes[0], self.tag, self.ingredient
+        for path, data in (
+            ('/api/tags/', None),
+            (f'/api/tags/{tag.id}/', None),
+            ('/api/ingredients/', {'name': 'кар'}),
+            (f'/api/ingredients/{ingredient.id}/', None),
+            ('/api/recipes/', {'author': self.authors[0].id}),
+            (f'/api/recipes/{recipe.id}/', None),
+        ):
+            with self.subTest(path=path, data=data):
+                await self.assert_same(path, data)
+        for path in ('/api/tags/0/', '/api/tags/x/', '/api/recipes/0/'):
+            with self.subTest(path=path):
+                await self.assert_same(path, status=404)
+        await self.assert_same('/api/users/subscriptions/', status=401)
+
+    async def test_pagination_links(self):
+        response = await self.assert_same(
+            '/api/recipes/', {'limit': 1, 'page': 2}
+        )
+        page = response.json()
+        self.assertEqual(page['count'], 3)
+        self.assertIn('page=3', page['next'])
+        self.assertIn('limit=1', page['previous'])
+
+    async def test_token_auth(self):
+        authorization = f'Token {self.token.key}'
+        response = await self.assert_same(
+            '/api/recipes/', {'is_favorited': 1},
+            Authorization=authorization
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [self.recipes[0].id]
+        )
+        response = await self.assert_same(
+            f'/api/recipes/{self.recipes[1].id}/',
+            Authorization=authorization
+        )
+        self.assertTrue(response.json()['is_in_shopping_cart'])
+        response = await self.assert_same(
+            '/api/users/subscriptions/', {'limit': 1, 'recipes_limit': 1},
+            Authorization=authorization
+        )
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(len(response.json()['results'][0]['recipes']), 1)
+        for authorization in ('Token wrong', 'Token a b', 'Token'):
+            with self.subTest(authorization=authorization):
+                await self.assert_same(
+                    '/api/recipes/', status=401, Authorization=authorization
+                )
+
+    async def test_not_modified(self):
+        for path, data in (
+            ('/api/tags/', None),
+            ('/api/ingredients/', {'name': 'кар'}),
+            (f'/api/ingredients/{self.ingredient.id}/', None),
+        ):
+            with self.subTest(path=path, data=data):
+                etag = (await self.assert_same(path, data))['ETag']
+                for response in await self.responses(
+                    path, data, **{'If-None-Match': etag}
+                ):
+                    self.assertEqual(response.status_code, 304)
+                    self.assertEqual(response['ETag'], etag)
+
+    async def test_serializers_in_event_loop(self):
+        # Ленивый запрос к БД из цикла событий запрещен: успешные ответы
+        # ниже значит, что сериализаторы не обращаются к БД сами.
+        with self.assertRaises(SynchronousOnlyOperation):
+            list(Recipe.objects.all())
+        client = AsyncClient()
+        authorization = f'Token {self.token.key}'
+        with override_settings(ROOT_URLCONF=__name__):
+            for path in (
+                '/api/recipes/', f'/api/recipes/{self.recipes[0].id}/',
+                '/api/users/subscriptions/', '/api/tags/',
+            ):
+                with self.subTest(path=path):
+                    response = await client.get(
+                        path, headers={'Authorization': authorization}
+                    )
+                    self.assertEqual(response.status_code, 200)
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .async_views import with_async_reads
 from .views import (
     AvatarDetail, IngredientViewSet, RecipeViewSet, TagViewSet, FgUserViewSet
 )
@@ -39,6 +41,9 @@ users_urlpatterns = [
     path('subscriptions/', FgUserViewSet.as_view({
         'get': 'get_subscriptions_list'
     })),
+    path('subscriptions/batch/', FgUserViewSet.as_view({
+        'post': 'subscriptions_batch'
+    })),
     path('<int:id>/', include(id_urlpatterns)),
     path('me/', include(me_urlpatterns)),
     path('set_password/', FgUserViewSet.as_view({
@@ -52,3 +57,8 @@ urlpatterns = [
     path('', include(v1_router.urls)),
     path('users/', include(users_urlpatterns)),
 ]
+
+if settings.ASYNC_READ_VIEWS:
+    # GET списка и страницы рецепта, справочников и списка подписок —
+    # асинхронные представления (api.async_views), остальное — ViewSet'ы.
+    urlpatterns = with_async_reads(urlpatterns)
@@ -1,31 +1,56 @@
+from functools import partial
+from hashlib import md5
+from urllib.parse import urlencode
+
 from django.contrib.auth import get_user_model
-from django.db.models import F, Sum
-from django.http import HttpResponse
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import F, Prefetch, Value, Window
+from django.db.models.functions import RowNumber
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
-from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import filters, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import (
     AllowAny, IsAuthenticated, IsAuthenticatedOrReadOnly
 )
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
 from .filters import IngredientFilter, RecipeFilter
-from .pagination import FgPagination
+from .ingredient_index import fuzzy_ingredients, ingredient_index
+from .pagination import FgCursorPagination, FgPagination
 from .permissions import AuthorOrAuthenticatedOrReadOnly
+from .renderers import (
+    ShoppingListCsvRenderer, ShoppingListPdfRenderer, ShoppingListTxtRenderer
+)
 from .serializers import (
-    SelectionSerializer, AvatarSerializer, FgUserSerializer,
-    FollowSerializer, IngredientListSerializer, RecipeSerializer,
+    SelectionSerializer, AvatarSerializer, FavoriteBatchSerializer,
+    FgUserSerializer, FollowBatchSerializer, FollowSerializer,
+    IngredientListSerializer, RecipeSerializer, ShoppingCartBatchSerializer,
     SubscribtionSerializer, TagSerializer
 )
+from core.catalog import get_catalog_version
+from core.constants import (
+    CATALOG_CACHE_TIMEOUT, FEED_AUTHORS_CHUNK, FEED_MERGE_THRESHOLD,
+    NON_EXISTENT_FAV, NON_EXISTENT_SUB
+)
+from core.images import refresh_variants
 from recipes.models import (
-    Favorite, Ingredient, IngredientRecipe, Recipe, ShoppingCart, Tag
+    Favorite, Ingredient, Recipe, ShoppingCart, Tag
 )
+from recipes.feed import merge_latest_ids
+from recipes.selections import selections_changed
+from users.follows import follows_changed
 
 
 User = get_user_model()
@@ -35,11 +60,83 @@ class ReadonlyNonPaginated(ReadOnlyModelViewSet):
     """
     Базовый ViewSet для read_only моделей без пагинации.
 
-    Реализует общее поведение для Tag, Ingredients.
+    Реализует общее поведение для Tag, Ingredients: ответы кэшируются
+    по версии справочника и параметрам запроса, отдаются с ETag и
+    Last-Modified, повторный запрос с валидаторами получает 304.
     """
 
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        return self.catalog_response(
+            request, partial(super().list, request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.catalog_response(
+            request, partial(super().retrieve, request, *args, **kwargs)
+        )
+
+    def catalog_response(self, request, get_response):
+        """Ответ get_response() с учетом версии справочника и кэша."""
+        cache_key, etag, last_modified = self.catalog_validators(
+            request, get_catalog_version(self.queryset.model)
+        )
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = self._get_cached_response(
+                request, get_response, cache_key
+            )
+        return self.with_catalog_headers(response, etag, last_modified)
+
+    def catalog_validators(self, request, version):
+        """Ключ кэша, ETag и Last-Modified ответа по версии справочника."""
+        cache_key = 'catalog:{}:{}:{}:{}:{}'.format(
+            self.queryset.model._meta.label_lower,
+            version,
+            request.accepted_renderer.format,
+            self.action,
+            urlencode(sorted({
+                **self.kwargs, **request.query_params.dict()
+            }.items())),
+        )
+        etag = quote_etag(md5(cache_key.encode()).hexdigest())
+        return cache_key, etag, version // 10 ** 6
+
+    @staticmethod
+    def with_catalog_headers(response, etag, last_modified):
+        if response.status_code in {
+            status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED
+        }:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, no_cache=True)
+        return response
+
+    def catalog_content(self, request, response):
+        """Тело ответа в JSON для кэша."""
+        if not isinstance(response, Response):
+            return response.content
+        return request.accepted_renderer.render(
+            response.data,
+            request.accepted_media_type,
+            self.get_renderer_context(),
+        )
+
+    def _get_cached_response(self, request, get_response, cache_key):
+        if request.accepted_renderer.format != 'json':
+            return get_response()
+        content = cache.get(cache_key)
+        if content is None:
+            response = get_response()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            content = self.catalog_content(request, response)
+            cache.set(cache_key, content, CATALOG_CACHE_TIMEOUT)
+        return HttpResponse(content, content_type='application/json')
+
 
 class AvatarDetail(APIView):
     """Добавляет/ удаляет аватар."""
@@ -57,6 +154,7 @@ class AvatarDetail(APIView):
         self.request.user.avatar.delete(save=True)
         self.request.user.avatar = None
         self.request.user.save()
+        refresh_variants(self.request.user, 'avatar', 'avatar_variants')
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -72,6 +170,7 @@ class FgUserViewSet(UserViewSet):
 
     serializer_class = FgUserSerializer
     pagination_class = FgPagination
+    cursor_ordering = ('-date_joined', '-id')
     lookup_field = 'id'
 
     def get_permissions(self):
@@ -79,34 +178,73 @@ class FgUserViewSet(UserViewSet):
             'get_subscriptions_list',
             'add_to_subscription',
             'delete_subscription',
+            'subscriptions_batch',
             'me',
         } else (AllowAny(),)
 
     def get_serializer_class(self):
         if self.action in {'add_to_subscription', 'delete_subscription'}:
             return FollowSerializer
+        if self.action == 'subscriptions_batch':
+            return FollowBatchSerializer
         if self.action == 'get_subscriptions_list':
             return SubscribtionSerializer
-        if self.action == 'set_password' or 'reset_password':
+        if self.action in ('create', 'set_password', 'reset_password'):
             return super().get_serializer_class()
         return FgUserSerializer
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
-        context['recipes_limit'] = self.request.query_params.get(
-            'recipes_limit'
-        )
+        context['recipes_limit'] = self._get_recipes_limit()
         return context
 
-    def _add_to_selection(self):
-        serializer = self.get_serializer(
-            data={}, context=self.get_serializer_context()
+    def _get_recipes_limit(self):
+        """Возвращает recipes_limit из запроса (целое > 0) или None."""
+        try:
+            recipes_limit = int(
+                self.request.query_params.get('recipes_limit')
+            )
+        except (TypeError, ValueError):
+            return None
+        return recipes_limit if recipes_limit > 0 else None
+
+    def _with_recipes(self, queryset):
+        """
+        Подготавливает авторов для SubscribtionSerializer.
+
+        Число рецептов берется из счетчика recipes_count, а первые
+        recipes_limit рецептов каждого автора загружаются одним запросом с
+        ROW_NUMBER() OVER (PARTITION BY author).
+        """
+        recipes = Recipe.objects.all()
+        recipes_limit = self._get_recipes_limit()
+        if recipes_limit:
+            recipes = recipes.annotate(
+                row_number=Window(
+                    RowNumber(),
+                    partition_by=F('author'),
+                    order_by=(F('pub_date').desc(), F('id').desc()),
+                )
+            ).filter(row_number__lte=recipes_limit)
+        return queryset.annotate(is_subscribed=Value(True)).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
+
+    def subscriptions_queryset(self):
+        """Авторы, на которых подписан пользователь, с их рецептами."""
+        return self._with_recipes(
+            User.objects.filter(followers__user=self.request.user)
         )
+
+    def _add_to_selection(self):
+        serializer = self.get_serializer(data={})
         serializer.is_valid(raise_exception=True)
         follow = serializer.save()
 
         response_serializer = SubscribtionSerializer(
-            follow.following,
+            self._with_recipes(User.objects.filter(
+                id=follow.following_id
+            )).get(),
             context=self.get_serializer_context()
         )
         return Response(
@@ -115,10 +253,20 @@ class FgUserViewSet(UserViewSet):
         )
 
     def _delete_user_selection(self, id):
-        following = self.get_object()
-        serializer = self.get_serializer(data={})
-        serializer.is_valid(raise_exception=True)
-        self.request.user.follows.filter(following=following).delete()
+        """
+        Отписывает одним DELETE: отсутствие подписки, в том числе
+        удаленной одновременным запросом, видно по числу удаленных строк.
+        """
+        user = self.request.user
+        with transaction.atomic():
+            deleted, _ = user.follows.filter(following=id).delete()
+            if deleted:
+                follows_changed(user.id, removed=(id,))
+        if not deleted:
+            get_object_or_404(User, id=id)
+            raise ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [NON_EXISTENT_SUB]
+            })
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -127,12 +275,25 @@ class FgUserViewSet(UserViewSet):
     )
     def get_subscriptions_list(self, request):
         """Возвращает список подписок пользователя."""
-        subscription_list = User.objects.filter(followers__user=request.user)
-        page = self.paginate_queryset(subscription_list)
+        page = self.paginate_queryset(self.subscriptions_queryset())
         return self.get_paginated_response(
             self.get_serializer(page, many=True).data
         )
 
+    @action(
+        detail=False,
+        methods=('post',),
+        url_path='subscriptions/batch'
+    )
+    def subscriptions_batch(self, request):
+        """
+        Подписывает на пользователей из add и отписывает от пользователей
+        из remove; возвращает результат по каждому id.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save())
+
     @action(
         detail=True,
         methods=('post',),
@@ -140,7 +301,6 @@ class FgUserViewSet(UserViewSet):
     )
     def add_to_subscription(self, request, id=None):
         """Реализует подписку на пользователя."""
-        get_object_or_404(User, id=id)
         return self._add_to_selection()
 
     @add_to_subscription.mapping.delete
@@ -160,6 +320,29 @@ class IngredientViewSet(ReadonlyNonPaginated):
     filterset_class = IngredientFilter
     search_fields = ('^name',)
 
+    def list(self, request, *args, **kwargs):
+        """
+        Список ингредиентов по префиксу name из индекса в памяти.
+
+        С fuzzy=true — не больше INGREDIENT_FUZZY_LIMIT ингредиентов,
+        похожих на name (с опечатками). Запросы с search или не в
+        формате JSON обрабатываются через БД.
+        """
+        name = request.query_params.get('name', '').strip()
+        if name and request.query_params.get('fuzzy') in {'true', '1'}:
+            return self.catalog_response(
+                request, lambda: Response(fuzzy_ingredients(name))
+            )
+        if (
+            'search' in request.query_params
+            or request.accepted_renderer.format != 'json'
+        ):
+            return super().list(request, *args, **kwargs)
+        return self.catalog_response(request, lambda: HttpResponse(
+            ingredient_index.search(request.query_params.get('name', '')),
+            content_type='application/json'
+        ))
+
 
 class TagViewSet(ReadonlyNonPaginated):
     """ViewSet класса Tag."""
@@ -171,21 +354,25 @@ class TagViewSet(ReadonlyNonPaginated):
 class RecipeViewSet(ModelViewSet):
     """ViewSet класса Recipe."""
 
-    queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     pagination_class = FgPagination
+    cursor_ordering = ('-pub_date', '-id')
     lookup_field = 'id'
+    lookup_value_regex = r'\d+'
     http_method_names = ('get', 'post', 'patch', 'delete', 'retrieve')
     filter_backends = (DjangoFilterBackend, filters.SearchFilter)
     filterset_class = RecipeFilter
     filterset_fields = ('name', 'author', 'tags')
-    search_fields = ('^name', '^author')
+    search_fields = ('^name', '^author__username')
 
     def get_permissions(self):
         if self.action in {
             'delete_favorite',
             'delete_from_shopping_cart',
-            'download_shopping_cart'
+            'download_shopping_cart',
+            'favorite_batch',
+            'feed',
+            'shopping_cart_batch',
         }:
             return (IsAuthenticated(),)
         if self.request.method in {
@@ -195,6 +382,10 @@ class RecipeViewSet(ModelViewSet):
             return (AuthorOrAuthenticatedOrReadOnly(),)
         return (IsAuthenticatedOrReadOnly(),)
 
+    def get_queryset(self):
+        """Рецепты с предзагруженными связями и флагами пользователя."""
+        return Recipe.objects.for_user(self.request.user)
+
     def get_serializer_class(self):
         if self.action in {
             'add_to_favorite',
@@ -203,12 +394,54 @@ class RecipeViewSet(ModelViewSet):
             'delete_from_shopping_cart',
         }:
             return SelectionSerializer
+        if self.action == 'favorite_batch':
+            return FavoriteBatchSerializer
+        if self.action == 'shopping_cart_batch':
+            return ShoppingCartBatchSerializer
         return RecipeSerializer
 
     def perform_create(self, serializer):
         """Автоматически устанавливает пользователя при создании рецепта."""
         serializer.save(author=self.request.user)
 
+    @action(
+        detail=False,
+        pagination_class=FgCursorPagination,
+    )
+    def feed(self, request):
+        """
+        Лента рецептов авторов, на которых подписан пользователь.
+
+        Новые сначала, пагинация по курсору. Поддерживает фильтры
+        RecipeFilter. При большом числе подписок страница собирается
+        слиянием последних рецептов авторов (recipes.feed).
+        """
+        queryset = self.filter_queryset(
+            self.get_queryset().feed(request.user)
+        )
+        if request.user.following_count >= FEED_MERGE_THRESHOLD:
+            paginator = self.paginator
+            position, reverse = paginator.get_cursor(
+                request, Recipe, self.cursor_ordering
+            )
+            queryset = queryset.filter(id__in=merge_latest_ids(
+                self.filter_queryset(Recipe.objects.all()).filter(
+                    paginator.cursor_filter(
+                        self.cursor_ordering, position, reverse
+                    )
+                ),
+                list(request.user.follows.values_list(
+                    'following', flat=True
+                )),
+                paginator.cursor_order_by(self.cursor_ordering, reverse),
+                paginator.get_page_size(request) + 1,
+                FEED_AUTHORS_CHUNK,
+            ))
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(
+            self.get_serializer(page, many=True).data
+        )
+
     @action(
         detail=True,
         url_path='get-link'
@@ -223,37 +456,41 @@ class RecipeViewSet(ModelViewSet):
         })
 
     def _add_to_selection(self, request, id, model):
-        recipe = self.get_object()
-        serializer = self.get_serializer(data={
-            'id': recipe.id,
-            'name': recipe.name,
-            'image': recipe.image,
-            'cooking_time': recipe.cooking_time
-        })
+        serializer = self.get_serializer(data={})
         serializer.is_valid(raise_exception=True)
-        selection_item = serializer.save()
-
-        response_serializer = self.get_serializer(
-            selection_item.recipe,
-            context=self.get_serializer_context()
+        recipe = serializer.save(
+            model=model, user=request.user, recipe_id=int(id)
         )
         return Response(
-            response_serializer.data,
+            self.get_serializer(recipe).data,
             status=status.HTTP_201_CREATED
         )
 
     def _delete_user_selection(self, request, id, model):
-        recipe = get_object_or_404(Recipe, id=id)
-        serializer = self.get_serializer(data={
-            'id': recipe.id,
-            'name': recipe.name,
-            'image': recipe.image,
-            'cooking_time': recipe.cooking_time
-        })
-        serializer.is_valid(raise_exception=True)
-        model.objects.filter(user=self.request.user, recipe=recipe).delete()
+        """
+        Удаляет рецепт одним DELETE: отсутствие записи, в том числе
+        удаленной одновременным запросом, видно по числу удаленных строк.
+        """
+        with transaction.atomic():
+            deleted, _ = model.objects.filter(
+                user=request.user, recipe=id
+            ).delete()
+            if deleted:
+                selections_changed(model, request.user.id, removed=(id,))
+        if not deleted:
+            get_object_or_404(Recipe, id=id)
+            raise ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [NON_EXISTENT_FAV.format(
+                    selection=model._meta.verbose_name.lower()
+                )]
+            })
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def _apply_batch(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save())
+
     @action(
         detail=True,
         methods=('post',),
@@ -282,101 +519,59 @@ class RecipeViewSet(ModelViewSet):
         """Удаление рецепта из списка покупок."""
         return self._delete_user_selection(request, id, ShoppingCart)
 
-    @action(detail=False, methods=('get',))
+    @action(
+        detail=False,
+        methods=('post',),
+        url_path='favorite/batch'
+    )
+    def favorite_batch(self, request):
+        """Пакетное добавление и удаление рецептов в избранном."""
+        return self._apply_batch(request)
+
+    @action(
+        detail=False,
+        methods=('post',),
+        url_path='shopping_cart/batch'
+    )
+    def shopping_cart_batch(self, request):
+        """Пакетное добавление и удаление рецептов в списке покупок."""
+        return self._apply_batch(request)
+
+    @action(
+        detail=False,
+        methods=('get',),
+        renderer_classes=(
+            ShoppingListTxtRenderer,
+            ShoppingListCsvRenderer,
+            ShoppingListPdfRenderer,
+        ),
+    )
     def download_shopping_cart(self, request):
-        """Скачивание списка покупок в формате TXT."""
-        shopping_cart = self.get_queryset()
-        recipes = Recipe.objects.filter(id__in=shopping_cart.values('id'))
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__in=recipes.filter(in_shoppingcart__user=request.user)
-        ).values('recipe').values(
+        """
+        Скачивание списка покупок.
+
+        Формат задается параметром ?format=txt|csv|pdf (по умолчанию TXT).
+        TXT и CSV формируются и отдаются потоком, PDF — частями после
+        сборки всего документа. Под ASGI ответ — асинхронный итератор,
+        иначе Django собрал бы его в памяти целиком.
+        """
+        ingredients = request.user.shopping_cart_ingredients.values(
+            'total_amount',
             name=F('ingredient__name'),
-            measurement_unit=F('ingredient__measurement_unit')
-        ).annotate(
-            total_amount=Sum('amount')
-        ).order_by('ingredient__name')
-
-        response = HttpResponse(
-            self._generate_shopping_list(
-                ingredients, recipes, request.user
-            ),
-            content_type='text/plain; charset=utf-8'
+            measurement_unit=F('ingredient__measurement_unit'),
+        ).order_by('name')
+
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+        stream = renderer.stream
+        if isinstance(request._request, ASGIRequest):
+            stream = renderer.astream
+        response = StreamingHttpResponse(
+            stream(ingredients, request.user), content_type=content_type
         )
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_list.txt"'
+            f'attachment; filename="shopping_list.{renderer.format}"'
         )
         return response
-
-    def _generate_shopping_list(self, ingredients, recipes, user):
-        """Создает дизайн списка покупок."""
-        current_date = timezone.localtime()
-
-        CREATED = '📅 Создан:'
-        END_TITLE = 'ПРИЯТНЫХ ПОКУПОК!'
-        PRODUCT = '   Товар '
-        TITLE = '🛒 СПИСОК ПОКУПОК 🛒'
-        TOTAL = '🥬 Всего ингредиентов:'
-        USER = '👤 Пользователь:'
-
-        WIDTH = 50
-        SCALE_WIDTH = 62
-        BORDER = '═' * WIDTH
-        HEADING_PADDING = 40
-        LINE = '─' * WIDTH
-        DATE = current_date.strftime('%d.%m.%Y %H:%M')
-        user = user.get_full_name() or user.username
-        length = len(ingredients)
-
-        text = f'╔{BORDER}╗\n'
-        text += f'{TITLE:^{SCALE_WIDTH}}\n'
-        text += f'╚{BORDER}╝\n\n'
-
-        text += f'{USER} {user}\n'
-        text += f'{CREATED} {DATE}\n'
-        text += f'{TOTAL} {length}\n\n'
-
-        # Шапка таблицы ингредиентов
-        text += f'{PRODUCT}{"Кол-во":>{HEADING_PADDING}}\n'
-        text += f' {LINE}\n'
-
-        for ingredient in ingredients:
-            name = ingredient.get('name')
-            unit = ingredient.get('measurement_unit')
-            amount = int(ingredient.get('total_amount'))
-
-            amount_str = str(amount) if amount == int(amount) else (
-                f'{amount:.1f}'
-            )
-
-            checkbox = '☐'
-
-            # Обрезаем длинные названия ингредиентов
-            max_name_length = 30
-            cuted_name = name[:max_name_length - 2]
-            display_name = f'{cuted_name}...' if (
-                len(name) > max_name_length
-            ) else name
-
-            # Форматируем название с единицей измерения в скобках
-            name_with_unit = f'{checkbox} {display_name} ({unit})'
-            quantity = amount_str
-
-            # Вычисляем пробелы для выравнивания
-            total_width = 45
-            name_width = len(name_with_unit)
-            spaces_needed = total_width - name_width
-            space = ' ' * spaces_needed
-
-            text += f'{name_with_unit}{space}{quantity}\n'
-
-        text += f' {LINE}\n'
-        text += 'Отмечайте ☑ купленные товары\n'
-        text += '\n'
-        text += '\n'
-        text += f'╔{BORDER}╗\n'
-        text += f'{END_TITLE:^{SCALE_WIDTH}}\n'
-        text += f'╚{BORDER}╝\n'
-        text += '\n'
-        text += f'{"Foodgram 2025":^{SCALE_WIDTH}}\n'
-        text += f'{"Ваш помощник в мире рецептов":^{SCALE_WIDTH}}\n'
-        return text
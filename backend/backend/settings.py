@@ -1,4 +1,5 @@
 # flake8: noqa
+from django.core.exceptions import ImproperlyConfigured
 from django.core.management.utils import get_random_secret_key
 import os
 from pathlib import Path
@@ -33,6 +34,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -46,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.PerformanceMiddleware',
+    'core.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,6 +88,15 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+ASGI_APPLICATION = 'backend.asgi.application'
+
+# Асинхронные представления частых GET-запросов (api.async_views).
+# Выключены по умолчанию: под WSGI (runserver, gunicorn без
+# UvicornWorker) каждый такой запрос запускал бы свой цикл событий.
+# Включаются в ASGI-образе backend (ENV в Dockerfile).
+
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+
 
 # Users
 
@@ -92,11 +105,60 @@ AUTH_USER_MODEL = 'users.FgUser'
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
+#
+# DB_CONN_MAX_AGE — сколько секунд подключение остается открытым между
+# запросами (0 — закрывается после каждого запроса, None — без
+# ограничения); перед повторным использованием оно проверяется.
+# DB_POOL=True — пул подключений psycopg 3 вместо постоянных подключений
+# (только PostgreSQL). Пул свой в каждом процессе gunicorn: от
+# DB_POOL_MIN_SIZE до DB_POOL_MAX_SIZE подключений (воркеры *
+# DB_POOL_MAX_SIZE не должно превышать max_connections PostgreSQL),
+# подключение проверяется при выдаче, свободное ждут не дольше
+# DB_POOL_TIMEOUT секунд. Под ASGI подключение привязано к запросу и
+# постоянные подключения не используются повторно — там нужен пул или
+# DB_CONN_MAX_AGE=0.
+#
+# SQLite открывается в режиме WAL (чтение не ждет записи), транзакции
+# сразу берут блокировку записи (IMMEDIATE) и ждут ее до 20 секунд,
+# а не падают с "database is locked" посреди транзакции.
+#
+# DB_REPLICAS — реплики только для чтения через запятую: для PostgreSQL
+# host[:port] (остальные параметры как у default), для SQLite пути к
+# копиям файла БД, открываемым только на чтение (копирует команда
+# sync_sqlite_replicas). Чтение запросов к API core.replicas отправляет
+# на реплики; нужен общий кэш (см. Cache) для отметок о записи.
+# Недоступная реплика обнаруживается при подключении — с пулом это
+# ожидание DB_POOL_TIMEOUT.
+
+DB_POOL = os.getenv('DB_POOL', 'False') == 'True'
+DB_CONN_MAX_AGE = os.getenv('DB_CONN_MAX_AGE', '0')
+DB_CONN_MAX_AGE = None if DB_CONN_MAX_AGE == 'None' else int(DB_CONN_MAX_AGE)
+
+# Настройки чтения SQLite — общие для основной БД и реплик.
+SQLITE_READ_OPTIONS = {
+    'init_command': (
+        'PRAGMA cache_size=-20000;'
+        'PRAGMA mmap_size=134217728;'
+        'PRAGMA temp_store=MEMORY;'
+    ),
+    'timeout': 20,
+}
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.getenv('SQLITE_NAME', BASE_DIR / 'db.sqlite3'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            **SQLITE_READ_OPTIONS,
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                + SQLITE_READ_OPTIONS['init_command']
+            ),
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 } if os.getenv('DB_SQLITE') else {
     'default': {
@@ -106,9 +168,69 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'PORT': os.getenv('DB_PORT', 5432),
         'USER': os.getenv('POSTGRES_USER', 'django'),
+        # Пул сам держит подключения открытыми.
+        'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+                'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            },
+        } if DB_POOL else {},
+    }
+}
+
+DB_REPLICAS = [
+    replica.strip() for replica in os.getenv('DB_REPLICAS', '').split(',')
+    if replica.strip()
+]
+for number, replica in enumerate(DB_REPLICAS, 1):
+    if os.getenv('DB_SQLITE'):
+        # Файл открыт только на чтение: без прагм записи (WAL,
+        # synchronous) и IMMEDIATE-транзакций основной БД.
+        location = {
+            'NAME': f'file:{replica}?mode=ro',
+            'OPTIONS': SQLITE_READ_OPTIONS,
+        }
+    else:
+        host, _, port = replica.partition(':')
+        location = {'HOST': host, 'PORT': port or DATABASES['default']['PORT']}
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        **location,
+        # В тестах реплика — та же тестовая БД.
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+
+
+# Cache
+# В кэше хранятся версии справочников тегов и ингредиентов, поэтому он
+# должен быть общим для всех процессов: воркеров gunicorn, run_worker и
+# команд вроде load_ingredients. LocMemCache — только для разработки с
+# одним процессом; Docker-образ использует FileBasedCache (см. Dockerfile).
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
     }
 }
 
+if (
+    CACHES['default']['BACKEND'].endswith('.LocMemCache')
+    and int(os.getenv('WEB_CONCURRENCY', 1)) > 1
+):
+    raise ImproperlyConfigured(
+        'Несколько воркеров (WEB_CONCURRENCY) не видят изменений '
+        'справочников в LocMemCache: задайте общий CACHE_BACKEND.'
+    )
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -155,6 +277,20 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Шрифт с кириллицей для списка покупок в PDF
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Замеры запросов: заголовок Server-Timing (раскрывает клиентам число и
+# время SQL, поэтому по умолчанию выключен) и порог медленного запроса в
+# миллисекундах для лога core.middleware
+
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'False') == 'True'
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))
+
 # Default primary key field type
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
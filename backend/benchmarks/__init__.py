@@ -0,0 +1,130 @@
+"""
+Бенчмарки Foodgram.
+
+Запуск из каталога backend:
+
+    python -m benchmarks.<имя модуля> --help
+
+Каждый бенчмарк создает тестовую БД по настройкам DATABASES
+(для PostgreSQL — test_<POSTGRES_DB>, для SQLite с DB_SQLITE — в памяти)
+и удаляет ее по завершении, рабочие данные не затрагиваются.
+"""
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+# Картинка 1x1 для запросов, создающих рецепты и аватары.
+PNG = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJ'
+    'AAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+
+
+def setup(sqlite_file=False):
+    """
+    Настраивает Django и создает тестовую БД; возвращает teardown().
+
+    sqlite_file — тестовая БД SQLite во временном файле, а не в памяти:
+    потокам нужны отдельные подключения, ждущие снятия блокировок.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import (
+        setup_test_environment, teardown_test_environment
+    )
+
+    # Как в тестах: без DEBUG, иначе журнал SQL-запросов искажает замеры.
+    setup_test_environment(debug=False)
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+    temp_dir = None
+    if sqlite_file and connection.vendor == 'sqlite':
+        temp_dir = tempfile.mkdtemp()
+        connection.settings_dict['TEST']['NAME'] = os.path.join(
+            temp_dir, 'benchmark.sqlite3'
+        )
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True
+    )
+
+    def teardown():
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir)
+
+    return teardown
+
+
+@contextmanager
+def measure():
+    """
+    Замеряет время и пиковую память (tracemalloc) блока.
+
+    Результат — словарь с ключами seconds и peak_bytes,
+    заполняется после выхода из блока.
+    """
+    result = {}
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result['seconds'] = time.perf_counter() - start
+        result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+
+def format_bytes(size):
+    """Размер в байтах в удобочитаемом виде."""
+    for unit in ('Б', 'КБ', 'МБ'):
+        if size < 1024:
+            return f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} ГБ'
+
+
+def percentiles(timings):
+    """p50, p95 и p99 времени в секундах — в миллисекундах."""
+    quantiles = statistics.quantiles(timings, n=100)
+    return quantiles[49] * 1000, quantiles[94] * 1000, quantiles[98] * 1000
+
+
+@contextmanager
+def temporary_media():
+    """MEDIA_ROOT во временном каталоге, который удаляется после блока."""
+    from django.test.utils import override_settings
+
+    media_root = tempfile.mkdtemp()
+    try:
+        with override_settings(MEDIA_ROOT=media_root):
+            yield media_root
+    finally:
+        shutil.rmtree(media_root)
+
+
+def all_routes():
+    """Маршруты API и короткой ссылки (без format-суффиксов)."""
+    from django.urls import URLPattern, get_resolver
+
+    def walk(patterns, prefix):
+        for pattern in patterns:
+            # Как ResolverMatch.route: без ^ в начале частей.
+            route = prefix + str(pattern.pattern).removeprefix('^')
+            if isinstance(pattern, URLPattern):
+                yield route
+            else:
+                yield from walk(pattern.url_patterns, route)
+
+    return {
+        route for route in walk(get_resolver().url_patterns, '')
+        if route.startswith(('api/', 's/')) and 'format' not in route
+    }
@@ -0,0 +1,251 @@
+"""
+Частые GET-запросы при многих одновременных медленных клиентах:
+WSGI (gunicorn, sync-воркеры) против ASGI (gunicorn с UvicornWorker и
+асинхронными представлениями api.async_views). Строка ASGI/sync — тот
+же ASGI-сервер с ASYNC_READ_VIEWS=False: разница с ней показывает вклад
+самих асинхронных представлений, а не сервера.
+
+Тестовая БД заполняется командой seed_benchmark_data, серверы
+запускаются отдельными процессами на ней же. Для каждого уровня
+--levels столько же соединений в течение --duration секунд повторяют
+запросы: список и страница рецепта, теги, ингредиенты по префиксу,
+список подписок. Клиент медленный: строка запроса и заголовки
+отправляются частями за --slow-ms, ответ читается кусками по 4 КБ,
+после каждого соединение закрывается (Connection: close). Печатаются
+запросы в секунду, p50/p95/p99 времени ответа и ошибки — ответы кроме
+200, обрывы и ответы дольше --timeout.
+
+Нужны gunicorn и uvicorn-worker (устанавливаются в Dockerfile). Для
+SQLite нужен DB_SQLITE=1 (БД во временном файле); при 1000 соединений
+лимит открытых файлов поднимается до жесткого.
+
+    python -m benchmarks.concurrency --levels 50,200,1000 --duration 20
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from urllib.parse import quote
+
+from . import percentiles, setup
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = (
+    ('WSGI', 'sync', 'backend.wsgi', 'False'),
+    ('ASGI', 'uvicorn_worker.UvicornWorker', 'backend.asgi', 'True'),
+    ('ASGI/sync', 'uvicorn_worker.UvicornWorker', 'backend.asgi', 'False'),
+)
+
+
+def seed(args):
+    """Данные, токен самого активного пользователя и адреса запросов."""
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+    from rest_framework.authtoken.models import Token
+
+    from recipes.models import Ingredient, Recipe, Tag
+
+    call_command(
+        'seed_benchmark_data', users=args.users, recipes=args.recipes,
+        seed=0, stdout=io.StringIO(),
+    )
+    user = get_user_model().objects.order_by('-following_count', 'id').first()
+    token, _ = Token.objects.get_or_create(user=user)
+    recipe = Recipe.objects.order_by('-favorites_count', 'id').first()
+    ingredient = Ingredient.objects.order_by('id').first()
+    paths = (
+        '/api/recipes/',
+        f'/api/recipes/?tags={Tag.objects.first().slug}',
+        f'/api/recipes/{recipe.id}/',
+        '/api/tags/',
+        f'/api/ingredients/?name={quote(ingredient.name[:2])}',
+        '/api/users/subscriptions/?recipes_limit=3',
+    )
+    return token.key, paths
+
+
+def server_env(**overrides):
+    """Окружение процесса сервера: та же тестовая БД, без лога медленных."""
+    from django.db import connection
+
+    env = dict(
+        os.environ,
+        ALLOWED_HOSTS='127.0.0.1',
+        DEBUG='False',
+        SLOW_REQUEST_MS=str(10 ** 9),
+        **overrides,
+    )
+    if connection.vendor == 'sqlite':
+        env['SQLITE_NAME'] = connection.settings_dict['NAME']
+    else:
+        env['POSTGRES_DB'] = connection.settings_dict['NAME']
+    return env
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(worker_class, application, workers, **env):
+    """
+    Запускает gunicorn с переменными окружения env; возвращает процесс и
+    порт, когда тот открыт.
+    """
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, '-m', 'gunicorn',
+            '--bind', f'127.0.0.1:{port}',
+            '--workers', str(workers),
+            '--worker-class', worker_class,
+            '--backlog', '2048',
+            '--log-level', 'warning',
+            application,
+        ],
+        cwd=BACKEND_DIR, env=server_env(**env),
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'gunicorn {application} не запустился')
+
+
+async def slow_request(port, path, token, slow_ms):
+    """Один запрос медленного клиента; возвращает код ответа."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        request = (
+            f'GET {path} HTTP/1.1\r\n'
+            f'Host: 127.0.0.1\r\n'
+            f'Authorization: Token {token}\r\n'
+            f'Accept: application/json\r\n'
+            f'Connection: close\r\n\r\n'
+        ).encode()
+        parts = 4
+        size = -(-len(request) // parts)
+        for start in range(0, len(request), size):
+            writer.write(request[start:start + size])
+            await writer.drain()
+            await asyncio.sleep(slow_ms / 1000 / parts)
+        response = bytearray()
+        while chunk := await reader.read(4096):
+            response += chunk
+        return int(response.split(b' ', 2)[1])
+    finally:
+        writer.close()
+
+
+async def load(port, paths, token, connections, args):
+    """connections клиентов в течение args.duration секунд."""
+    timings = []
+    errors = Counter()
+    deadline = time.monotonic() + args.duration
+
+    async def client(number):
+        rng = random.Random(number)
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(
+                    slow_request(port, rng.choice(paths), token, args.slow_ms),
+                    args.timeout,
+                )
+            except asyncio.TimeoutError:
+                errors['таймаут'] += 1
+                continue
+            except (OSError, IndexError, ValueError):
+                errors['обрыв'] += 1
+                await asyncio.sleep(0.1)
+                continue
+            if status != 200:
+                errors[str(status)] += 1
+                continue
+            timings.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(number) for number in range(connections)))
+    return timings, errors, time.perf_counter() - started
+
+
+def raise_file_limit(connections):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if connections * 2 > hard:
+        print(f'Лимит открытых файлов {hard} меньше нужного для '
+              f'{connections} соединений.')
+
+
+def run(args):
+    token, paths = seed(args)
+    levels = [int(level) for level in args.levels.split(',')]
+    raise_file_limit(max(levels))
+    print(
+        f'Пользователей: {args.users}, рецептов: {args.recipes}; '
+        f'воркеров: {args.workers}, медленная отправка {args.slow_ms} мс'
+    )
+    print(
+        f'{"сервер":<10} {"соед.":>6} {"запр/с":>8} {"p50, мс":>9} '
+        f'{"p95, мс":>9} {"p99, мс":>9}  ошибки'
+    )
+    for name, worker_class, application, async_views in SERVERS:
+        process, port = start_server(
+            worker_class, application, args.workers,
+            ASYNC_READ_VIEWS=async_views,
+        )
+        try:
+            for connections in levels:
+                timings, errors, elapsed = asyncio.run(
+                    load(port, paths, token, connections, args)
+                )
+                p50, p95, p99 = (
+                    percentiles(timings) if len(timings) > 1 else (0, 0, 0)
+                )
+                print(
+                    f'{name:<10} {connections:>6} '
+                    f'{len(timings) / elapsed:>8.1f} '
+                    f'{p50:>9.1f} {p95:>9.1f} {p99:>9.1f}  '
+                    + (', '.join(
+                        f'{kind}: {count}' for kind, count in errors.items()
+                    ) or '—')
+                )
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--levels', default='50,200,1000')
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--slow-ms', type=float, default=200)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--recipes', type=int, default=2000)
+    args = parser.parse_args()
+    teardown = setup(sqlite_file=True)
+    try:
+        run(args)
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
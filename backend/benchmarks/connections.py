@@ -0,0 +1,117 @@
+"""
+Запросы в секунду при разных режимах подключения к БД.
+
+Серверы gunicorn запускаются, как в benchmarks.concurrency, на тестовой
+БД в режимах:
+- новое подключение на каждый запрос (DB_CONN_MAX_AGE=0);
+- постоянные подключения (DB_CONN_MAX_AGE=60), только WSGI: под ASGI
+  подключение привязано к запросу;
+- пул psycopg 3 (DB_POOL=True), только PostgreSQL.
+--clients клиентов без задержек в течение --duration секунд повторяют
+частые GET-запросы. Печатаются запросы в секунду, p50/p99 и, для
+PostgreSQL, сколько подключений к БД открыто за замер
+(pg_stat_database.sessions).
+
+    python -m benchmarks.connections --server wsgi --clients 16
+"""
+import argparse
+import asyncio
+import time
+
+from . import percentiles, setup
+from .concurrency import load, seed, start_server
+
+
+SERVERS = {
+    'wsgi': ('sync', 'backend.wsgi', 'False'),
+    'asgi': ('uvicorn_worker.UvicornWorker', 'backend.asgi', 'True'),
+}
+
+MODES = (
+    ('на запрос', {'DB_CONN_MAX_AGE': '0', 'DB_POOL': 'False'}),
+    ('постоянные', {'DB_CONN_MAX_AGE': '60', 'DB_POOL': 'False'}),
+    ('пул', {'DB_CONN_MAX_AGE': '0', 'DB_POOL': 'True'}),
+)
+
+
+def sessions():
+    """Число сессий тестовой БД PostgreSQL с начала сбора статистики."""
+    from django.db import connection
+
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_stat_clear_snapshot()')
+        cursor.execute(
+            'SELECT sessions FROM pg_stat_database '
+            'WHERE datname = current_database()'
+        )
+        return cursor.fetchone()[0]
+
+
+def run(args):
+    from django.db import connection
+
+    token, paths = seed(args)
+    worker_class, application, async_views = SERVERS[args.server]
+    print(
+        f'{connection.vendor}, {args.server}: воркеров {args.workers}, '
+        f'клиентов {args.clients}, {args.duration:.0f} с'
+    )
+    print(
+        f'{"подключения":<12} {"запр/с":>8} {"p50, мс":>9} {"p99, мс":>9} '
+        f'{"новых подключений":>18}  ошибки'
+    )
+    warmup = argparse.Namespace(**{**vars(args), 'duration': 2})
+    for name, env in MODES:
+        if env['DB_CONN_MAX_AGE'] != '0' and args.server == 'asgi':
+            continue
+        if env['DB_POOL'] == 'True' and connection.vendor != 'postgresql':
+            continue
+        process, port = start_server(
+            worker_class, application, args.workers,
+            ASYNC_READ_VIEWS=async_views, **env,
+        )
+        try:
+            # Прогрев: импорты, индекс ингредиентов, открытие пула.
+            asyncio.run(load(port, paths, token, args.clients, warmup))
+            time.sleep(1)
+            started = sessions()
+            timings, errors, elapsed = asyncio.run(
+                load(port, paths, token, args.clients, args)
+            )
+            time.sleep(1)
+            opened = None if started is None else sessions() - started
+        finally:
+            process.terminate()
+            process.wait()
+        p50, _, p99 = percentiles(timings)
+        print(
+            f'{name:<12} {len(timings) / elapsed:>8.1f} {p50:>9.1f} '
+            f'{p99:>9.1f} {"—" if opened is None else opened:>18}  '
+            + (', '.join(
+                f'{kind}: {count}' for kind, count in errors.items()
+            ) or '—')
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--server', choices=SERVERS, default='wsgi')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--recipes', type=int, default=2000)
+    args = parser.parse_args()
+    args.slow_ms = 0
+    teardown = setup(sqlite_file=True)
+    try:
+        run(args)
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
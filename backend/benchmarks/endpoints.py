@@ -0,0 +1,357 @@
+"""
+Время ответа всех маршрутов API.
+
+Заполняет тестовую БД командой seed_benchmark_data и выполняет сценарий
+пользователя — запросы ко всем маршрутам api/urls.py и короткой
+ссылки — через тестовый клиент Django. Первый проход прогревочный:
+в нем считаются SQL-запросы и пиковая память (tracemalloc) каждого
+запроса. В следующих --repeat проходах замеряется только время, без
+накладных расходов трассировки. Печатаются p50/p95/p99, число запросов
+к БД и пик памяти; с --output результат сохраняется в JSON, а с
+--compare сравнивается с прошлым прогоном (например, на другом коммите).
+
+    python -m benchmarks.endpoints --output before.json
+    python -m benchmarks.endpoints --output after.json --compare before.json
+"""
+import argparse
+import datetime
+import io
+import json
+import platform
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from . import (
+    PNG, all_routes, format_bytes, measure, percentiles, setup,
+    temporary_media
+)
+
+
+PASSWORD = 'benchmark-password'
+
+
+def load_fixtures():
+    """Пользователь сценария и объекты, к которым он обращается."""
+    from django.contrib.auth import get_user_model
+    from django.db.models import Count
+
+    from recipes.models import Ingredient, Recipe, Tag
+
+    User = get_user_model()
+    # Самый активный пользователь: длинная лента и список подписок.
+    user = User.objects.filter(
+        username__startswith='bench'
+    ).order_by('-following_count', 'id').first()
+    other = User.objects.exclude(id=user.id).exclude(
+        followers__user=user
+    ).order_by('-followers_count', 'id').first()
+    recipe = Recipe.objects.exclude(author=user).exclude(
+        in_favorite__user=user
+    ).exclude(in_shoppingcart__user=user).order_by(
+        '-favorites_count', 'id'
+    ).first()
+    ingredient = Ingredient.objects.annotate(
+        uses=Count('ingredientrecipe')
+    ).order_by('-uses', 'id').first()
+    tag = Tag.objects.annotate(
+        uses=Count('recipes')
+    ).order_by('-uses', 'id').first()
+    word = ingredient.name.split()[0]
+    return {
+        'user': user,
+        'other': other.id,
+        'recipe': recipe.id,
+        'ingredient': ingredient.id,
+        'prefix': ingredient.name[:3],
+        # Опечатка: переставлены две буквы.
+        'typo': word[:1] + word[2:3] + word[1:2] + word[3:],
+        'word': recipe.name.split()[0],
+        'tag': tag.id,
+        'tag_slug': tag.slug,
+    }
+
+
+def scenario(client, fixtures, iteration):
+    """
+    Запросы сценария: кортежи (имя, метод, путь, данные).
+
+    Генератор получает ответ на каждый запрос через send(). Изменения
+    данных в проходе парные (создать — удалить, подписаться — отписаться),
+    поэтому проходы не влияют друг на друга.
+    """
+    user = fixtures['user']
+    recipe, other = fixtures['recipe'], fixtures['other']
+    yield 'recipes-list (аноним)', 'get', '/api/recipes/', None
+    response = yield 'token-login', 'post', '/api/auth/token/login/', {
+        'email': user.email, 'password': PASSWORD,
+    }
+    client.credentials(
+        HTTP_AUTHORIZATION=f'Token {response.json()["auth_token"]}'
+    )
+    yield 'api-root', 'get', '/api/', None
+    yield 'ingredients-list', 'get', '/api/ingredients/', None
+    yield (
+        'ingredients-list ?name', 'get',
+        f'/api/ingredients/?name={fixtures["prefix"]}', None,
+    )
+    yield (
+        'ingredients-list ?search', 'get',
+        f'/api/ingredients/?search={fixtures["prefix"]}', None,
+    )
+    yield (
+        'ingredients-list ?fuzzy', 'get',
+        f'/api/ingredients/?name={fixtures["typo"]}&fuzzy=true', None,
+    )
+    yield (
+        'ingredients-detail', 'get',
+        f'/api/ingredients/{fixtures["ingredient"]}/', None,
+    )
+    yield 'tags-list', 'get', '/api/tags/', None
+    yield 'tags-detail', 'get', f'/api/tags/{fixtures["tag"]}/', None
+    yield 'recipes-list', 'get', '/api/recipes/', None
+    yield 'recipes-list ?page=50', 'get', '/api/recipes/?page=50', None
+    yield (
+        'recipes-list ?count=false', 'get',
+        '/api/recipes/?page=50&count=false', None,
+    )
+    yield 'recipes-list ?cursor', 'get', '/api/recipes/?cursor=', None
+    yield (
+        'recipes-list ?tags', 'get',
+        f'/api/recipes/?tags={fixtures["tag_slug"]}', None,
+    )
+    yield 'recipes-list ?author', 'get', f'/api/recipes/?author={other}', None
+    yield (
+        'recipes-list ?is_favorited', 'get',
+        '/api/recipes/?is_favorited=1', None,
+    )
+    yield (
+        'recipes-list ?is_in_shopping_cart', 'get',
+        '/api/recipes/?is_in_shopping_cart=1', None,
+    )
+    yield 'recipes-list ?q', 'get', f'/api/recipes/?q={fixtures["word"]}', None
+    yield (
+        'recipes-list ?search', 'get',
+        f'/api/recipes/?search={fixtures["word"]}', None,
+    )
+    yield 'recipes-feed', 'get', '/api/recipes/feed/', None
+    yield 'recipes-detail', 'get', f'/api/recipes/{recipe}/', None
+    yield 'recipes-get-link', 'get', f'/api/recipes/{recipe}/get-link/', None
+    yield 'short-link', 'get', f'/s/{recipe}/', None
+    recipe_data = {
+        'name': 'Рецепт из замера', 'text': 'Описание', 'cooking_time': 5,
+        'image': PNG, 'tags': [fixtures['tag']],
+        'ingredients': [{'id': fixtures['ingredient'], 'amount': 10}],
+    }
+    response = yield 'recipes-create', 'post', '/api/recipes/', recipe_data
+    created = response.json()['id']
+    yield (
+        'recipes-update', 'patch', f'/api/recipes/{created}/', recipe_data
+    )
+    yield 'recipes-destroy', 'delete', f'/api/recipes/{created}/', None
+    for action in ('favorite', 'shopping_cart'):
+        yield (
+            f'recipes-{action} (добавить)', 'post',
+            f'/api/recipes/{recipe}/{action}/', None,
+        )
+        yield (
+            f'recipes-{action} (удалить)', 'delete',
+            f'/api/recipes/{recipe}/{action}/', None,
+        )
+        for batch, ids in (('добавить', 'add'), ('удалить', 'remove')):
+            yield (
+                f'recipes-{action}-batch ({batch})', 'post',
+                f'/api/recipes/{action}/batch/', {ids: [recipe]},
+            )
+    yield (
+        'recipes-download-shopping-cart', 'get',
+        '/api/recipes/download_shopping_cart/', None,
+    )
+    yield 'users-list', 'get', '/api/users/', None
+    yield 'users-list ?cursor', 'get', '/api/users/?cursor=', None
+    yield 'users-create', 'post', '/api/users/', {
+        'email': f'new{iteration}@example.com',
+        'username': f'new{iteration}',
+        'first_name': 'Имя', 'last_name': 'Фамилия',
+        'password': 'new-user-password',
+    }
+    yield 'users-detail', 'get', f'/api/users/{other}/', None
+    yield 'users-me', 'get', '/api/users/me/', None
+    yield 'users-avatar (загрузить)', 'put', '/api/users/me/avatar/', {
+        'avatar': PNG,
+    }
+    yield 'users-avatar (удалить)', 'delete', '/api/users/me/avatar/', None
+    yield 'users-subscriptions', 'get', '/api/users/subscriptions/', None
+    yield (
+        'users-subscribe (подписаться)', 'post',
+        f'/api/users/{other}/subscribe/', None,
+    )
+    yield (
+        'users-subscribe (отписаться)', 'delete',
+        f'/api/users/{other}/subscribe/', None,
+    )
+    for batch, ids in (('подписаться', 'add'), ('отписаться', 'remove')):
+        yield (
+            f'users-subscriptions-batch ({batch})', 'post',
+            '/api/users/subscriptions/batch/', {ids: [other]},
+        )
+    yield 'users-set-password', 'post', '/api/users/set_password/', {
+        'current_password': PASSWORD, 'new_password': PASSWORD,
+    }
+    yield 'token-logout', 'post', '/api/auth/token/logout/', None
+    client.credentials()
+
+
+def run_pass(fixtures, iteration, call):
+    """Выполняет сценарий; call(имя, запрос) выполняет запрос и отвечает."""
+    from rest_framework.test import APIClient
+
+    client = APIClient()
+    steps = scenario(client, fixtures, iteration)
+    response = None
+    while True:
+        try:
+            name, method, path, data = steps.send(response)
+        except StopIteration:
+            return
+        response = call(name, lambda: getattr(client, method)(
+            path, data, format='json'
+        ))
+        assert response.status_code < 400, (path, response.content)
+
+
+def run(args):
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from django.urls import resolve
+
+    started = time.perf_counter()
+    call_command(
+        'seed_benchmark_data', users=args.users, recipes=args.recipes,
+        seed=args.seed, password=PASSWORD, stdout=io.StringIO(),
+    )
+    print(
+        f'Пользователей: {args.users}, рецептов: {args.recipes} '
+        f'(заполнение {time.perf_counter() - started:.0f} с)'
+    )
+    data = load_fixtures()
+
+    endpoints = {}
+    hit = set()
+
+    def warmup(name, request):
+        with CaptureQueriesContext(connection) as queries, measure() as used:
+            response = request()
+        hit.add(resolve(response.wsgi_request.path).route)
+        endpoints[name] = {
+            'method': response.wsgi_request.method,
+            'path': response.wsgi_request.get_full_path(),
+            'queries': len(queries),
+            'peak_bytes': used['peak_bytes'],
+        }
+        return response
+
+    timings = defaultdict(list)
+
+    def timed(name, request):
+        start = time.perf_counter()
+        response = request()
+        timings[name].append(time.perf_counter() - start)
+        return response
+
+    run_pass(data, 0, warmup)
+    for iteration in range(1, args.repeat + 1):
+        run_pass(data, iteration, timed)
+    for name, result in endpoints.items():
+        result.update(zip(
+            ('p50_ms', 'p95_ms', 'p99_ms'), percentiles(timings[name])
+        ))
+
+    for route in sorted(all_routes() - hit):
+        print(f'Маршрут не проверен: {route}')
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'users': args.users,
+            'recipes': args.recipes,
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'endpoints': endpoints,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(results, baseline=None):
+    base = baseline['endpoints'] if baseline else {}
+    print(
+        f'{"запрос":<40} {"p50, мс":>8} {"p95, мс":>8} {"p99, мс":>8} '
+        f'{"запросов":>8} {"память":>10}'
+        + (f' {"p50 было":>9} {"Δ p50":>7}' if baseline else '')
+    )
+    for name, result in results['endpoints'].items():
+        line = (
+            f'{name:<40} {result["p50_ms"]:>8.1f} {result["p95_ms"]:>8.1f} '
+            f'{result["p99_ms"]:>8.1f} {result["queries"]:>8} '
+            f'{format_bytes(result["peak_bytes"]):>10}'
+        )
+        old = base.get(name)
+        if old:
+            change = (result['p50_ms'] - old['p50_ms']) / old['p50_ms']
+            line += f' {old["p50_ms"]:>9.1f} {change:>+7.0%}'
+            if old['queries'] != result['queries']:
+                line += f' (запросов было {old["queries"]})'
+        elif baseline:
+            line += f' {"—":>9}'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--recipes', type=int, default=10000)
+    parser.add_argument(
+        '--repeat', type=int, default=30,
+        help='Замеряемых проходов сценария (не меньше 2).',
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Сохранить результат в JSON.')
+    parser.add_argument(
+        '--compare', help='JSON прошлого прогона для сравнения.'
+    )
+    args = parser.parse_args()
+    if args.repeat < 2:
+        parser.error('--repeat должно быть не меньше 2.')
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = json.load(file)
+    teardown = setup()
+    try:
+        with temporary_media():
+            results = run(args)
+    finally:
+        teardown()
+    report(results, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+        print(f'Результат сохранен в {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
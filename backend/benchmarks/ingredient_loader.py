@@ -0,0 +1,103 @@
+"""
+Загрузка справочника ингредиентов: load_ingredients и импорт из админки.
+
+Генерирует синтетический CSV из --rows строк и замеряет время и пиковую
+память (tracemalloc) команды load_ingredients при первой загрузке,
+повторной загрузке без изменений и загрузке с измененными единицами
+измерения у 10% строк. Для сравнения первые --baseline-rows строк
+импортируются ресурсом django-import-export, как при импорте в админке.
+
+    python -m benchmarks.ingredient_loader --rows 1000000
+"""
+import argparse
+import csv
+import os
+import tempfile
+from io import StringIO
+
+from . import format_bytes, measure, setup
+
+
+UNITS = ('г', 'мл', 'шт', 'кг', 'ст. л.')
+
+
+def write_catalog(path, rows, changed_every=None):
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        for i in range(rows):
+            unit = UNITS[i % len(UNITS)]
+            if changed_every and i % changed_every == 0:
+                unit = UNITS[(i + 1) % len(UNITS)]
+            writer.writerow((f'ингредиент {i:07}', unit))
+
+
+def run(args):
+    from django.core.management import call_command
+    from import_export.formats.base_formats import CSV
+
+    from recipes.admin import IngredientsResource
+    from recipes.models import Ingredient
+
+    directory = tempfile.mkdtemp()
+    catalog = os.path.join(directory, 'catalog.csv')
+    changed = os.path.join(directory, 'changed.csv')
+    baseline = os.path.join(directory, 'baseline.csv')
+    write_catalog(catalog, args.rows)
+    write_catalog(changed, args.rows, changed_every=10)
+    with open(baseline, 'w', encoding='utf-8', newline='') as file:
+        file.write('name,measurement_unit\n')
+    with open(baseline, 'a', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        for i in range(args.baseline_rows):
+            writer.writerow((f'базовый {i:07}', UNITS[i % len(UNITS)]))
+
+    print(f'Строк: {args.rows}, пачка {args.batch_size}')
+    print(f'{"вариант":<28} {"время, с":>9} {"строк/с":>10} '
+          f'{"пик памяти":>12}')
+
+    def report(label, rows, result):
+        print(
+            f'{label:<28} {result["seconds"]:>9.1f} '
+            f'{rows / result["seconds"]:>10.0f} '
+            f'{format_bytes(result["peak_bytes"]):>12}'
+        )
+
+    for label, path in (
+        ('load_ingredients, новые', catalog),
+        ('load_ingredients, без изм.', catalog),
+        ('load_ingredients, 10% изм.', changed),
+    ):
+        with measure() as result:
+            call_command(
+                'load_ingredients', path,
+                batch_size=args.batch_size, verbosity=0, stdout=StringIO()
+            )
+        report(label, args.rows, result)
+    assert Ingredient.objects.count() == args.rows
+
+    with measure() as result:
+        with open(baseline, encoding='utf-8') as file:
+            dataset = CSV().create_dataset(file.read())
+        IngredientsResource().import_data(dataset, raise_errors=True)
+    report(f'import-export, {args.baseline_rows}', args.baseline_rows, result)
+
+    for path in (catalog, changed, baseline):
+        os.remove(path)
+    os.rmdir(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--baseline-rows', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+    teardown = setup()
+    try:
+        run(args)
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
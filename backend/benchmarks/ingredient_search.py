@@ -0,0 +1,150 @@
+"""
+Нечеткий поиск ингредиентов /api/ingredients/?name=...&fuzzy=true.
+
+Справочник из --ingredients сгенерированных названий; запросы —
+случайные слова из названий с одной опечаткой (замена, пропуск или
+перестановка букв). Каждый запрос уникален, так что кэш ответов
+справочника не срабатывает. Печатаются p50/p95/p99 времени ответа и
+число найденных вариантов; для сравнения — поиск по префиксу.
+
+    python -m benchmarks.ingredient_search --ingredients 100000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from . import format_bytes, measure, percentiles, setup
+
+
+NOUNS = (
+    'абрикосы', 'апельсины', 'баклажаны', 'бананы', 'говядина', 'горошек',
+    'грибы', 'дрожжи', 'желатин', 'кабачки', 'капуста', 'картофель',
+    'кефир', 'клубника', 'корица', 'крупа', 'курица', 'лук', 'макароны',
+    'малина', 'масло', 'молоко', 'морковь', 'мука', 'огурцы', 'орехи',
+    'перец', 'петрушка', 'помидоры', 'рис', 'сахар', 'свекла', 'сливки',
+    'сметана', 'соль', 'сыр', 'творог', 'тыква', 'укроп', 'фасоль',
+    'чеснок', 'шоколад', 'яблоки', 'яйца',
+)
+ADJECTIVES = (
+    'белый', 'вяленый', 'домашний', 'замороженный', 'консервированный',
+    'копченый', 'молотый', 'обжаренный', 'органический', 'отварной',
+    'печеный', 'резаный', 'сладкий', 'соленый', 'сушеный', 'тертый',
+    'фермерский', 'цельный', 'черный', 'рубленый',
+)
+SYLLABLES = (
+    'ба', 'ве', 'го', 'ди', 'жу', 'за', 'ки', 'ло', 'ма', 'не', 'ор',
+    'па', 'ри', 'со', 'ту', 'фе', 'ха', 'це', 'чи', 'ша', 'юн', 'ям',
+)
+LETTERS = 'абвгдежзийклмнопрстуфхцчшщыьэюя'
+
+
+def make_names(count, rng):
+    names = set()
+    while len(names) < count:
+        brand = ''.join(
+            rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))
+        )
+        names.add(
+            f'{rng.choice(NOUNS)} {rng.choice(ADJECTIVES)} {brand}'
+        )
+    return sorted(names)
+
+
+def make_typo(word, rng):
+    position = rng.randrange(len(word))
+    kind = rng.choice(('replace', 'delete', 'swap'))
+    if kind == 'replace':
+        return word[:position] + rng.choice(LETTERS) + word[position + 1:]
+    if kind == 'delete' and len(word) > 3:
+        return word[:position] + word[position + 1:]
+    position = min(position, len(word) - 2)
+    return (
+        word[:position] + word[position + 1] + word[position]
+        + word[position + 2:]
+    )
+
+
+def run(args):
+    from rest_framework.test import APIClient
+
+    from core.catalog import bump_catalog_version
+    from api.ingredient_index import fuzzy_ingredients
+    from recipes.models import Ingredient
+
+    rng = random.Random(args.seed)
+    names = make_names(args.ingredients, rng)
+    Ingredient.objects.bulk_create(
+        (Ingredient(name=name, measurement_unit='г') for name in names),
+        batch_size=10000,
+    )
+    bump_catalog_version(Ingredient)
+    print(f'Ингредиентов: {len(names)}')
+
+    start = time.perf_counter()
+    fuzzy_ingredients('прогрев')
+    print(
+        'Первый запрос (построение индекса): '
+        f'{time.perf_counter() - start:.2f} с'
+    )
+    with measure() as build:
+        bump_catalog_version(Ingredient)
+        fuzzy_ingredients('прогрев')
+    print(f'Пиковая память построения: {format_bytes(build["peak_bytes"])}')
+
+    words = [
+        word for name in rng.sample(names, args.queries)
+        for word in rng.sample(name.split(), 1)
+    ]
+    variants = (
+        (
+            'prefix', {},
+            [
+                name[:rng.randint(3, 8)]
+                for name in rng.sample(names, len(words))
+            ],
+        ),
+        ('fuzzy, точные слова', {'fuzzy': 'true'}, words),
+        (
+            'fuzzy, с опечаткой', {'fuzzy': 'true'},
+            [make_typo(word, rng) for word in words],
+        ),
+    )
+    client = APIClient()
+    print(
+        f'{"режим":<22} {"p50, мс":>8} {"p95, мс":>8} {"p99, мс":>8} '
+        f'{"найдено":>8}'
+    )
+    for label, params, queries in variants:
+        timings = []
+        found = []
+        for query in queries:
+            start = time.perf_counter()
+            response = client.get(
+                '/api/ingredients/', {'name': query, **params}
+            )
+            timings.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.content
+            found.append(len(response.json()))
+        p50, p95, p99 = percentiles(timings)
+        print(
+            f'{label:<22} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f} '
+            f'{statistics.median(found):>8.0f}'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--ingredients', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    teardown = setup()
+    try:
+        run(args)
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
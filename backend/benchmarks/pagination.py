@@ -0,0 +1,97 @@
+"""
+Пагинация /api/recipes/: по номеру страницы, без COUNT(*) и по курсору.
+
+Для каждого режима замеряется медианное время ответа и число запросов
+к БД на первой и на глубокой (--deep-page) странице.
+
+    python -m benchmarks.pagination --recipes 1000000 --deep-page 10000
+"""
+import argparse
+import statistics
+import time
+
+from . import setup
+
+
+def seed(recipes_count, batch_size=10000):
+    from django.contrib.auth import get_user_model
+
+    from recipes.models import Recipe
+
+    user = get_user_model().objects.create_user(
+        username='bench', email='bench@example.com', password='bench'
+    )
+    for start in range(0, recipes_count, batch_size):
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=user, name=f'рецепт {i}',
+                image='recipe_image/bench.png', text='текст', cooking_time=10
+            ) for i in range(start, min(start + batch_size, recipes_count))
+        )
+    return user
+
+
+def run(args):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+
+    from api.pagination import FgPagination
+    from core.constants import PAGE_SIZE
+    from recipes.models import Recipe
+
+    started = time.perf_counter()
+    seed(args.recipes)
+    print(
+        f'Рецептов: {args.recipes} '
+        f'(заполнение {time.perf_counter() - started:.0f} с)'
+    )
+
+    deep_offset = (args.deep_page - 1) * PAGE_SIZE
+    anchor = Recipe.objects.order_by('-pub_date', '-id')[deep_offset - 1]
+    deep_cursor = FgPagination.encode_cursor(
+        [anchor.pub_date.isoformat(), str(anchor.id)]
+    )
+    variants = (
+        ('page, стр. 1', '?page=1'),
+        (f'page, стр. {args.deep_page}', f'?page={args.deep_page}'),
+        ('count=false, стр. 1', '?page=1&count=false'),
+        (
+            f'count=false, стр. {args.deep_page}',
+            f'?page={args.deep_page}&count=false'
+        ),
+        ('cursor, стр. 1', '?cursor='),
+        (f'cursor, стр. {args.deep_page}', f'?cursor={deep_cursor}'),
+    )
+
+    client = APIClient()
+    print(f'{"режим":<26} {"медиана, мс":>12} {"запросов":>9}')
+    for label, query in variants:
+        timings = []
+        for _ in range(args.repeat):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.get(f'/api/recipes/{query}')
+                timings.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.content
+        print(
+            f'{label:<26} {statistics.median(timings) * 1000:>12.1f} '
+            f'{len(queries):>9}'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--recipes', type=int, default=1000000)
+    parser.add_argument('--deep-page', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    teardown = setup()
+    try:
+        run(args)
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,373 @@
+"""
+Планы SQL-запросов всех маршрутов API.
+
+Заполняет тестовую БД, выполняет запросы ко всем маршрутам api/urls.py
+и короткой ссылки, для каждого SQL-запроса получает план (EXPLAIN
+ANALYZE в PostgreSQL, EXPLAIN QUERY PLAN в SQLite) и сообщает о
+проблемах в таблицах из --min-rows строк и больше:
+
+- seq_scan: полный просмотр таблицы;
+- sort: сортировка на диске (PostgreSQL) или сортировка полностью
+  просмотренной таблицы во временном B-дереве (SQLite);
+- join: соединение без индекса — полный просмотр внутренней таблицы
+  во вложенном цикле или временный автоматический индекс.
+
+Маршруты, которые харнесс не вызывает, тоже считаются проблемой.
+С --fail код возврата 1, если проблемы есть (для CI).
+
+    python -m benchmarks.query_plans --recipes 20000 --fail
+"""
+import argparse
+import base64
+import json
+import os
+import re
+import sys
+from collections import defaultdict
+
+from . import PNG, all_routes, setup, temporary_media
+
+
+# Ожидаемые полные просмотры: (маршрут, вид, таблица) -> причина.
+ALLOWED = {
+    ('api/ingredients/$', 'seq_scan', 'recipes_ingredient'): (
+        'справочник целиком строит индекс в памяти'
+    ),
+    # COUNT(*) для поля count; без него — ?count=false или ?cursor=.
+    ('api/recipes/$', 'seq_scan', 'recipes_recipe'): (
+        'число рецептов для пагинации по номеру страницы'
+    ),
+    ('api/users/', 'seq_scan', 'users_fguser'): (
+        'число пользователей для пагинации по номеру страницы'
+    ),
+    # ?search= — OR условий по двум таблицам, один индекс его не покрывает;
+    # ранжированный поиск по индексу — ?q=.
+    ('api/recipes/$', 'seq_scan', 'users_fguser'): (
+        'поиск по началу названия или имени автора'
+    ),
+}
+
+LOOPS = ('SCAN ', 'SEARCH ')
+ALIAS = re.compile(r'"(\w+)" ([A-Z]\d+)\b')
+PASSWORD = 'plans-password'
+
+
+def seed(args):
+    """Заполняет БД; возвращает пользователя, от имени которого запросы."""
+    import io
+    import random
+
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+
+    from recipes.models import (
+        Favorite, Ingredient, IngredientRecipe, Recipe, ShoppingCart, Tag
+    )
+    from users.models import Follow
+
+    User = get_user_model()
+    rng = random.Random(0)
+    users = User.objects.bulk_create(
+        User(
+            username=f'user{i}', email=f'user{i}@example.com',
+            first_name='Имя', last_name='Фамилия',
+        ) for i in range(args.users)
+    )
+    user = users[0]
+    user.set_password(PASSWORD)
+    user.save(update_fields=('password',))
+    ingredients = Ingredient.objects.bulk_create(
+        Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+        for i in range(args.ingredients)
+    )
+    tags = Tag.objects.bulk_create(
+        Tag(name=f'тег {i}', slug=f'tag{i}') for i in range(10)
+    )
+    recipes = Recipe.objects.bulk_create((
+        Recipe(
+            author=users[i % len(users)], name=f'рецепт {i}',
+            image='recipe_image/plans.png', text='описание рецепта',
+            cooking_time=10,
+        ) for i in range(args.recipes)
+    ), batch_size=5000)
+    Recipe.tags.through.objects.bulk_create((
+        Recipe.tags.through(recipe=recipe, tag=tag)
+        for recipe in recipes for tag in rng.sample(tags, 2)
+    ), batch_size=5000)
+    IngredientRecipe.objects.bulk_create((
+        IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=100)
+        for recipe in recipes for ingredient in rng.sample(ingredients, 5)
+    ), batch_size=5000)
+    for model, per_user in (
+        (Favorite, args.per_user), (ShoppingCart, args.per_user // 2)
+    ):
+        model.objects.bulk_create((
+            model(user=owner, recipe=recipe)
+            for owner in users for recipe in rng.sample(recipes, per_user)
+        ), batch_size=5000)
+    Follow.objects.bulk_create((
+        Follow(user=owner, following=following)
+        for owner in users
+        for following in rng.sample(users[1:], args.per_user)
+        if following != owner
+    ), batch_size=5000)
+    for command in (
+        'rebuild_shopping_cart_totals', 'reconcile_counters',
+        'rebuild_search_index',
+    ):
+        call_command(command, stdout=io.StringIO())
+    return user
+
+
+def requests(user):
+    """(метод, путь, данные) ко всем маршрутам от имени user."""
+    from django.contrib.auth import get_user_model
+
+    from recipes.models import Ingredient, Recipe, Tag
+
+    other = get_user_model().objects.exclude(
+        id=user.id
+    ).exclude(followers__user=user).first()
+    recipe = Recipe.objects.exclude(author=user).exclude(
+        in_favorite__user=user
+    ).exclude(in_shoppingcart__user=user).first()
+    own = Recipe.objects.filter(author=user).first()
+    tag = Tag.objects.first()
+    ingredient = Ingredient.objects.first()
+    recipe_data = {
+        'name': 'новый рецепт', 'text': 'описание', 'cooking_time': 5,
+        'image': PNG, 'tags': [tag.id],
+        'ingredients': [{'id': ingredient.id, 'amount': 10}],
+    }
+    return [
+        ('post', '/api/auth/token/login/', {
+            'email': user.email, 'password': PASSWORD,
+        }),
+        ('get', '/api/', None),
+        ('get', '/api/ingredients/', None),
+        ('get', '/api/ingredients/?name=ингр', None),
+        ('get', '/api/ingredients/?search=ингр', None),
+        ('get', '/api/ingredients/?name=ингридиент&fuzzy=true', None),
+        ('get', f'/api/ingredients/{ingredient.id}/', None),
+        ('get', '/api/tags/', None),
+        ('get', f'/api/tags/{tag.id}/', None),
+        ('get', '/api/recipes/', None),
+        ('get', '/api/recipes/?page=100', None),
+        ('get', '/api/recipes/?page=100&count=false', None),
+        ('get', '/api/recipes/?cursor=', None),
+        ('get', f'/api/recipes/?tags={tag.slug}', None),
+        ('get', f'/api/recipes/?author={other.id}', None),
+        ('get', '/api/recipes/?is_favorited=1', None),
+        ('get', '/api/recipes/?is_in_shopping_cart=1', None),
+        ('get', '/api/recipes/?q=рецепт', None),
+        ('get', '/api/recipes/?search=рецепт', None),
+        ('get', '/api/recipes/feed/', None),
+        ('get', f'/api/recipes/{recipe.id}/', None),
+        ('get', f'/api/recipes/{recipe.id}/get-link/', None),
+        ('get', f'/s/{recipe.id}/', None),
+        ('post', '/api/recipes/', recipe_data),
+        ('patch', f'/api/recipes/{own.id}/', recipe_data),
+        ('post', f'/api/recipes/{recipe.id}/favorite/', None),
+        ('delete', f'/api/recipes/{recipe.id}/favorite/', None),
+        ('post', f'/api/recipes/{recipe.id}/shopping_cart/', None),
+        ('delete', f'/api/recipes/{recipe.id}/shopping_cart/', None),
+        ('get', '/api/recipes/download_shopping_cart/', None),
+        ('delete', f'/api/recipes/{own.id}/', None),
+        ('get', '/api/users/', None),
+        ('get', '/api/users/?cursor=', None),
+        ('post', '/api/users/', {
+            'email': 'new@example.com', 'username': 'new_user',
+            'first_name': 'Имя', 'last_name': 'Фамилия',
+            'password': 'new-user-password',
+        }),
+        ('get', f'/api/users/{other.id}/', None),
+        ('get', '/api/users/me/', None),
+        ('put', '/api/users/me/avatar/', {'avatar': PNG}),
+        ('delete', '/api/users/me/avatar/', None),
+        ('get', '/api/users/subscriptions/', None),
+        ('post', f'/api/users/{other.id}/subscribe/', None),
+        ('delete', f'/api/users/{other.id}/subscribe/', None),
+        ('post', '/api/users/set_password/', {
+            'current_password': PASSWORD, 'new_password': PASSWORD,
+        }),
+        ('post', '/api/auth/token/logout/', None),
+    ]
+
+
+def table_rows():
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        rows = {}
+        for table in connection.introspection.table_names(cursor):
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}'
+            )
+            rows[table] = cursor.fetchone()[0]
+    return rows
+
+
+def sqlite_issues(cursor, sql, params, large):
+    """Проблемы плана SQLite (EXPLAIN QUERY PLAN)."""
+    aliases = dict((alias, table) for table, alias in ALIAS.findall(sql))
+    limited = ' LIMIT ' in sql.upper()
+    cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+    loops = defaultdict(list)
+    issues = []
+    for _id, parent, _unused, detail in cursor.fetchall():
+        if detail.startswith(LOOPS):
+            table = detail.split()[1]
+            table = aliases.get(table, table)
+            inner = bool(loops[parent])
+            loops[parent].append((detail, table))
+            if 'AUTOMATIC' in detail:
+                issues.append(('join', table, detail))
+            elif (
+                detail.startswith('SCAN ') and table in large
+                # Поиск по индексу FTS5 и обход индекса в порядке
+                # ORDER BY до LIMIT — не полный просмотр.
+                and 'VIRTUAL TABLE' not in detail
+                and not (' USING INDEX ' in detail and limited)
+            ):
+                issues.append(('join' if inner else 'seq_scan', table, detail))
+        elif detail.startswith('USE TEMP B-TREE') and any(
+            loop.startswith('SCAN ') and table in large
+            for loop, table in loops[parent]
+        ):
+            issues.append(('sort', '', detail))
+    return issues
+
+
+def postgresql_issues(cursor, sql, params, large):
+    """Проблемы плана PostgreSQL (EXPLAIN, для SELECT — с ANALYZE)."""
+    analyze = 'ANALYZE, ' if sql.lstrip().upper().startswith(
+        ('SELECT', 'WITH')
+    ) else ''
+    cursor.execute(f'EXPLAIN ({analyze}FORMAT JSON) {sql}', params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    issues = []
+
+    def walk(node, inner=False):
+        table = node.get('Relation Name', '')
+        if node['Node Type'] == 'Seq Scan' and table in large:
+            issues.append((
+                'join' if inner else 'seq_scan', table,
+                f'Seq Scan on {table}',
+            ))
+        if node.get('Sort Space Type') == 'Disk':
+            issues.append((
+                'sort', '', f'Sort on disk {node["Sort Space Used"]} kB'
+            ))
+        for position, child in enumerate(node.get('Plans', ())):
+            walk(child, inner=(
+                node['Node Type'] == 'Nested Loop' and position == 1
+            ))
+
+    walk(plan[0]['Plan'])
+    return issues
+
+
+def run(args):
+    with temporary_media() as media_root:
+        os.makedirs(os.path.join(media_root, 'recipe_image'))
+        with open(
+            os.path.join(media_root, 'recipe_image', 'plans.png'), 'wb'
+        ) as image:
+            image.write(base64.b64decode(PNG.split(',')[1]))
+        return check_routes(args)
+
+
+def check_routes(args):
+    from django.db import connection
+    from django.urls import resolve
+    from rest_framework.authtoken.models import Token
+    from rest_framework.test import APIClient
+
+    user = seed(args)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    rows = table_rows()
+    large = {table for table, count in rows.items() if count >= args.min_rows}
+    print('Таблицы от {} строк: {}'.format(args.min_rows, ', '.join(
+        f'{table} ({rows[table]})' for table in sorted(large)
+    )))
+
+    explain = (
+        postgresql_issues if connection.vendor == 'postgresql'
+        else sqlite_issues
+    )
+    client = APIClient()
+    token, _ = Token.objects.get_or_create(user=user)
+    problems = 0
+    hit = set()
+    for method, path, data in requests(user):
+        route = resolve(path.split('?')[0]).route
+        hit.add(route)
+        statements = {}
+
+        def capture(execute, sql, params, many, context):
+            if not many and sql.lstrip().upper().startswith(
+                ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+            ):
+                statements.setdefault(sql, params)
+            return execute(sql, params, many, context)
+
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        with connection.execute_wrapper(capture):
+            response = getattr(client, method)(path, data, format='json')
+        assert response.status_code < 400, (path, response.content)
+        if path == '/api/auth/token/logout/':
+            token, _ = Token.objects.get_or_create(user=user)
+
+        found = []
+        with connection.cursor() as cursor:
+            for sql, params in statements.items():
+                for kind, table, detail in explain(
+                    cursor, sql, params, large
+                ):
+                    if (route, kind, table) not in ALLOWED:
+                        found.append((kind, table, detail, sql))
+        problems += len(found)
+        print(
+            f'{method.upper():<6} {path:<55} запросов {len(statements):>3}'
+            f'{"" if not found else f", проблем {len(found)}"}'
+        )
+        for kind, table, detail, sql in found:
+            print(f'    {kind:<8} {table:<28} {detail}')
+            if args.verbose:
+                print(f'        {sql}')
+
+    missing = all_routes() - hit
+    for route in sorted(missing):
+        print(f'Маршрут не проверен: {route}')
+    problems += len(missing)
+    print(f'Проблем: {problems}')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--recipes', type=int, default=20000)
+    parser.add_argument('--ingredients', type=int, default=2000)
+    parser.add_argument(
+        '--per-user', type=int, default=20,
+        help='Избранного и подписок на пользователя (покупок — вдвое меньше).',
+    )
+    parser.add_argument('--min-rows', type=int, default=1000)
+    parser.add_argument('--fail', action='store_true')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+    teardown = setup()
+    try:
+        problems = run(args)
+    finally:
+        teardown()
+    if args.fail and problems:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
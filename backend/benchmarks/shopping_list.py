@@ -0,0 +1,168 @@
+"""
+Скачивание списка покупок: прежняя сборка строки и потоковые рендереры.
+
+Для каждого варианта замеряются время до первого байта, полное время
+и пиковая память (tracemalloc) на корзине из --recipes рецептов.
+Вариант totals читает готовые суммы из ShoppingCartIngredient.
+
+    python -m benchmarks.shopping_list --recipes 500 --catalog 2000
+"""
+import argparse
+import random
+import time
+
+from . import format_bytes, measure, setup
+
+
+def legacy_shopping_list(ingredients, user):
+    """Прежняя реализация: весь документ собирается конкатенацией."""
+    from django.utils import timezone
+
+    current_date = timezone.localtime()
+    WIDTH = 50
+    SCALE_WIDTH = 62
+    BORDER = '═' * WIDTH
+    LINE = '─' * WIDTH
+    DATE = current_date.strftime('%d.%m.%Y %H:%M')
+    user = user.get_full_name() or user.username
+    length = len(ingredients)
+
+    text = f'╔{BORDER}╗\n'
+    text += f'{"🛒 СПИСОК ПОКУПОК 🛒":^{SCALE_WIDTH}}\n'
+    text += f'╚{BORDER}╝\n\n'
+    text += f'👤 Пользователь: {user}\n'
+    text += f'📅 Создан: {DATE}\n'
+    text += f'🥬 Всего ингредиентов: {length}\n\n'
+    text += f'   Товар {"Кол-во":>40}\n'
+    text += f' {LINE}\n'
+    for ingredient in ingredients:
+        name = ingredient.get('name')
+        amount = int(ingredient.get('total_amount'))
+        display_name = f'{name[:28]}...' if len(name) > 30 else name
+        name_with_unit = (
+            f'☐ {display_name} ({ingredient.get("measurement_unit")})'
+        )
+        space = ' ' * (45 - len(name_with_unit))
+        text += f'{name_with_unit}{space}{amount}\n'
+    text += f' {LINE}\n'
+    text += 'Отмечайте ☑ купленные товары\n\n\n'
+    text += f'╔{BORDER}╗\n'
+    text += f'{"ПРИЯТНЫХ ПОКУПОК!":^{SCALE_WIDTH}}\n'
+    text += f'╚{BORDER}╝\n\n'
+    text += f'{"Foodgram 2025":^{SCALE_WIDTH}}\n'
+    text += f'{"Ваш помощник в мире рецептов":^{SCALE_WIDTH}}\n'
+    return text
+
+
+def seed(recipes_count, catalog_size, per_recipe):
+    from django.contrib.auth import get_user_model
+
+    from recipes.models import (
+        Ingredient, IngredientRecipe, Recipe, ShoppingCart
+    )
+    from recipes.shopping_cart import rebuild_totals
+
+    user = get_user_model().objects.create_user(
+        username='bench', email='bench@example.com', password='bench'
+    )
+    ingredients = Ingredient.objects.bulk_create(
+        Ingredient(name=f'ингредиент {i:05}', measurement_unit='г')
+        for i in range(catalog_size)
+    )
+    recipes = Recipe.objects.bulk_create(
+        Recipe(
+            author=user, name=f'рецепт {i}', image='recipe_image/bench.png',
+            text='текст', cooking_time=10
+        ) for i in range(recipes_count)
+    )
+    IngredientRecipe.objects.bulk_create(
+        IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=100)
+        for recipe in recipes
+        for ingredient in random.sample(ingredients, per_recipe)
+    )
+    ShoppingCart.objects.bulk_create(
+        ShoppingCart(user=user, recipe=recipe) for recipe in recipes
+    )
+    rebuild_totals()
+    return user
+
+
+def run(args):
+    from django.db.models import F, Sum
+
+    from api.renderers import (
+        ShoppingListCsvRenderer, ShoppingListPdfRenderer,
+        ShoppingListTxtRenderer
+    )
+    from recipes.models import IngredientRecipe
+
+    user = seed(args.recipes, args.catalog, args.per_recipe)
+
+    def ingredients():
+        return IngredientRecipe.objects.filter(
+            recipe__in_shoppingcart__user=user
+        ).values(
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit')
+        ).annotate(total_amount=Sum('amount')).order_by('name')
+
+    def totals():
+        return user.shopping_cart_ingredients.values(
+            'total_amount',
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+        ).order_by('name')
+
+    def legacy():
+        yield legacy_shopping_list(list(ingredients()), user).encode()
+
+    def streamed(renderer, source=ingredients):
+        def stream():
+            for chunk in renderer.stream(source(), user):
+                yield chunk if isinstance(chunk, bytes) else chunk.encode()
+        return stream
+
+    variants = (
+        ('legacy txt', legacy),
+        ('stream txt', streamed(ShoppingListTxtRenderer())),
+        ('totals txt', streamed(ShoppingListTxtRenderer(), totals)),
+        ('stream csv', streamed(ShoppingListCsvRenderer())),
+        ('stream pdf', streamed(ShoppingListPdfRenderer())),
+    )
+    print(
+        f'Корзина: {args.recipes} рецептов × {args.per_recipe} ингредиентов, '
+        f'справочник {args.catalog}'
+    )
+    print(f'{"вариант":<12} {"TTFB, мс":>10} {"всего, мс":>10} '
+          f'{"пик памяти":>12} {"размер":>10}')
+    for label, stream in variants:
+        with measure() as result:
+            start = time.perf_counter()
+            chunks = stream()
+            size = len(next(chunks))
+            ttfb = time.perf_counter() - start
+            for chunk in chunks:
+                size += len(chunk)
+        print(
+            f'{label:<12} {ttfb * 1000:>10.1f} '
+            f'{result["seconds"] * 1000:>10.1f} '
+            f'{format_bytes(result["peak_bytes"]):>12} '
+            f'{format_bytes(size):>10}'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--recipes', type=int, default=500)
+    parser.add_argument('--catalog', type=int, default=2000)
+    parser.add_argument('--per-recipe', type=int, default=12)
+    args = parser.parse_args()
+    teardown = setup()
+    try:
+        run(args)
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
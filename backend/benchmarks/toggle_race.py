@@ -0,0 +1,184 @@
+"""
+Одновременные добавления и удаления: избранное, список покупок, подписки.
+
+В каждом раунде --threads потоков одним и тем же пользователем
+одновременно (через Barrier) отправляют один и тот же POST, затем один и
+тот же DELETE — как двойной клик или повтор запроса клиентом. Ожидается
+ровно один 201 (204), остальные — 400; любой другой код ответа, а также
+расхождение счетчиков favorites_count, shopping_carts_count,
+following_count, followers_count и сумм списка покупок с фактическими
+записями считаются ошибкой. Печатаются p50/p95/p99 времени ответа.
+
+SQLite работает с тестовой БД в файле: у каждого потока свое
+подключение, запись сериализуется блокировкой БД.
+
+    python -m benchmarks.toggle_race --threads 16 --rounds 50
+"""
+import argparse
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from . import PNG, percentiles, setup, temporary_media
+
+
+def seed():
+    """Пользователь, автор и рецепт автора с ингредиентами."""
+    from django.contrib.auth import get_user_model
+    from rest_framework.authtoken.models import Token
+    from rest_framework.test import APIClient
+
+    from recipes.models import Ingredient, Tag
+
+    User = get_user_model()
+    user, author = (
+        User.objects.create_user(
+            username=username, email=f'{username}@example.com',
+            first_name=username, last_name=username,
+            password='benchmark-password',
+        ) for username in ('race-user', 'race-author')
+    )
+    tag = Tag.objects.create(name='Гонка', slug='race')
+    ingredients = Ingredient.objects.bulk_create(
+        Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+        for number in range(5)
+    )
+    client = APIClient()
+    client.force_authenticate(author)
+    response = client.post('/api/recipes/', {
+        'name': 'Рецепт для гонок',
+        'text': 'Описание',
+        'cooking_time': 10,
+        'image': PNG,
+        'tags': [tag.id],
+        'ingredients': [
+            {'id': ingredient.id, 'amount': 100}
+            for ingredient in ingredients
+        ],
+    }, format='json')
+    assert response.status_code == 201, response.content
+    token, _ = Token.objects.get_or_create(user=user)
+    return user, author, response.json()['id'], token.key
+
+
+def race(path, method, threads, token):
+    """Отправляет method на path из threads потоков одновременно."""
+    from django.db import connection
+    from rest_framework.test import APIClient
+
+    barrier = threading.Barrier(threads)
+    statuses = []
+    timings = []
+
+    def worker():
+        client = APIClient(raise_request_exception=False)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        try:
+            barrier.wait()
+            start = time.perf_counter()
+            response = getattr(client, method)(path)
+            timings.append(time.perf_counter() - start)
+            statuses.append(response.status_code)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return Counter(statuses), timings
+
+
+def counter_mismatches(user, author, recipe_id):
+    """Счетчики и суммы списка покупок, не совпадающие с записями."""
+    from recipes.models import Favorite, Recipe, ShoppingCart
+    from recipes.shopping_cart import find_totals_mismatches
+    from users.models import Follow
+
+    recipe = Recipe.objects.get(id=recipe_id)
+    user.refresh_from_db()
+    author.refresh_from_db()
+    expected = (
+        ('favorites_count', recipe.favorites_count,
+         Favorite.objects.filter(recipe=recipe_id).count()),
+        ('shopping_carts_count', recipe.shopping_carts_count,
+         ShoppingCart.objects.filter(recipe=recipe_id).count()),
+        ('following_count', user.following_count,
+         Follow.objects.filter(user=user).count()),
+        ('followers_count', author.followers_count,
+         Follow.objects.filter(following=author).count()),
+    )
+    problems = [
+        f'{name}: {stored}, записей {actual}'
+        for name, stored, actual in expected if stored != actual
+    ]
+    problems += [
+        f'сумма ингредиента {ingredient_id} у {user_id}: '
+        f'{stored}, по рецептам {actual}'
+        for user_id, ingredient_id, stored, actual
+        in find_totals_mismatches()
+    ]
+    return problems
+
+
+def run(args):
+    user, author, recipe_id, token = seed()
+    toggles = (
+        ('favorite', f'/api/recipes/{recipe_id}/favorite/'),
+        ('shopping_cart', f'/api/recipes/{recipe_id}/shopping_cart/'),
+        ('subscribe', f'/api/users/{author.id}/subscribe/'),
+    )
+    expected = {'post': 201, 'delete': 204}
+    timings = defaultdict(list)
+    failures = 0
+    for number in range(args.rounds):
+        for name, path in toggles:
+            for method, success in expected.items():
+                statuses, elapsed = race(path, method, args.threads, token)
+                timings[name, method] += elapsed
+                problems = counter_mismatches(user, author, recipe_id)
+                if statuses != Counter(
+                    {success: 1, 400: args.threads - 1}
+                ):
+                    problems.insert(0, f'ответы {dict(statuses)}')
+                if problems:
+                    failures += 1
+                    print(
+                        f'Раунд {number + 1}, {method.upper()} {name}: '
+                        + '; '.join(problems)
+                    )
+
+    print(
+        f'{"запрос":<24} {"p50, мс":>8} {"p95, мс":>8} {"p99, мс":>8}'
+    )
+    for (name, method), elapsed in timings.items():
+        p50, p95, p99 = percentiles(elapsed)
+        print(
+            f'{method.upper() + " " + name:<24} '
+            f'{p50:>8.1f} {p95:>8.1f} {p99:>8.1f}'
+        )
+    total = args.rounds * len(toggles) * len(expected)
+    print(f'Гонок: {total}, с ошибками: {failures}')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+    if args.threads < 2:
+        parser.error('--threads должно быть не меньше 2.')
+    teardown = setup(sqlite_file=True)
+    try:
+        with temporary_media():
+            failures = run(args)
+    finally:
+        teardown()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
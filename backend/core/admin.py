@@ -0,0 +1,18 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """Административный интерфейс для просмотра фоновых задач."""
+
+    list_display = (
+        'name', 'status', 'attempts', 'run_at', 'locked_by', 'finished_at'
+    )
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'last_error')
+    readonly_fields = (
+        'name', 'payload', 'attempts', 'locked_by', 'locked_at',
+        'last_error', 'created_at', 'finished_at'
+    )
@@ -1,7 +1,12 @@
 from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
     verbose_name = 'Основные настройки'
+
+    def ready(self):
+        # Регистрирует фоновые задачи из модулей jobs.py приложений.
+        autodiscover_modules('jobs')
@@ -0,0 +1,41 @@
+import time
+
+from django.core.cache import cache
+
+
+def _version_key(model):
+    return f'catalog-version:{model._meta.label_lower}'
+
+
+def get_catalog_version(model):
+    """
+    Возвращает текущую версию справочника model.
+
+    Версия — время последнего изменения справочника в микросекундах,
+    хранится в кэше Django, чтобы быть общей для всех процессов.
+    """
+    key = _version_key(model)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns() // 1000
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+async def aget_catalog_version(model):
+    """То же, что get_catalog_version, для async-представлений."""
+    key = _version_key(model)
+    version = await cache.aget(key)
+    if version is None:
+        version = time.time_ns() // 1000
+        if not await cache.aadd(key, version, None):
+            version = await cache.aget(key, version)
+    return version
+
+
+def bump_catalog_version(model):
+    """Повышает версию справочника model после его изменения."""
+    key = _version_key(model)
+    version = time.time_ns() // 1000
+    cache.set(key, max(version, (cache.get(key) or 0) + 1), None)
@@ -8,6 +8,59 @@ MAX_PAGE_SIZE = 50
 PAGE_SIZE = 6
 TITLES_PER_PAGE = 10
 
+# Лента подписок: с какого числа подписок собирать ленту слиянием
+# и по сколько авторов в одном запросе
+FEED_MERGE_THRESHOLD = 1000
+FEED_AUTHORS_CHUNK = 500
+
+# Пакетное добавление и удаление (избранное, список покупок, подписки):
+# наибольшее число id в одном запросе
+BATCH_MAX_SIZE = 100
+
+# Кэширование справочников (тегов, ингредиентов), в секундах
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Нечеткий поиск ингредиентов: сколько вариантов отдавать и порог
+# сходства слова с частью названия по триграммам (word_similarity
+# в pg_trgm; 0.6 по умолчанию пропускает опечатки в коротких словах)
+INGREDIENT_FUZZY_LIMIT = 20
+INGREDIENT_TRIGRAM_THRESHOLD = 0.4
+
+# Изображения: ограничения загрузки и уменьшенные копии
+# (название, наибольшая сторона в пикселях)
+IMAGE_MAX_BYTES = 5 * 1024 * 1024
+IMAGE_MAX_PIXELS = 25_000_000
+IMAGE_VARIANTS = (('thumbnail', 320), ('medium', 960))
+IMAGE_VARIANT_FORMATS = (('webp', 'WEBP'), ('jpeg', 'JPEG'))
+IMAGE_VARIANT_QUALITY = 80
+
+# Фоновые задачи: попытки, таймаут и задержки повторов, в секундах
+JOB_MAX_ATTEMPTS = 5
+JOB_TIMEOUT = 60
+JOB_RETRY_DELAY = 10
+JOB_MAX_RETRY_DELAY = 60 * 60
+JOB_POLL_INTERVAL = 1
+
+# Полнотекстовый поиск рецептов: конфигурация PostgreSQL и размер пачки
+# при перестроении индекса
+SEARCH_CONFIG = 'russian'
+SEARCH_INDEX_BATCH_SIZE = 1000
+
+# Замеры запросов (core.middleware): сколько одинаковых SQL за запрос
+# считать N+1 и сколько разных SQL писать в лог медленного запроса
+DUPLICATE_QUERY_THRESHOLD = 5
+SLOW_REQUEST_LOGGED_QUERIES = 20
+
+# Реплики БД (core.replicas): сколько секунд после записи клиент читает
+# основную БД, через сколько секунд снова пробовать недоступную реплику
+# и какие модели всегда читаются с основной БД: только что выданный
+# токен и справочники, ответы по которым кэшируются по версии
+REPLICA_PIN_TIMEOUT = 10
+REPLICA_RETRY_TIMEOUT = 30
+REPLICA_PRIMARY_MODELS = (
+    'authtoken.token', 'recipes.ingredient', 'recipes.tag'
+)
+
 # Минимальные значения
 AMOUNT_MIN_VALUE = 1
 COOKING_TIME_MIN_VALUE = 1
@@ -17,7 +70,16 @@ ALREADY_ADDED = 'Этот рецепт уже добавлен в {selection}'
 ALREADY_ADDED_INGREDIENT = 'Этот ингредиент уже добавлен'
 CANT_ADD_FOLLOWING = 'Вы уже подписаны на этого пользователя.'
 CANT_BE_EMPTY = 'Обязательное поле.'
+CURSOR_WITH_ORDERING = (
+    'Курсор нельзя использовать с поиском q: результаты упорядочены '
+    'по релевантности, используйте page.'
+)
 FOLLOWING_VALIDATION = 'Нельзя подписаться на самого себя!'
+IMAGE_TOO_LARGE = 'Размер изображения не должен превышать {max_size} МБ.'
+IMAGE_TOO_MANY_PIXELS = (
+    'Разрешение изображения не должно превышать {max_pixels} Мп.'
+)
+INVALID_CURSOR = 'Неверный курсор.'
 NOT_FOUND = 'Страница не найдена.'
 NON_EXISTENT_FAV = 'Рецепт не был добавлен в {selection}'
 NON_EXISTENT_SUB = 'Вы не подписаны на этого пользователя'
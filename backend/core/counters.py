@@ -0,0 +1,111 @@
+"""
+Денормализованные счетчики (число рецептов, подписчиков, добавлений).
+
+Счетчики меняются атомарным UPDATE ... SET field = field + delta в той же
+транзакции, что и создание/удаление связанной записи: в API и админке,
+при удалении рецептов и пользователей — в обработчиках pre_delete.
+Изменения в обход них (shell, bulk-запросы) исправляются командой
+reconcile_counters.
+"""
+from django.db import transaction
+from django.db.models import (
+    Case, Count, F, OuterRef, Subquery, Value, When
+)
+from django.db.models.functions import Coalesce, Greatest
+
+
+def change_counters(queryset, *fields, delta=1):
+    """Прибавляет delta к счетчикам fields записей queryset (не ниже 0)."""
+    if not delta:
+        return 0
+    return queryset.update(**{
+        field: Greatest(F(field) + delta, Value(0)) for field in fields
+    })
+
+
+def change_counters_by_pk(model, changes):
+    """
+    Меняет разные счетчики разных записей одним UPDATE (не ниже 0).
+
+    changes: {(pk записи, поле счетчика): delta}, например
+    {(подписчик, 'following_count'): 1, (автор, 'followers_count'): 1}.
+    """
+    fields = {}
+    for (pk, field), delta in changes.items():
+        if delta:
+            fields.setdefault(field, {})[pk] = delta
+    if not fields:
+        return 0
+    return model.objects.filter(pk__in={
+        pk for deltas in fields.values() for pk in deltas
+    }).update(**{
+        field: Case(
+            *(
+                When(pk=pk, then=Greatest(F(field) + delta, Value(0)))
+                for pk, delta in deltas.items()
+            ),
+            default=F(field),
+            output_field=model._meta.get_field(field),
+        ) for field, deltas in fields.items()
+    })
+
+
+def count_subquery(model, field):
+    """Подзапрос: число записей model, у которых field ссылается на pk."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(count=Count('pk')).values('count')
+    ), Value(0))
+
+
+def fill_counters(queryset, counters):
+    """
+    Пересчитывает счетчики всех записей queryset одним UPDATE.
+
+    counters: {поле счетчика: (модель связи, поле FK)}.
+    """
+    return queryset.update(**{
+        field: count_subquery(model, fk)
+        for field, (model, fk) in counters.items()
+    })
+
+
+def reconcile_counters(model, counters, batch_size=1000, dry_run=False):
+    """
+    Сверяет счетчики model с фактическим числом связанных записей.
+
+    Записи обходятся пачками по batch_size в порядке pk, каждая пачка
+    блокируется (SELECT ... FOR UPDATE) на время сверки, чтобы не
+    потерять одновременные инкременты. Генератор возвращает для каждой
+    пачки (последний pk, число исправленных записей).
+    """
+    last_pk = None
+    while True:
+        with transaction.atomic():
+            batch = model.objects.order_by('pk')
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            pks = list(batch.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return
+            last_pk = pks[-1]
+            rows = model.objects.filter(pk__in=pks).select_for_update(
+                of=('self',)
+            ).only(*counters).annotate(**{
+                f'actual_{field}': count_subquery(related_model, fk)
+                for field, (related_model, fk) in counters.items()
+            })
+            changed = []
+            for row in rows:
+                actual = {
+                    field: getattr(row, f'actual_{field}')
+                    for field in counters
+                }
+                if any(getattr(row, field) != actual[field]
+                       for field in counters):
+                    for field, value in actual.items():
+                        setattr(row, field, value)
+                    changed.append(row)
+            if changed and not dry_run:
+                model.objects.bulk_update(changed, tuple(counters))
+        yield last_pk, len(changed)
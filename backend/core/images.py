@@ -0,0 +1,77 @@
+"""
+Уменьшенные копии загруженных изображений (рецептов, аватаров).
+
+Для каждого размера из IMAGE_VARIANTS создаются файлы WebP и JPEG рядом
+с оригиналом; их пути и размеры хранятся в JSON-поле модели:
+{'thumbnail': {'width': 320, 'height': 240, 'webp': '...', 'jpeg': '...'}}.
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .constants import (
+    IMAGE_VARIANT_FORMATS, IMAGE_VARIANT_QUALITY, IMAGE_VARIANTS
+)
+
+
+def _to_rgb(picture):
+    """Убирает прозрачность (фон белый): JPEG не поддерживает альфа-канал."""
+    if picture.mode in {'RGBA', 'LA', 'P'}:
+        picture = picture.convert('RGBA')
+        background = Image.new('RGB', picture.size, 'white')
+        background.paste(picture, mask=picture.getchannel('A'))
+        return background
+    return picture.convert('RGB')
+
+
+def generate_variants(field_file):
+    """Создает уменьшенные копии изображения field_file; возвращает карту."""
+    storage = field_file.storage
+    base, _ = os.path.splitext(field_file.name)
+    variants = {}
+    with field_file.open('rb'), Image.open(field_file) as source:
+        largest = max(size for _, size in IMAGE_VARIANTS)
+        # Для JPEG декодирует сразу в уменьшенном масштабе.
+        source.draft('RGB', (largest, largest))
+        source = _to_rgb(ImageOps.exif_transpose(source))
+        for name, size in IMAGE_VARIANTS:
+            picture = source.copy()
+            picture.thumbnail((size, size), Image.Resampling.LANCZOS)
+            variant = {'width': picture.width, 'height': picture.height}
+            for extension, image_format in IMAGE_VARIANT_FORMATS:
+                buffer = BytesIO()
+                picture.save(
+                    buffer, image_format, quality=IMAGE_VARIANT_QUALITY
+                )
+                variant[extension] = storage.save(
+                    f'{base}_{name}.{extension}',
+                    ContentFile(buffer.getvalue())
+                )
+            variants[name] = variant
+    return variants
+
+
+def delete_variants(storage, variants):
+    """Удаляет файлы вариантов из карты variants."""
+    for variant in (variants or {}).values():
+        for extension, _ in IMAGE_VARIANT_FORMATS:
+            if variant.get(extension):
+                storage.delete(variant[extension])
+
+
+def refresh_variants(instance, image_field, variants_field):
+    """
+    Пересоздает варианты изображения instance.image_field.
+
+    Новая карта сохраняется в variants_field, файлы прежних вариантов
+    удаляются.
+    """
+    field_file = getattr(instance, image_field)
+    old_variants = getattr(instance, variants_field)
+    variants = generate_variants(field_file) if field_file else {}
+    setattr(instance, variants_field, variants)
+    instance.save(update_fields=(variants_field,))
+    delete_variants(field_file.storage, old_variants)
+    return variants
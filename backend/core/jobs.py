@@ -0,0 +1,22 @@
+from django.apps import apps
+
+from .images import refresh_variants
+from .queue import job
+
+
+@job(timeout=120)
+def refresh_image_variants(model, pk, image_field, variants_field):
+    """Пересоздает уменьшенные копии изображения записи (см. core.images)."""
+    instance = apps.get_model(model).objects.filter(pk=pk).first()
+    if instance is not None:
+        refresh_variants(instance, image_field, variants_field)
+
+
+def enqueue_image_variants(instance, image_field, variants_field):
+    """Ставит в очередь пересоздание копий изображения instance."""
+    return refresh_image_variants.enqueue(
+        model=instance._meta.label_lower,
+        pk=instance.pk,
+        image_field=image_field,
+        variants_field=variants_field,
+    )
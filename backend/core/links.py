@@ -0,0 +1,80 @@
+"""
+Связи пользователя с объектом: избранное, список покупок, подписки.
+
+Добавление связей — один INSERT ... SELECT ... ON CONFLICT DO NOTHING:
+повтор (в том числе одновременный) не вставляет строку и не падает на
+уникальном ограничении, а по возвращенным строкам видно, какие связи
+добавлены. Удаление — один DELETE ... RETURNING. Проверки .exists()
+перед записью не нужны: между проверкой и записью другой запрос успевает
+сделать то же самое.
+"""
+from django.db import connection
+
+
+def _columns(model, names):
+    quote = connection.ops.quote_name
+    return [quote(model._meta.get_field(name).column) for name in names]
+
+
+def insert_links(model, target_field, target_ids, **values):
+    """
+    Добавляет записи model, ссылающиеся через target_field на target_ids.
+
+    values — id остальных полей-связей, например user=1. Уже
+    существующие записи и несуществующие объекты пропускаются.
+    Возвращает множество id объектов, для которых запись добавлена.
+    """
+    target_ids = list(target_ids)
+    if not target_ids:
+        return set()
+    quote = connection.ops.quote_name
+    target = model._meta.get_field(target_field).related_model._meta
+    target_pk = quote(target.pk.column)
+    target_column, = _columns(model, (target_field,))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(model._meta.db_table)} '
+            f'({", ".join(_columns(model, values))}, {target_column}) '
+            f'SELECT {", ".join(["%s"] * len(values))}, {target_pk} '
+            f'FROM {quote(target.db_table)} '
+            f'WHERE {target_pk} IN ({", ".join(["%s"] * len(target_ids))}) '
+            f'ON CONFLICT DO NOTHING RETURNING {target_column}',
+            [*values.values(), *target_ids]
+        )
+        return {target_id for target_id, in cursor.fetchall()}
+
+
+def insert_link(model, target_field, **values):
+    """
+    Добавляет запись model, если ее еще нет и существует объект,
+    на который ссылается target_field; values — id по именам
+    полей-связей, например user=1, recipe=2. Возвращает True,
+    если запись добавлена.
+    """
+    target_id = values.pop(target_field)
+    return bool(insert_links(model, target_field, (target_id,), **values))
+
+
+def delete_links(model, target_field, target_ids, **values):
+    """
+    Удаляет записи model, ссылающиеся через target_field на target_ids.
+
+    values — id остальных полей-связей, например user=1. Возвращает
+    множество id объектов, для которых запись удалена.
+    """
+    target_ids = list(target_ids)
+    if not target_ids:
+        return set()
+    quote = connection.ops.quote_name
+    target_column, = _columns(model, (target_field,))
+    conditions = [
+        f'{column} = %s' for column in _columns(model, values)
+    ] + [f'{target_column} IN ({", ".join(["%s"] * len(target_ids))})']
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} '
+            f'WHERE {" AND ".join(conditions)} '
+            f'RETURNING {target_column}',
+            [*values.values(), *target_ids]
+        )
+        return {target_id for target_id, in cursor.fetchall()}
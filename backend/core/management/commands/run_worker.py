@@ -0,0 +1,137 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.constants import JOB_POLL_INTERVAL, JOB_TIMEOUT
+from core.queue import claim, execute, fail, requeue_stale, timeout_for
+
+
+def execute_in_process(job):
+    """Выполняет задачу в дочернем процессе."""
+    # Обработчики сигналов наследуются от воркера: terminate() по
+    # таймауту должен завершать процесс, а Ctrl+C — только воркер.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    execute(job)
+
+
+class Command(BaseCommand):
+    help = (
+        'Запускает воркер фоновых задач: забирает задачи из очереди и '
+        'выполняет их в потоках или процессах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pool',
+            choices=('thread', 'process'),
+            default='thread',
+            help=(
+                'thread — задачи в потоках (легкие, ввод-вывод); process — '
+                'в отдельных процессах (CPU), при таймауте процесс '
+                'завершается.'
+            ),
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Одновременно выполняемых задач (по умолчанию 4).',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=JOB_POLL_INTERVAL,
+            help='Пауза между проверками пустой очереди, в секундах.',
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Выйти, когда очередь опустеет.',
+        )
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency должен быть больше 0.')
+        self.pool = options['pool']
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.running = {}
+        # Потоки просроченных задач, которые еще работают.
+        self.timed_out = []
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self.stdout.write(
+            f'Воркер {self.name}: {self.pool} × {options["concurrency"]}'
+        )
+        next_requeue = 0
+        while not self.stopping or self.running:
+            if time.monotonic() >= next_requeue:
+                requeue_stale()
+                next_requeue = time.monotonic() + JOB_TIMEOUT
+            self._reap()
+            claimed = []
+            free = options['concurrency'] - self._busy()
+            if free > 0 and not self.stopping:
+                claimed = claim(self.name, free)
+                for job in claimed:
+                    self._start(job)
+            if not claimed:
+                if options['burst'] and not self.running:
+                    break
+                time.sleep(options['poll_interval'])
+        self.stdout.write(f'Воркер {self.name} остановлен.')
+
+    def _start(self, job):
+        if self.pool == 'process':
+            # Дочерний процесс откроет собственные соединения с БД.
+            connections.close_all()
+            worker = multiprocessing.get_context('fork').Process(
+                target=execute_in_process, args=(job,), daemon=True
+            )
+        else:
+            worker = threading.Thread(
+                target=execute, args=(job,), daemon=True
+            )
+        worker.start()
+        self.running[job.id] = (
+            job, worker, time.monotonic() + timeout_for(job)
+        )
+
+    def _busy(self):
+        """Число занятых мест: задачи и потоки просроченных задач."""
+        return len(self.running) + len(self.timed_out)
+
+    def _reap(self):
+        """Убирает завершенные задачи, отмечает просроченные упавшими."""
+        now = time.monotonic()
+        self.timed_out = [
+            worker for worker in self.timed_out if worker.is_alive()
+        ]
+        for job_id, (job, worker, deadline) in list(self.running.items()):
+            if not worker.is_alive():
+                del self.running[job_id]
+            elif now > deadline:
+                if self.pool == 'process':
+                    worker.terminate()
+                    worker.join()
+                else:
+                    # Поток прервать нельзя: он доработает, но его
+                    # результат не будет записан (задача уже не
+                    # принадлежит попытке). Пока поток жив, он занимает
+                    # место, иначе потоков стало бы больше concurrency.
+                    self.timed_out.append(worker)
+                fail(job, f'Превышено время выполнения {timeout_for(job)} с.')
+                self.stderr.write(f'Задача {job.name} #{job.id}: таймаут')
+                del self.running[job_id]
+
+    def _stop(self, signum, frame):
+        self.stdout.write('Остановка: ждем выполняемые задачи...')
+        self.stopping = True
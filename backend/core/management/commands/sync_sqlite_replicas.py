@@ -0,0 +1,47 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную БД SQLite в файлы реплик DB_REPLICAS — '
+        'локальная замена репликации для проверки чтения с реплик.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help=(
+                'Повторять копирование каждые N секунд (отставание '
+                'реплики); по умолчанию — один раз.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError(
+                'Команда только для SQLite: реплики PostgreSQL обновляет '
+                'репликация.'
+            )
+        if not settings.DB_REPLICAS:
+            raise CommandError('Реплики не заданы: DB_REPLICAS пуст.')
+        while True:
+            connection.ensure_connection()
+            for path in settings.DB_REPLICAS:
+                replica = sqlite3.connect(path)
+                try:
+                    connection.connection.backup(replica)
+                finally:
+                    replica.close()
+            self.stdout.write(
+                f'Скопировано в реплики: {", ".join(settings.DB_REPLICAS)}'
+            )
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,297 @@
+"""
+Замеры обработки запросов.
+
+PerformanceMiddleware для каждого запроса считает:
+- SQL-запросы и их время — через execute_wrapper, который ставится на
+  каждое подключение при его создании и передает запрос в профиль
+  текущего запроса (ContextVar переходит и в потоки sync_to_async, где
+  async-представления выполняют ORM);
+- время сериализации — to_representation() сериализаторов с
+  ProfiledSerializerMixin (включает выполненные при этом SQL-запросы);
+- время отрисовки ответа — от возврата из представления до готового
+  ответа.
+
+Результат отдается в заголовке Server-Timing, если включен
+SERVER_TIMING (по умолчанию нет: заголовок раскрывает клиентам число и
+время SQL-запросов).
+Запросы дольше SLOW_REQUEST_MS пишутся в лог одной строкой JSON со
+списком нормализованных SQL: без значений параметров, повторы
+объединены, самые долгие — не больше SLOW_REQUEST_LOGGED_QUERIES.
+Одинаковые SQL, выполненные DUPLICATE_QUERY_THRESHOLD раз и больше
+(N+1), пишутся в лог с именем представления и поля сериализатора,
+откуда они выполнены, например RecipeSerializer.get_is_favorited;
+стек для этого обходится только на 1, 2, 4, 8... повторе SQL.
+"""
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from functools import lru_cache
+
+import rest_framework
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework import serializers
+
+from core.constants import (
+    DUPLICATE_QUERY_THRESHOLD, SLOW_REQUEST_LOGGED_QUERIES
+)
+
+
+logger = logging.getLogger(__name__)
+
+current_profile = ContextVar('current_profile', default=None)
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+VALUES = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+ROWS = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+SPACES = re.compile(r'\s+')
+
+DRF_DIR = os.path.dirname(rest_framework.__file__)
+PROJECT_DIR = str(settings.BASE_DIR)
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """SQL без значений: строки и числа — ?, списки значений — (...)."""
+    sql = NUMBER.sub('?', STRING.sub('?', sql).replace('%s', '?'))
+    sql = ROWS.sub('(...), ...', VALUES.sub('(...)', sql))
+    return SPACES.sub(' ', sql).strip()
+
+
+def query_source():
+    """
+    Откуда выполнен SQL-запрос: метод или поле сериализатора, иначе
+    строка кода проекта.
+    """
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        code = frame.f_code
+        owner = frame.f_locals.get('self')
+        if isinstance(owner, serializers.Field):
+            if not code.co_filename.startswith(DRF_DIR):
+                return f'{type(owner).__name__}.{code.co_name}'
+            if owner.parent is not None and owner.field_name:
+                return f'{type(owner.parent).__name__}.{owner.field_name}'
+        if (
+            fallback is None
+            and code.co_filename.startswith(PROJECT_DIR)
+            and 'site-packages' not in code.co_filename
+            and code.co_filename != __file__
+        ):
+            fallback = (
+                f'{os.path.relpath(code.co_filename, PROJECT_DIR)}:'
+                f'{frame.f_lineno} ({code.co_name})'
+            )
+        frame = frame.f_back
+    return fallback
+
+
+class RequestProfile:
+    """Счетчики одного запроса."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view = None
+        self.view_finished = None
+        self.finished = None
+        self.queries = 0
+        self.db_time = 0
+        self.serialize_time = 0
+        self.serialize_depth = 0
+        # fingerprint -> [число, время]
+        self.statements = defaultdict(lambda: [0, 0])
+        self.sources = defaultdict(Counter)
+
+    def execute(self, execute, sql, params, many, context):
+        key = fingerprint(sql)
+        stats = self.statements[key]
+        repeats = stats[0]
+        # Степени двойки: N+1 из тысяч запросов обходит стек десяток раз.
+        if repeats and not repeats & (repeats - 1):
+            self.sources[key][query_source()] += 1
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += elapsed
+            stats[0] += 1
+            stats[1] += elapsed
+
+    @property
+    def total_time(self):
+        return self.finished - self.started
+
+    @property
+    def render_time(self):
+        if self.view_finished is None:
+            return 0
+        return self.finished - self.view_finished
+
+    def server_timing(self):
+        return ', '.join((
+            f'db;dur={self.db_time * 1000:.1f};desc="SQL: {self.queries}"',
+            f'serialize;dur={self.serialize_time * 1000:.1f}',
+            f'render;dur={self.render_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ))
+
+    def duplicates(self):
+        """(fingerprint, число, источник) повторяющихся SQL."""
+        return [
+            (key, count, self.sources[key].most_common(1)[0][0])
+            for key, (count, _) in self.statements.items()
+            if count >= DUPLICATE_QUERY_THRESHOLD
+        ]
+
+    def slow_request(self, request, response):
+        statements = sorted(
+            self.statements.items(), key=lambda item: -item[1][1]
+        )
+        return {
+            'event': 'slow_request',
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'view': self.view,
+            'total_ms': round(self.total_time * 1000, 1),
+            'db_ms': round(self.db_time * 1000, 1),
+            'serialize_ms': round(self.serialize_time * 1000, 1),
+            'render_ms': round(self.render_time * 1000, 1),
+            'queries': self.queries,
+            'sql': [
+                {'sql': key, 'count': count, 'ms': round(elapsed * 1000, 1)}
+                for key, (count, elapsed)
+                in statements[:SLOW_REQUEST_LOGGED_QUERIES]
+            ],
+            'sql_omitted': max(
+                0, len(statements) - SLOW_REQUEST_LOGGED_QUERIES
+            ),
+        }
+
+
+class ProfiledSerializerMixin:
+    """
+    Сериализатор, время to_representation() которого учитывается в
+    профиле запроса (serialize в Server-Timing).
+
+    Подключается явно к сериализаторам ответов; вложенные вызовы (поля
+    сериализаторы) входят во время внешнего, элементы many=True
+    складываются.
+    """
+
+    def to_representation(self, instance):
+        profile = current_profile.get()
+        if profile is None:
+            return super().to_representation(instance)
+        profile.serialize_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            profile.serialize_depth -= 1
+            if not profile.serialize_depth:
+                profile.serialize_time += time.perf_counter() - start
+
+
+def mark_view_finished():
+    """Отмечает возврат из представления (начало отрисовки ответа)."""
+    profile = current_profile.get()
+    if profile is not None:
+        profile.view_finished = time.perf_counter()
+
+
+def _profiled_execute(execute, sql, params, many, context):
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile.execute(execute, sql, params, many, context)
+
+
+def profile_connection(connection, **kwargs):
+    """Ставит замер SQL на подключение (один раз)."""
+    if _profiled_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_profiled_execute)
+
+
+def view_name(view_func, request):
+    """RecipeViewSet.list для ViewSet, иначе имя класса или функции."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__qualname__', repr(view_func))
+    method = request.method.lower()
+    action = (getattr(view_func, 'actions', None) or {}).get(method, method)
+    return f'{view_class.__name__}.{action}'
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(
+            profile_connection, dispatch_uid='profile_connection'
+        )
+        for connection in connections.all(initialized_only=True):
+            profile_connection(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.finish(profile, request, response)
+
+    async def __acall__(self, request):
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.finish(profile, request, response)
+
+    def finish(self, profile, request, response):
+        profile.finished = time.perf_counter()
+        if request.resolver_match is not None:
+            profile.view = view_name(request.resolver_match.func, request)
+
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = profile.server_timing()
+        if profile.total_time * 1000 >= settings.SLOW_REQUEST_MS:
+            logger.warning(json.dumps(
+                profile.slow_request(request, response), ensure_ascii=False
+            ))
+        for key, count, source in profile.duplicates():
+            logger.warning(json.dumps({
+                'event': 'duplicate_queries',
+                'method': request.method,
+                'path': request.path,
+                'view': profile.view,
+                'source': source,
+                'count': count,
+                'sql': key,
+            }, ensure_ascii=False))
+        return response
+
+    def process_template_response(self, request, response):
+        # Вызывается после представления, перед response.render().
+        mark_view_finished()
+        return response
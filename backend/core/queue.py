@@ -0,0 +1,162 @@
+"""
+Очередь фоновых задач в основной БД.
+
+Задача — функция, зарегистрированная декоратором @job в модуле jobs.py
+приложения (модули импортируются при запуске Django). Постановка в
+очередь — запись Job в той же транзакции, что и изменение данных:
+задача станет видна воркеру только после коммита.
+
+Воркер (manage.py run_worker) забирает задачи:
+- PostgreSQL: SELECT ... FOR UPDATE SKIP LOCKED — воркеры не ждут
+  друг друга и не берут одну задачу дважды;
+- SQLite и другие БД без SKIP LOCKED: условный UPDATE ... WHERE
+  status = 'queued' — задачу получает тот, чей UPDATE изменил строку.
+
+Упавшая задача повторяется с экспоненциальной задержкой, пока не
+кончатся попытки. Задача, превысившая timeout, считается упавшей.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .constants import (
+    JOB_MAX_ATTEMPTS, JOB_MAX_RETRY_DELAY, JOB_RETRY_DELAY, JOB_TIMEOUT
+)
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def job(name=None, max_attempts=JOB_MAX_ATTEMPTS, timeout=JOB_TIMEOUT):
+    """
+    Регистрирует функцию как фоновую задачу.
+
+    У функции появляется метод enqueue(**payload) для постановки в
+    очередь; аргументы должны сериализоваться в JSON.
+    """
+    def decorator(func):
+        func.job_name = name or f'{func.__module__}.{func.__name__}'
+        func.max_attempts = max_attempts
+        func.timeout = timeout
+        func.enqueue = lambda run_at=None, **payload: enqueue(
+            func.job_name, payload, run_at=run_at
+        )
+        registry[func.job_name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, run_at=None):
+    """Ставит задачу name в очередь; возвращает Job."""
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        run_at=run_at or timezone.now(),
+        max_attempts=registry[name].max_attempts,
+    )
+
+
+def claim(worker, limit):
+    """Забирает до limit готовых задач для воркера worker."""
+    now = timezone.now()
+    ready = Job.objects.filter(
+        status=Job.QUEUED, run_at__lte=now
+    ).order_by('run_at', 'id')
+    running = dict(
+        status=Job.RUNNING, locked_by=worker, locked_at=now,
+        attempts=F('attempts') + 1,
+    )
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(ready.select_for_update(
+                skip_locked=True
+            ).values_list('id', flat=True)[:limit])
+            Job.objects.filter(id__in=ids).update(**running)
+    else:
+        ids = [
+            job_id for job_id in ready.values_list('id', flat=True)[:limit]
+            if Job.objects.filter(
+                id=job_id, status=Job.QUEUED
+            ).update(**running)
+        ]
+    return list(Job.objects.filter(id__in=ids).order_by('run_at', 'id'))
+
+
+def retry_delay(attempts):
+    """Задержка перед попыткой attempts + 1: 10 с, 20 с, 40 с..."""
+    return timedelta(seconds=min(
+        JOB_RETRY_DELAY * 2 ** (attempts - 1), JOB_MAX_RETRY_DELAY
+    ))
+
+
+def _owned(job):
+    """Задача все еще выполняется этой попыткой этого воркера."""
+    return Job.objects.filter(
+        id=job.id, status=Job.RUNNING,
+        locked_by=job.locked_by, attempts=job.attempts,
+    )
+
+
+def complete(job):
+    return _owned(job).update(
+        status=Job.DONE, finished_at=timezone.now(), last_error=''
+    )
+
+
+def fail(job, error):
+    """Отмечает попытку упавшей: повтор с задержкой или FAILED."""
+    now = timezone.now()
+    if job.attempts >= job.max_attempts:
+        changes = dict(status=Job.FAILED, finished_at=now)
+    else:
+        changes = dict(
+            status=Job.QUEUED, run_at=now + retry_delay(job.attempts)
+        )
+    return _owned(job).update(last_error=error, **changes)
+
+
+def execute(job):
+    """Выполняет задачу и записывает результат; для потока/процесса."""
+    close_old_connections()
+    try:
+        func = registry.get(job.name)
+        if func is None:
+            raise LookupError(f'Задача {job.name} не зарегистрирована.')
+        func(**job.payload)
+    except Exception:
+        logger.exception('Задача %s #%s упала', job.name, job.id)
+        fail(job, traceback.format_exc())
+    else:
+        complete(job)
+    finally:
+        close_old_connections()
+
+
+def timeout_for(job):
+    func = registry.get(job.name)
+    return func.timeout if func else JOB_TIMEOUT
+
+
+def requeue_stale(grace=JOB_TIMEOUT):
+    """
+    Возвращает в очередь задачи, брошенные остановленными воркерами.
+
+    Задача считается брошенной, если выполняется дольше своего timeout
+    плюс grace секунд.
+    """
+    now = timezone.now()
+    stale = 0
+    for job in Job.objects.filter(
+        status=Job.RUNNING,
+        locked_at__lt=now - timedelta(seconds=grace),
+    ):
+        if job.locked_at < now - timedelta(seconds=timeout_for(job) + grace):
+            stale += fail(job, 'Воркер не завершил задачу.')
+    return stale
@@ -0,0 +1,173 @@
+"""
+Чтение с реплик БД.
+
+Реплики — алиасы replica1, replica2, ... в DATABASES (переменная
+DB_REPLICAS в settings) с теми же таблицами, что и default. Чтение
+безопасных (GET, HEAD, OPTIONS) запросов к API ReplicaRouter
+отправляет на реплику, выбранную для запроса в ReplicaMiddleware
+(ContextVar переходит и в потоки sync_to_async). Запись, остальные
+запросы, админка, команды и фоновые задачи работают с основной БД.
+
+Чтобы клиент видел свои изменения, пока реплика отстает:
+- после изменяющего запроса (POST, PUT, PATCH, DELETE или запись
+  внутри GET) запросы с тем же заголовком Authorization еще
+  REPLICA_PIN_TIMEOUT секунд читают основную БД; отметка хранится
+  в кэше, общем для процессов gunicorn;
+- после записи внутри запроса остальное чтение этого запроса идет
+  в основную БД;
+- модели REPLICA_PRIMARY_MODELS всегда читаются с основной БД.
+
+Реплика, к которой не удалось подключиться, пропускается
+REPLICA_RETRY_TIMEOUT секунд; если доступных реплик нет, чтение идет
+в основную БД.
+"""
+import hashlib
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed, SynchronousOnlyOperation
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from core.constants import (
+    REPLICA_PIN_TIMEOUT, REPLICA_PRIMARY_MODELS, REPLICA_RETRY_TIMEOUT
+)
+
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+current_reads = ContextVar('current_reads', default=None)
+
+# алиас -> time.monotonic(), до которого реплика не используется
+unavailable = {}
+
+
+def replica_aliases():
+    return [
+        alias for alias in settings.DATABASES if alias.startswith('replica')
+    ]
+
+
+def available_replica():
+    """Алиас реплики, к которой удалось подключиться, или основной БД."""
+    now = time.monotonic()
+    aliases = [
+        alias for alias in replica_aliases()
+        if unavailable.get(alias, 0) <= now
+    ]
+    random.shuffle(aliases)
+    for alias in aliases:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError as error:
+            unavailable[alias] = now + REPLICA_RETRY_TIMEOUT
+            logger.warning(json.dumps({
+                'event': 'replica_unavailable',
+                'database': alias,
+                'error': str(error),
+            }, ensure_ascii=False))
+            continue
+        return alias
+    return DEFAULT_DB_ALIAS
+
+
+class RequestReads:
+    """Откуда читает текущий запрос к API."""
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.database = None
+        self.wrote = False
+
+    def db_for_read(self):
+        if self.wrote or not self.replica:
+            return DEFAULT_DB_ALIAS
+        if self.database is None:
+            try:
+                self.database = available_replica()
+            except SynchronousOnlyOperation:
+                # В цикле событий подключаться нельзя; сам запрос к БД
+                # выполнится в потоке sync_to_async и выберет реплику там.
+                return DEFAULT_DB_ALIAS
+        return self.database
+
+
+class ReplicaRouter:
+    """Чтение запросов к API — с реплики, запись — в основную БД."""
+
+    def db_for_read(self, model, **hints):
+        reads = current_reads.get()
+        if reads is None:
+            return None
+        if model._meta.label_lower in REPLICA_PRIMARY_MODELS:
+            return DEFAULT_DB_ALIAS
+        return reads.db_for_read()
+
+    def db_for_write(self, model, **hints):
+        reads = current_reads.get()
+        if reads is not None:
+            reads.wrote = True
+        # Явно: иначе объект, прочитанный с реплики, сохранялся бы в нее.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии основной БД.
+        return True
+
+
+def pin_key(request):
+    """Ключ отметки о записи клиента в кэше; None — запрос без токена."""
+    authorization = request.headers.get('Authorization')
+    if not authorization:
+        return None
+    digest = hashlib.sha256(authorization.encode()).hexdigest()
+    return f'replica-pin:{digest}'
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not request.path_info.startswith('/api/'):
+            return self.get_response(request)
+        key = pin_key(request)
+        safe = request.method in SAFE_METHODS
+        reads = RequestReads(safe and not (key and cache.get(key)))
+        token = current_reads.set(reads)
+        try:
+            return self.get_response(request)
+        finally:
+            current_reads.reset(token)
+            if key and (not safe or reads.wrote):
+                cache.set(key, True, REPLICA_PIN_TIMEOUT)
+
+    async def __acall__(self, request):
+        if not request.path_info.startswith('/api/'):
+            return await self.get_response(request)
+        key = pin_key(request)
+        safe = request.method in SAFE_METHODS
+        reads = RequestReads(safe and not (key and await cache.aget(key)))
+        token = current_reads.set(reads)
+        try:
+            return await self.get_response(request)
+        finally:
+            current_reads.reset(token)
+            if key and (not safe or reads.wrote):
+                await cache.aset(key, True, REPLICA_PIN_TIMEOUT)
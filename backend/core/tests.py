@@ -0,0 +1,642 @@
+import base64
+import json
+import os
+import re
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from runpy import run_module
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.storage import default_storage
+from django.db import connection, connections, transaction
+from django.db.utils import ConnectionHandler, OperationalError
+from django.http import JsonResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+    override_settings
+)
+from django.utils import timezone
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.test import (
+    APIClient, APITestCase, APITransactionTestCase
+)
+
+from .constants import (
+    DUPLICATE_QUERY_THRESHOLD, IMAGE_VARIANT_FORMATS, IMAGE_VARIANTS
+)
+from .middleware import (
+    PerformanceMiddleware, ProfiledSerializerMixin, query_source
+)
+from .models import Job
+from .replicas import available_replica, unavailable
+from .queue import (
+    claim, complete, execute, job, registry, requeue_stale, retry_delay
+)
+from core.management.commands.run_worker import Command
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import Follow
+
+
+User = get_user_model()
+
+calls = []
+
+
+@job(name='core.tests.remember', max_attempts=2)
+def remember(value):
+    calls.append(value)
+
+
+@job(name='core.tests.broken', max_attempts=2)
+def broken():
+    raise ValueError('Сломано')
+
+
+class AuthorNameSerializer(ProfiledSerializerMixin, serializers.Serializer):
+    """Имя автора рецепта отдельным запросом на каждый рецепт (N+1)."""
+
+    id = serializers.IntegerField()
+    author_name = serializers.SerializerMethodField()
+
+    def get_author_name(self, recipe):
+        time.sleep(0.001)
+        return User.objects.get(id=recipe.author_id).username
+
+
+def image_data(size, mode='RGBA', color=(255, 0, 0, 0)):
+    """Картинка PNG в формате data:image для API."""
+    buffer = BytesIO()
+    Image.new(mode, size, color).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+class WorkerReapTests(SimpleTestCase):
+    """Поток просроченной задачи занимает место, пока не завершится."""
+
+    def test_timed_out_thread_stays_busy(self):
+        command = Command(stderr=StringIO())
+        command.pool = 'thread'
+        command.running = {}
+        command.timed_out = []
+        release = threading.Event()
+        worker = threading.Thread(target=release.wait, daemon=True)
+        worker.start()
+        job = SimpleNamespace(id=1, name='slow')
+        command.running[job.id] = (job, worker, 0)
+        with patch('core.management.commands.run_worker.fail') as fail:
+            command._reap()
+            fail.assert_called_once()
+            self.assertEqual(command.running, {})
+            self.assertEqual(command._busy(), 1)
+            release.set()
+            worker.join()
+            command._reap()
+        self.assertEqual(command._busy(), 0)
+
+
+# execute() закрывает устаревшие подключения, как в воркере; в тестах
+# подключение внутри транзакции теста закрывать нельзя.
+@patch('core.queue.close_old_connections', lambda: None)
+class JobQueueTests(TestCase):
+    """Задачи очереди забираются один раз, повторяются и падают."""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_claim_once(self):
+        first = remember.enqueue(value=1)
+        second = remember.enqueue(value=2)
+        later = remember.enqueue(
+            value=3, run_at=timezone.now() + timedelta(minutes=1)
+        )
+        claimed = claim('worker1', 10)
+        self.assertEqual([task.id for task in claimed], [first.id, second.id])
+        self.assertEqual(
+            {(task.status, task.locked_by, task.attempts) for task in claimed},
+            {(Job.RUNNING, 'worker1', 1)}
+        )
+        self.assertEqual(claim('worker2', 10), [])
+        for task in claimed:
+            execute(task)
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(
+            set(Job.objects.values_list('id', 'status')),
+            {(first.id, Job.DONE), (second.id, Job.DONE),
+             (later.id, Job.QUEUED)}
+        )
+
+    def test_limit(self):
+        for value in range(3):
+            remember.enqueue(value=value)
+        self.assertEqual(len(claim('worker1', 2)), 2)
+        self.assertEqual(len(claim('worker2', 2)), 1)
+
+    def test_retry_then_fail(self):
+        broken.enqueue()
+        [task] = claim('worker', 10)
+        with self.assertLogs('core.queue', 'ERROR'):
+            execute(task)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Job.QUEUED, 1))
+        self.assertIn('Сломано', task.last_error)
+        self.assertGreater(
+            task.run_at, timezone.now() + retry_delay(1) - timedelta(seconds=5)
+        )
+        self.assertEqual(claim('worker', 10), [])
+        Job.objects.update(run_at=timezone.now())
+        [task] = claim('worker', 10)
+        with self.assertLogs('core.queue', 'ERROR'):
+            execute(task)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Job.FAILED, 2))
+        self.assertIsNotNone(task.finished_at)
+        self.assertEqual(claim('worker', 10), [])
+
+    def test_retry_delay(self):
+        self.assertEqual(
+            [retry_delay(attempts).total_seconds() for attempts in (1, 2, 3)],
+            [10, 20, 40]
+        )
+        self.assertEqual(retry_delay(30), timedelta(hours=1))
+
+    def test_stale_requeued(self):
+        remember.enqueue(value=1)
+        [task] = claim('worker', 10)
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale(), 1)
+        # Брошенная попытка больше не может завершить задачу.
+        self.assertEqual(complete(task), 0)
+        Job.objects.update(run_at=timezone.now())
+        [task] = claim('worker', 10)
+        self.assertEqual(task.attempts, 2)
+        execute(task)
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+
+@skipUnless(
+    connection.features.has_select_for_update_skip_locked,
+    'Нужен SELECT ... FOR UPDATE SKIP LOCKED.'
+)
+class SkipLockedClaimTests(TransactionTestCase):
+    """Воркер пропускает задачи, заблокированные другим подключением."""
+
+    def test_locked_job_skipped(self):
+        locked = remember.enqueue(value=1)
+        free = remember.enqueue(value=2)
+        holding, release = threading.Event(), threading.Event()
+
+        def hold_lock():
+            try:
+                with transaction.atomic():
+                    list(Job.objects.select_for_update().filter(
+                        id=locked.id
+                    ))
+                    holding.set()
+                    release.wait(10)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        try:
+            self.assertTrue(holding.wait(10))
+            self.assertEqual(
+                [task.id for task in claim('worker', 10)], [free.id]
+            )
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(
+            [task.id for task in claim('worker', 10)], [locked.id]
+        )
+
+
+class PerformanceMiddlewareTests(TestCase):
+    """Заголовок Server-Timing, лог медленных запросов и N+1."""
+
+    RECIPES = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(cls.RECIPES):
+            author = User.objects.create(
+                username=f'author{number}',
+                email=f'author{number}@foodgram.ru',
+                first_name='author', last_name='author',
+            )
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}',
+                image='recipe_image/test.png', text='Описание',
+                cooking_time=10,
+            )
+
+    @staticmethod
+    def recipes_view(request):
+        return JsonResponse(AuthorNameSerializer(
+            Recipe.objects.order_by('id'), many=True
+        ).data, safe=False)
+
+    def call(self):
+        return PerformanceMiddleware(self.recipes_view)(
+            RequestFactory().get('/recipes/')
+        )
+
+    def test_server_timing_off_by_default(self):
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing(self):
+        response = self.client.get('/api/recipes/')
+        self.assertRegex(response['Server-Timing'], (
+            r'^db;dur=[\d.]+;desc="SQL: \d+", serialize;dur=[\d.]+, '
+            r'render;dur=[\d.]+, total;dur=[\d.]+$'
+        ))
+        with self.assertLogs('core.middleware', 'WARNING'):
+            header = self.call()['Server-Timing']
+        self.assertIn(f'desc="SQL: {self.RECIPES + 1}"', header)
+        # Каждый элемент спит 1 мс внутри сериализатора.
+        self.assertGreaterEqual(float(
+            re.search(r'serialize;dur=([\d.]+)', header)[1]
+        ), self.RECIPES)
+
+    def test_duplicate_queries(self):
+        with patch(
+            'core.middleware.query_source', wraps=query_source
+        ) as source, self.assertLogs('core.middleware', 'WARNING') as logs:
+            self.call()
+        events = [
+            json.loads(record.getMessage()) for record in logs.records
+        ]
+        [duplicate] = [
+            event for event in events
+            if event['event'] == 'duplicate_queries'
+        ]
+        self.assertGreaterEqual(self.RECIPES, DUPLICATE_QUERY_THRESHOLD)
+        self.assertEqual(duplicate['count'], self.RECIPES)
+        self.assertEqual(
+            duplicate['source'], 'AuthorNameSerializer.get_author_name'
+        )
+        # Стек обходится на 1, 2, 4, 8 и 16 повторе.
+        self.assertEqual(source.call_count, 5)
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_request(self):
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            self.call()
+        [slow] = [
+            json.loads(record.getMessage()) for record in logs.records
+            if 'slow_request' in record.getMessage()
+        ]
+        self.assertEqual(slow['queries'], self.RECIPES + 1)
+        self.assertEqual(
+            sorted(item['count'] for item in slow['sql']), [1, self.RECIPES]
+        )
+
+
+class ImageVariantsTests(APITestCase):
+    """
+    Загруженная картинка рецепта получает уменьшенные копии WebP и JPEG
+    фоновой задачей; старые копии удаляются при замене картинки.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@foodgram.ru',
+            first_name='author', last_name='author',
+        )
+        cls.tag = Tag.objects.create(name='Обед', slug='lunch')
+        cls.ingredient = Ingredient.objects.create(
+            name='Картофель', measurement_unit='г'
+        )
+
+    def setUp(self):
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_authenticate(self.author)
+
+    def payload(self, image):
+        return {
+            'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 10,
+            'tags': [self.tag.id], 'image': image,
+            'ingredients': [{'id': self.ingredient.id, 'amount': 5}],
+        }
+
+    def run_jobs(self):
+        """Выполняет задачи очереди, как воркер, и удаляет их."""
+        tasks = list(Job.objects.filter(status=Job.QUEUED))
+        for task in tasks:
+            registry[task.name](**task.payload)
+        Job.objects.filter(id__in=[task.id for task in tasks]).delete()
+        return len(tasks)
+
+    def test_variants_generated(self):
+        response = self.client.post(
+            '/api/recipes/', self.payload(image_data((1600, 1200))),
+            format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['image_variants'], {})
+        self.assertEqual(self.run_jobs(), 1)
+        recipe = Recipe.objects.get(id=response.json()['id'])
+        self.assertEqual(set(recipe.image_variants), {
+            name for name, _ in IMAGE_VARIANTS
+        })
+        for name, size in IMAGE_VARIANTS:
+            variant = recipe.image_variants[name]
+            self.assertEqual(
+                (variant['width'], variant['height']),
+                (size, size * 3 // 4)
+            )
+            for extension, image_format in IMAGE_VARIANT_FORMATS:
+                with default_storage.open(variant[extension]) as file:
+                    with Image.open(file) as picture:
+                        self.assertEqual(picture.format, image_format)
+                        self.assertEqual(picture.size, (
+                            variant['width'], variant['height']
+                        ))
+                        if image_format == 'JPEG':
+                            # Прозрачный фон — белый.
+                            red, green, blue = picture.getpixel((0, 0))
+                            self.assertGreater(min(red, green, blue), 240)
+        variants = self.client.get(
+            f'/api/recipes/{recipe.id}/'
+        ).json()['image_variants']
+        self.assertTrue(variants['thumbnail']['webp'].startswith('http://'))
+
+    def test_replaced_image_variants_deleted(self):
+        response = self.client.post(
+            '/api/recipes/', self.payload(image_data((400, 400))),
+            format='json'
+        )
+        self.run_jobs()
+        recipe = Recipe.objects.get(id=response.json()['id'])
+        old_files = [
+            variant[extension]
+            for variant in recipe.image_variants.values()
+            for extension, _ in IMAGE_VARIANT_FORMATS
+        ]
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/',
+            self.payload(image_data((200, 100), 'RGB', (0, 0, 255))),
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.run_jobs(), 1)
+        recipe.refresh_from_db()
+        # Картинка меньше копии не увеличивается.
+        self.assertEqual(
+            (recipe.image_variants['thumbnail']['width'],
+             recipe.image_variants['thumbnail']['height']),
+            (200, 100)
+        )
+        for path in old_files:
+            self.assertFalse(default_storage.exists(path), path)
+
+    def test_too_many_pixels_rejected(self):
+        with patch('api.serializers.IMAGE_MAX_PIXELS', 100 * 100):
+            response = self.client.post(
+                '/api/recipes/', self.payload(image_data((101, 100))),
+                format='json'
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.json())
+        self.assertFalse(Job.objects.exists())
+
+
+def database_copy(database, **changes):
+    """Настройки БД database с изменениями changes для ConnectionHandler."""
+    return {
+        **database, **changes,
+        'OPTIONS': {**database['OPTIONS'], **changes.get('OPTIONS', {})},
+    }
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Настройки подключения SQLite.')
+class SqliteConnectionTests(TestCase):
+    """
+    Подключения к файлу SQLite с настройками DATABASES: прагмы при
+    каждом подключении, WAL и блокировка записи в начале транзакции.
+    """
+
+    PRAGMAS = {
+        'journal_mode': 'wal',
+        'synchronous': 1,
+        'cache_size': -20000,
+        'mmap_size': 134217728,
+        'temp_store': 2,
+    }
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        database = database_copy(
+            settings.DATABASES['default'], NAME=f'{directory.name}/db.sqlite3'
+        )
+        self.connections = ConnectionHandler({
+            'default': database,
+            'second': database_copy(database, OPTIONS={'timeout': 0.1}),
+        })
+        self.addCleanup(self.connections.close_all)
+
+    def pragmas(self, alias):
+        with self.connections[alias].cursor() as cursor:
+            values = {}
+            for name in self.PRAGMAS:
+                cursor.execute(f'PRAGMA {name}')
+                values[name] = cursor.fetchone()[0]
+        return values
+
+    def test_pragmas_on_connect(self):
+        self.assertEqual(self.pragmas('default'), self.PRAGMAS)
+        self.connections['default'].close()
+        self.assertEqual(self.pragmas('default'), self.PRAGMAS)
+
+    def test_immediate_transactions(self):
+        first, second = self.connections['default'], self.connections['second']
+        with first.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id integer)')
+        with patch('django.db.transaction.connections', self.connections):
+            with transaction.atomic():
+                # Блокировку записи первая транзакция берет сразу, еще
+                # ничего не записав: вторая не начнется, а чтение идет.
+                with self.assertRaisesMessage(
+                    OperationalError, 'database is locked'
+                ):
+                    with transaction.atomic(using='second'):
+                        pass
+                with second.cursor() as cursor:
+                    cursor.execute('SELECT count(*) FROM item')
+                    self.assertEqual(cursor.fetchone(), (0,))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Пул psycopg для PostgreSQL.')
+class PostgresPoolTests(TestCase):
+    """Пул psycopg заменяет разорванное подключение при выдаче."""
+
+    def setUp(self):
+        database = database_copy(
+            connection.settings_dict, CONN_MAX_AGE=0, OPTIONS={'pool': {
+                'min_size': 1, 'max_size': 1, 'timeout': 5,
+            }}
+        )
+        self.connections = ConnectionHandler({
+            'default': database_copy(database, OPTIONS={'pool': None}),
+            'pooled': database,
+        })
+        self.pooled = self.connections['pooled']
+        self.addCleanup(self.pooled.close_pool)
+        # django.contrib.postgres ищет подключение по алиасу.
+        connections['pooled'] = self.pooled
+        self.addCleanup(connections.__delitem__, 'pooled')
+
+    def backend_pid(self):
+        with self.pooled.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            pid = cursor.fetchone()[0]
+        # Подключение возвращается в пул.
+        self.pooled.close()
+        return pid
+
+    def terminate(self, pid):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+            for _ in range(100):
+                cursor.execute('SELECT pg_stat_clear_snapshot()')
+                cursor.execute(
+                    'SELECT count(*) FROM pg_stat_activity WHERE pid = %s',
+                    [pid]
+                )
+                if not cursor.fetchone()[0]:
+                    return
+                time.sleep(0.05)
+        self.fail(f'Подключение {pid} не закрылось.')
+
+    def test_reuse_and_health_check(self):
+        self.assertTrue(settings.DATABASES['default']['CONN_HEALTH_CHECKS'])
+        pid = self.backend_pid()
+        self.assertEqual(self.backend_pid(), pid)
+        self.terminate(pid)
+        self.assertNotIn(self.backend_pid(), (pid, None))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Реплика — копия файла SQLite.')
+class ReplicaRouterTests(APITransactionTestCase):
+    """
+    Чтение запросов к API идет с реплики, запись — в основную БД, а
+    клиент после своей записи читает основную БД.
+
+    Реплику копирует sync_sqlite_replicas, которой нужна основная БД
+    вне транзакции, поэтому тест — APITransactionTestCase.
+    """
+
+    def setUp(self):
+        self.reader, self.author = (
+            User.objects.create(
+                username=username, email=f'{username}@foodgram.ru',
+                first_name=username, last_name=username,
+            )
+            for username in ('reader', 'author')
+        )
+        self.token = Token.objects.create(user=self.reader)
+        cache.clear()
+        unavailable.clear()
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f'{directory.name}/replica.sqlite3'
+        with override_settings(DB_REPLICAS=[self.path]):
+            call_command('sync_sqlite_replicas', stdout=StringIO())
+        # Алиас реплики в том виде, в каком его собирают настройки.
+        with patch.dict(
+            os.environ, {'DB_SQLITE': 'True', 'DB_REPLICAS': self.path}
+        ):
+            database = run_module(settings.SETTINGS_MODULE)['DATABASES']
+        self.replica = ConnectionHandler({
+            'default': database['replica1']
+        })['default']
+        connections['replica1'] = self.replica
+        self.addCleanup(connections.__delitem__, 'replica1')
+        self.addCleanup(self.replica.close)
+        patcher = patch(
+            'core.replicas.replica_aliases', return_value=['replica1']
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Пользователь, которого еще нет на отставшей реплике.
+        self.new_user = User.objects.create(
+            username='new', email='new@foodgram.ru',
+            first_name='new', last_name='new',
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_reads_from_replica(self):
+        self.assertEqual(
+            self.client.get(f'/api/users/{self.author.id}/').status_code, 200
+        )
+        self.assertEqual(
+            self.client.get(f'/api/users/{self.new_user.id}/').status_code,
+            404
+        )
+        # Файл реплики открыт только на чтение, поэтому прагмы записи
+        # основной БД подключение к нему не выполняет.
+        with self.replica.cursor() as cursor:
+            with self.assertRaisesMessage(
+                OperationalError, 'readonly database'
+            ):
+                cursor.execute('PRAGMA journal_mode=WAL')
+
+    def test_write_pins_client_to_primary(self):
+        response = self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, following=self.author
+        ).exists())
+        self.assertFalse(Follow.objects.using('replica1').exists())
+        self.assertEqual(
+            self.client.get(f'/api/users/{self.new_user.id}/').status_code,
+            200
+        )
+        # Другие клиенты по-прежнему читают с реплики.
+        self.assertEqual(
+            APIClient().get(f'/api/users/{self.new_user.id}/').status_code,
+            404
+        )
+        with patch('core.replicas.cache.get', return_value=None):
+            self.assertEqual(self.client.get(
+                f'/api/users/{self.new_user.id}/'
+            ).status_code, 404)
+
+    def test_unavailable_replica(self):
+        self.replica.close()
+        self.replica.settings_dict['NAME'] = (
+            f'file:{self.path}.missing?mode=ro'
+        )
+        with self.assertLogs('core.replicas', 'WARNING') as logs:
+            self.assertEqual(available_replica(), 'default')
+        self.assertIn('replica_unavailable', logs.output[0])
+        self.assertIn('replica1', unavailable)
+        # До истечения REPLICA_RETRY_TIMEOUT реплика не проверяется.
+        with self.assertNoLogs('core.replicas'):
+            self.assertEqual(available_replica(), 'default')
+        self.assertEqual(
+            self.client.get(f'/api/users/{self.new_user.id}/').status_code,
+            200
+        )
@@ -1,12 +1,15 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
-from django.db.models import Count
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
 
 from .models import (
     Favorite, Ingredient, IngredientRecipe, Recipe, ShoppingCart, Tag
 )
+from .search import index_recipes
+from .selections import selections_changed
+from .shopping_cart import add_recipe_to_totals, subtract_recipe_from_totals
+from core.counters import change_counters_by_pk
 
 User = get_user_model()
 
@@ -16,9 +19,12 @@ class FavoriteInline(admin.TabularInline):
 
     model = Favorite
     extra = 0
-    readonly_fields = ('user',)
+    readonly_fields = ('user', 'recipe')
     can_delete = False
 
+    def has_add_permission(self, request, obj=None):
+        return False
+
 
 class IngredientsResource(resources.ModelResource):
     """Ресурс для загрузки в модель Ingredients."""
@@ -59,27 +65,39 @@ class RecipeIngredientInline(admin.TabularInline):
 class RecipeAdmin(ImportExportModelAdmin):
     """Административный интерфейс для управления рецептами."""
 
-    list_display = ('name', 'author', 'favorites_count')
+    list_display = (
+        'name', 'author', 'favorites_count', 'shopping_carts_count'
+    )
     list_display_links = ('name', 'author')
     search_fields = (
         'name',
         'author__username', 'author__email')
     list_filter = ('tags',)
-    readonly_fields = ('favorites_count_display',)
+    readonly_fields = ('favorites_count', 'shopping_carts_count')
     filter_horizontal = ('tags',)
     inlines = (RecipeIngredientInline,)
 
-    @admin.display(description='В избранном', ordering='favorites_count')
-    def favorites_count(self, recipe):
-        return getattr(recipe, 'favorites_count', 0)
-
-    @admin.display(description='Общее число добавлений в избранное')
-    def favorites_count_display(self, recipe):
-        return recipe.favorites.count()
-
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        return queryset.annotate(favorites_count=Count('in_favorites'))
+    def save_model(self, request, obj, form, change):
+        """Учитывает рецепт в счетчике рецептов автора."""
+        super().save_model(request, obj, form, change)
+        changes = {}
+        if change and 'author' in form.changed_data:
+            changes[form.initial['author'], 'recipes_count'] = -1
+        if not change or changes:
+            changes[obj.author_id, 'recipes_count'] = 1
+        change_counters_by_pk(User, changes)
+
+    def save_related(self, request, form, formsets, change):
+        """
+        Заменяет вклад рецепта в списки покупок и обновляет поисковый
+        документ после сохранения тегов и состава.
+        """
+        if change:
+            subtract_recipe_from_totals(form.instance.id)
+        super().save_related(request, form, formsets, change)
+        if change:
+            add_recipe_to_totals(form.instance.id)
+        index_recipes([form.instance.id])
 
 
 class BaseSelectionAdmin(ImportExportModelAdmin):
@@ -87,6 +105,30 @@ class BaseSelectionAdmin(ImportExportModelAdmin):
     list_display = ('user', 'recipe')
     search_fields = ('user__username', 'recipe__name')
 
+    def save_model(self, request, obj, form, change):
+        """Переносит счетчики и суммы со старой связи на новую."""
+        super().save_model(request, obj, form, change)
+        if change and not form.changed_data:
+            return
+        if change:
+            selections_changed(
+                self.model, form.initial['user'],
+                removed=(form.initial['recipe'],)
+            )
+        selections_changed(self.model, obj.user_id, added=(obj.recipe_id,))
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        selections_changed(self.model, obj.user_id, removed=(obj.recipe_id,))
+
+    def delete_queryset(self, request, queryset):
+        removed = {}
+        for user_id, recipe_id in queryset.values_list('user', 'recipe'):
+            removed.setdefault(user_id, []).append(recipe_id)
+        super().delete_queryset(request, queryset)
+        for user_id, recipe_ids in removed.items():
+            selections_changed(self.model, user_id, removed=recipe_ids)
+
 
 @admin.register(Favorite)
 class FavoriteAdmin(BaseSelectionAdmin):
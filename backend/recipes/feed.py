@@ -0,0 +1,41 @@
+"""
+Лента рецептов авторов, на которых подписан пользователь.
+
+Обычно лента — один запрос с JOIN Follow -> Recipe по индексу
+(author, -pub_date). Для пользователей с тысячами подписок лента
+собирается k-way слиянием: авторы обрабатываются пачками, для каждой
+пачки одним запросом без JOIN с подписками (author_id IN (...), после
+позиции курсора, ORDER BY ... LIMIT limit) берутся limit первых
+рецептов, а отсортированные списки сливаются heapq.merge с лучшими
+limit рецептами предыдущих пачек. В памяти одновременно не больше
+2 * limit строк.
+"""
+import heapq
+from itertools import islice
+from operator import itemgetter
+
+
+def merge_latest_ids(queryset, author_ids, ordering, limit, chunk_size):
+    """
+    Возвращает id первых limit рецептов queryset авторов author_ids.
+
+    queryset — рецепты без ограничения по подпискам, уже отфильтрованные
+    по позиции курсора; ordering — поля порядка, все в одном направлении
+    (например, ('-pub_date', '-id')).
+    """
+    names = [name.lstrip('-') for name in ordering]
+    descending = {name.startswith('-') for name in ordering}
+    if len(descending) != 1:
+        raise ValueError('Поля ordering должны быть в одном направлении.')
+    descending = descending.pop()
+    key = itemgetter(*range(len(names)))
+
+    best = []
+    for start in range(0, len(author_ids), chunk_size):
+        rows = queryset.filter(
+            author_id__in=author_ids[start:start + chunk_size]
+        ).order_by(*ordering).values_list(*names)[:limit]
+        best = list(islice(heapq.merge(
+            best, rows, key=key, reverse=descending
+        ), limit))
+    return [row[names.index('id')] for row in best]
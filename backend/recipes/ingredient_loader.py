@@ -0,0 +1,141 @@
+"""
+Потоковая загрузка справочника ингредиентов.
+
+Файл читается построчно (CSV, JSON Lines) или по объектам (массив JSON),
+строки собираются в пачки и загружаются с обновлением существующих
+ингредиентов по name:
+- PostgreSQL: COPY во временную таблицу и
+  INSERT ... SELECT ... ON CONFLICT (name) DO UPDATE;
+- остальные БД: bulk_create(update_conflicts=True) новых и измененных
+  строк пачки.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.db import connection, transaction
+
+from .models import Ingredient
+
+
+JSON_SEPARATORS = frozenset(' \t\r\n[],')
+READ_CHUNK_SIZE = 64 * 1024
+UNIT_MAX_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+
+
+def read_csv(file):
+    """Строки CSV (name, measurement_unit); заголовок пропускается."""
+    for row in csv.reader(file):
+        if row and [value.strip() for value in row[:2]] != [
+            'name', 'measurement_unit'
+        ]:
+            yield row[0], row[1] if len(row) > 1 else ''
+
+
+def read_json(file):
+    """
+    Объекты {name, measurement_unit} из массива JSON или JSON Lines.
+
+    Массив разбирается по одному объекту (JSONDecoder.raw_decode),
+    не загружая файл целиком.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position = '', 0
+    while True:
+        while position < len(buffer) and buffer[position] in JSON_SEPARATORS:
+            position += 1
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except ValueError:
+            # Объект оборвался на границе чтения (или буфер пуст).
+            chunk = file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                if buffer[position:].strip():
+                    raise
+                return
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield item.get('name', ''), item.get('measurement_unit', '')
+
+
+def clean_rows(rows, errors):
+    """
+    Нормализует строки (name, measurement_unit).
+
+    Некорректные строки пропускаются и добавляются в errors.
+    """
+    for number, (name, unit) in enumerate(rows, 1):
+        name, unit = str(name).strip(), str(unit).strip()
+        if not name or not unit or len(unit) > UNIT_MAX_LENGTH:
+            errors.append((number, name, unit))
+            continue
+        yield name, unit
+
+
+def batched(rows, batch_size):
+    """Пачки по batch_size строк; повторы name в пачке — последний."""
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        yield dict(batch)
+
+
+def diff_batch(batch):
+    """Делит пачку на новые и измененные ингредиенты: (new, changed)."""
+    existing = dict(Ingredient.objects.filter(
+        name__in=batch
+    ).values_list('name', 'measurement_unit'))
+    new = {name: unit for name, unit in batch.items() if name not in existing}
+    changed = {
+        name: (existing[name], unit) for name, unit in batch.items()
+        if name in existing and existing[name] != unit
+    }
+    return new, changed
+
+
+@transaction.atomic
+def upsert_batch(batch):
+    """Загружает пачку {name: measurement_unit}; возвращает (new, changed)."""
+    if connection.vendor == 'postgresql':
+        return _copy_upsert(batch)
+    new, changed = diff_batch(batch)
+    Ingredient.objects.bulk_create(
+        (
+            Ingredient(name=name, measurement_unit=unit)
+            for name, unit in {
+                **new, **{name: unit for name, (_, unit) in changed.items()}
+            }.items()
+        ),
+        update_conflicts=True,
+        unique_fields=('name',),
+        update_fields=('measurement_unit',),
+    )
+    return len(new), len(changed)
+
+
+def _copy_upsert(batch):
+    table = connection.ops.quote_name(Ingredient._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMP TABLE IF NOT EXISTS ingredient_staging '
+            f'(name text, measurement_unit varchar({UNIT_MAX_LENGTH})) '
+            f'ON COMMIT DELETE ROWS'
+        )
+        # Строки прошлой пачки остаются, если загрузка идет внутри
+        # внешней транзакции (например, в тестах).
+        cursor.execute('TRUNCATE ingredient_staging')
+        with cursor.copy(
+            'COPY ingredient_staging (name, measurement_unit) FROM STDIN'
+        ) as copy:
+            for row in batch.items():
+                copy.write_row(row)
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit) '
+            f'SELECT name, measurement_unit FROM ingredient_staging '
+            f'ON CONFLICT (name) DO UPDATE '
+            f'SET measurement_unit = excluded.measurement_unit '
+            f'WHERE {table}.measurement_unit '
+            f'IS DISTINCT FROM excluded.measurement_unit '
+            f'RETURNING xmax = 0'
+        )
+        inserted = [row[0] for row in cursor.fetchall()]
+    return inserted.count(True), inserted.count(False)
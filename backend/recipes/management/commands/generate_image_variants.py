@@ -0,0 +1,49 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from core.images import refresh_variants
+from recipes.models import Recipe
+
+
+User = get_user_model()
+
+IMAGES = (
+    (Recipe, 'image', 'image_variants'),
+    (User, 'avatar', 'avatar_variants'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает уменьшенные копии картинок рецептов и аватаров, '
+        'загруженных в обход API (админка, старые записи).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать копии для всех изображений.',
+        )
+
+    def handle(self, *args, **options):
+        for model, image_field, variants_field in IMAGES:
+            queryset = model.objects.exclude(
+                **{image_field: ''}
+            ).exclude(**{f'{image_field}__isnull': True})
+            if not options['all']:
+                queryset = queryset.filter(**{variants_field: {}})
+            done = failed = 0
+            for instance in queryset.iterator():
+                try:
+                    refresh_variants(instance, image_field, variants_field)
+                except OSError as error:
+                    failed += 1
+                    self.stderr.write(f'{model._meta.label} {instance.pk}: '
+                                      f'{error}')
+                else:
+                    done += 1
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: обработано {done}, '
+                f'ошибок {failed}'
+            )
@@ -0,0 +1,106 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.catalog import bump_catalog_version
+from recipes.ingredient_loader import (
+    batched, clean_rows, diff_batch, read_csv, read_json, upsert_batch
+)
+from recipes.models import Ingredient
+
+
+READERS = {'csv': read_csv, 'json': read_json, 'jsonl': read_json}
+MAX_REPORTED_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты из CSV (name,measurement_unit) или JSON '
+        'потоком, пачками, обновляя существующие по названию.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу CSV/JSON/JSONL.')
+        parser.add_argument(
+            '--format',
+            choices=sorted(READERS),
+            help='Формат файла (по умолчанию — по расширению).',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Строк в одной транзакции (по умолчанию 5000).',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help=(
+                'Только сравнить файл со справочником, без записи; '
+                'с -v 2 выводит каждое изменение.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(
+                f'Неизвестный формат {file_format!r}, '
+                f'укажите --format {"/".join(sorted(READERS))}.'
+            )
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше 0.')
+        dry_run = options['dry_run']
+        verbosity = options['verbosity']
+
+        errors = []
+        processed = created = updated = 0
+        started = time.perf_counter()
+        try:
+            with path.open(encoding='utf-8', newline='') as file:
+                rows = clean_rows(READERS[file_format](file), errors)
+                for batch in batched(rows, options['batch_size']):
+                    if dry_run:
+                        new, changed = diff_batch(batch)
+                        if verbosity > 1:
+                            self._write_diff(new, changed)
+                        batch_created, batch_updated = len(new), len(changed)
+                    else:
+                        batch_created, batch_updated = upsert_batch(batch)
+                    processed += len(batch)
+                    created += batch_created
+                    updated += batch_updated
+                    if verbosity > 0:
+                        elapsed = time.perf_counter() - started
+                        self.stdout.write(
+                            f'Обработано {processed} строк '
+                            f'({processed / elapsed:.0f} строк/с)'
+                        )
+        except OSError as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+        except ValueError as error:
+            raise CommandError(f'Ошибка разбора {path}: {error}')
+        finally:
+            # Пачки до ошибки уже сохранены.
+            if not dry_run and (created or updated):
+                bump_catalog_version(Ingredient)
+
+        for number, name, unit in errors[:MAX_REPORTED_ERRORS]:
+            self.stderr.write(
+                f'Запись {number} пропущена: {name!r}, {unit!r}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Будет добавлено" if dry_run else "Добавлено"} {created}, '
+            f'{"будет обновлено" if dry_run else "обновлено"} {updated}, '
+            f'без изменений {processed - created - updated}, '
+            f'пропущено {len(errors)} '
+            f'за {time.perf_counter() - started:.1f} с.'
+        ))
+
+    def _write_diff(self, new, changed):
+        for name, unit in new.items():
+            self.stdout.write(f'+ {name} ({unit})')
+        for name, (old_unit, unit) in changed.items():
+            self.stdout.write(f'~ {name}: {old_unit} -> {unit}')
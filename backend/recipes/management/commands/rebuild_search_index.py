@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from core.constants import SEARCH_INDEX_BATCH_SIZE
+from recipes.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Перестраивает полнотекстовый индекс рецептов: после загрузки '
+        'данных в обход ORM.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=SEARCH_INDEX_BATCH_SIZE,
+            help=(
+                'Число рецептов в одной транзакции '
+                f'(по умолчанию {SEARCH_INDEX_BATCH_SIZE}).'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        indexed = 0
+        for count in rebuild_index(batch_size=options['batch_size']):
+            indexed += count
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Проиндексировано {indexed}')
+        self.stdout.write(f'Рецептов в индексе: {indexed}')
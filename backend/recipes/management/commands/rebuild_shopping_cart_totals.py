@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.shopping_cart import find_totals_mismatches, rebuild_totals
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает суммы ингредиентов списков покупок '
+        '(ShoppingCartIngredient) и сверяет их с рецептами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сверить таблицу с рецептами, без пересчета.',
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            with transaction.atomic():
+                rows = rebuild_totals()
+            self.stdout.write(f'Пересчитано строк: {rows}')
+
+        mismatches = find_totals_mismatches()
+        for user_id, ingredient_id, stored, live in mismatches[:20]:
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'в таблице {stored}, по рецептам {live}'
+            )
+        if mismatches:
+            raise CommandError(f'Расхождений: {len(mismatches)}')
+        self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
@@ -0,0 +1,61 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from core.counters import reconcile_counters
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow
+
+
+User = get_user_model()
+
+COUNTERS = (
+    (Recipe, {
+        'favorites_count': (Favorite, 'recipe'),
+        'shopping_carts_count': (ShoppingCart, 'recipe'),
+    }),
+    (User, {
+        'recipes_count': (Recipe, 'author'),
+        'followers_count': (Follow, 'following'),
+        'following_count': (Follow, 'user'),
+    }),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет денормализованные счетчики рецептов и пользователей '
+        'с фактическим числом записей и исправляет расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Число записей в одной транзакции (по умолчанию 1000).',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать число расхождений, без исправления.',
+        )
+
+    def handle(self, *args, **options):
+        for model, counters in COUNTERS:
+            fixed = 0
+            for last_pk, changed in reconcile_counters(
+                model, counters,
+                batch_size=options['batch_size'],
+                dry_run=options['dry_run'],
+            ):
+                fixed += changed
+                if options['verbosity'] > 1:
+                    self.stdout.write(
+                        f'{model._meta.label}: до pk={last_pk}, '
+                        f'расхождений {fixed}'
+                    )
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: '
+                f'{"найдено" if options["dry_run"] else "исправлено"} '
+                f'расхождений {fixed}'
+            )
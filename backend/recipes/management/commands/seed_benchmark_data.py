@@ -0,0 +1,139 @@
+import io
+import random
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import synthetic_data
+from recipes.models import Favorite, ShoppingCart
+
+
+User = get_user_model()
+
+DEFAULT_INGREDIENTS = settings.BASE_DIR.parent / 'data' / 'ingredients.csv'
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет БД синтетическими пользователями, рецептами, '
+        'подписками, избранным и списками покупок с популярностью '
+        'по Ципфу — для нагрузочных замеров.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--follows', type=float, default=10,
+            help='Подписок на пользователя в среднем (по умолчанию 10).',
+        )
+        parser.add_argument(
+            '--favorites', type=float, default=20,
+            help='Рецептов в избранном в среднем (по умолчанию 20).',
+        )
+        parser.add_argument(
+            '--cart', type=float, default=5,
+            help='Рецептов в списке покупок в среднем (по умолчанию 5).',
+        )
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Показатель распределения Ципфа (по умолчанию 1.1).',
+        )
+        parser.add_argument(
+            '--ingredients-file', type=Path, default=DEFAULT_INGREDIENTS,
+            help='CSV справочника ингредиентов (по умолчанию data/).',
+        )
+        parser.add_argument(
+            '--prefix', default='bench',
+            help='Префикс имен создаваемых пользователей.',
+        )
+        parser.add_argument('--password', default='benchmark-password')
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Сначала удалить пользователей с этим префиксом '
+                 'и все их данные.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        existing = User.objects.filter(username__startswith=prefix)
+        if options['clear']:
+            existing.delete()
+        elif existing.exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix!r} уже есть: '
+                'укажите --clear или другой --prefix.'
+            )
+        if options['users'] < 2:
+            raise CommandError('--users должно быть не меньше 2.')
+        rng = random.Random(options['seed'])
+        self.verbosity = options['verbosity']
+        batch_size = options['batch_size']
+        self.started = time.perf_counter()
+
+        call_command(
+            'load_ingredients', options['ingredients_file'],
+            verbosity=0, stdout=io.StringIO(),
+        )
+        catalog = synthetic_data.ingredient_catalog()
+        if not catalog:
+            raise CommandError('Справочник ингредиентов пуст.')
+        rng.shuffle(catalog)
+        self._report('Ингредиентов', len(catalog))
+
+        tags = synthetic_data.create_tags()
+        users = synthetic_data.create_users(
+            options['users'], prefix, options['password'], batch_size
+        )
+        self._report('Пользователей', len(users))
+
+        # Популярность не зависит от порядка id.
+        authors = synthetic_data.Zipf(
+            rng.sample(users, len(users)), options['zipf'], rng
+        )
+        recipes = synthetic_data.create_recipes(
+            options['recipes'],
+            authors,
+            synthetic_data.Zipf(catalog, options['zipf'], rng),
+            synthetic_data.Zipf(rng.sample(tags, len(tags)), 1, rng),
+            rng,
+            batch_size,
+        )
+        self._report('Рецептов', len(recipes))
+
+        popular = synthetic_data.Zipf(
+            rng.sample(recipes, len(recipes)), options['zipf'], rng
+        )
+        self._report('Подписок', synthetic_data.create_follows(
+            users, authors, options['follows'], rng, batch_size
+        ))
+        for label, model, mean in (
+            ('В избранном', Favorite, options['favorites']),
+            ('В списках покупок', ShoppingCart, options['cart']),
+        ):
+            self._report(label, synthetic_data.create_selections(
+                model, users, popular, mean, rng, batch_size
+            ))
+
+        for command in (
+            'reconcile_counters', 'rebuild_shopping_cart_totals',
+            'rebuild_search_index',
+        ):
+            call_command(command, verbosity=0, stdout=io.StringIO())
+        self.stdout.write(self.style.SUCCESS(
+            'Счетчики, суммы списков покупок и поисковый индекс '
+            f'пересчитаны за {time.perf_counter() - self.started:.1f} с.'
+        ))
+
+    def _report(self, label, count):
+        if self.verbosity > 0:
+            self.stdout.write(
+                f'{label}: {count} '
+                f'({time.perf_counter() - self.started:.1f} с)'
+            )
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+# istartswith в SQLite — это LIKE без учета регистра: индекс по name
+# для него не годится, нужен индекс с NOCASE. В PostgreSQL тот же
+# поиск (UPPER(name) LIKE) обслуживает GIN-индекс из 0009.
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE INDEX ingredient_name_nocase_idx ON recipes_ingredient '
+            '(name COLLATE NOCASE)'
+        )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS ingredient_name_nocase_idx'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_ingredient_trigram_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
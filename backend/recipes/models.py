@@ -1,22 +1,59 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import (
+    SearchVectorField, TrigramWordSimilarity
+)
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import (
+    Case, Exists, OuterRef, Prefetch, Q, Value, When
+)
+from django.db.models.functions import Upper
 
 from core.constants import (
     ALREADY_ADDED, ALREADY_ADDED_INGREDIENT, COOKING_TIME_MIN_VALUE
 )
 from core.text_utils import truncate_with_ellipsis
+from users.models import Follow
 
 
 User = get_user_model()
 
 
+class IngredientQuerySet(models.QuerySet):
+    """QuerySet ингредиентов."""
+
+    def fuzzy_search(self, text):
+        """
+        Ингредиенты, похожие на text (только PostgreSQL, pg_trgm).
+
+        Сначала начинающиеся с text, затем содержащие его, затем похожие
+        по триграммам — по убыванию word_similarity (сходства text с
+        частью названия, так слово с опечаткой находит название из
+        нескольких слов). Все условия — по
+        UPPER(name), для них есть GIN-индекс ingredient_name_trgm_idx.
+        """
+        text = text.upper()
+        return self.annotate(upper_name=Upper('name')).filter(
+            Q(upper_name__contains=text)
+            | Q(upper_name__trigram_word_similar=text)
+        ).annotate(
+            match_rank=Case(
+                When(upper_name__startswith=text, then=Value(0)),
+                When(upper_name__contains=text, then=Value(1)),
+                default=Value(2),
+            ),
+            similarity=TrigramWordSimilarity(text, 'upper_name'),
+        ).order_by('match_rank', '-similarity', 'name')
+
+
 class Ingredient(models.Model):
     """Модель ингредиентов."""
 
     name = models.TextField('Название ингредиента', unique=True)
     measurement_unit = models.CharField('Единица измерения', max_length=20)
 
+    objects = IngredientQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'ингредиент'
         verbose_name_plural = 'ингредиенты'
@@ -43,6 +80,52 @@ class Tag(models.Model):
         return truncate_with_ellipsis(self.name)
 
 
+class RecipeQuerySet(models.QuerySet):
+    """QuerySet рецептов с подготовкой данных для сериализатора."""
+
+    def with_user_flags(self, user):
+        """
+        Аннотирует флаги текущего пользователя.
+
+        - is_favorited: рецепт в избранном у user
+        - is_in_shopping_cart: рецепт в списке покупок user
+        - author_is_subscribed: user подписан на автора рецепта
+        """
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                author_is_subscribed=Value(False),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            author_is_subscribed=Exists(Follow.objects.filter(
+                user=user, following=OuterRef('author')
+            )),
+        )
+
+    def feed(self, user):
+        """Рецепты авторов, на которых подписан user."""
+        return self.filter(author__followers__user=user)
+
+    def for_user(self, user):
+        """Рецепты с автором, тегами, ингредиентами и флагами user."""
+        return self.select_related('author').defer(
+            'search_vector'
+        ).prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.all()),
+            Prefetch(
+                'ingredient_recipe',
+                queryset=IngredientRecipe.objects.select_related('ingredient')
+            ),
+        ).with_user_flags(user)
+
+
 class Recipe(models.Model):
     """Модель рецептов."""
 
@@ -53,6 +136,10 @@ class Recipe(models.Model):
     )
     name = models.CharField('Название', max_length=256)
     image = models.ImageField('Картинка', upload_to='recipe_image/')
+    image_variants = models.JSONField(
+        'Уменьшенные копии картинки', default=dict, blank=True,
+        editable=False
+    )
     text = models.TextField('Текстовое описание')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -73,12 +160,31 @@ class Recipe(models.Model):
         help_text='Время приготовления в минутах.'
     )
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False
+    )
+    shopping_carts_count = models.PositiveIntegerField(
+        'В списках покупок', default=0, editable=False
+    )
+    # Документ полнотекстового поиска в PostgreSQL (см. recipes.search).
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
         default_related_name = 'recipes'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return truncate_with_ellipsis(self.name)
@@ -120,8 +226,11 @@ class AbstractSelection(models.Model):
 
     - user (FK): Пользователь, который добавляет рецпт в избранное.
     - recipe (FK): Рецепт, который добавляют в избранное/список покупок.
+    - recipe_counter: счетчик рецепта, который меняется вместе с записью.
     """
 
+    recipe_counter = None
+
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -149,6 +258,8 @@ class AbstractSelection(models.Model):
 class Favorite(AbstractSelection):
     """Модель избранных рецептов пользователя."""
 
+    recipe_counter = 'favorites_count'
+
     class Meta(AbstractSelection.Meta):
         verbose_name = 'избранное'
         verbose_name_plural = 'Избранные рецепты'
@@ -164,6 +275,8 @@ class Favorite(AbstractSelection):
 class ShoppingCart(AbstractSelection):
     """Модель покупок для рецептов."""
 
+    recipe_counter = 'shopping_carts_count'
+
     class Meta(AbstractSelection.Meta):
         verbose_name = 'список покупок'
         verbose_name_plural = 'Cписок покупок'
@@ -174,3 +287,41 @@ class ShoppingCart(AbstractSelection):
                 violation_error_message=ALREADY_ADDED
             )
         ]
+
+
+class ShoppingCartIngredient(models.Model):
+    """
+    Суммарное количество ингредиента в списке покупок пользователя.
+
+    Поддерживается при добавлении/удалении рецепта из списка покупок и
+    при изменении ингредиентов рецепта (см. recipes.shopping_cart).
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_ingredients',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='in_shopping_carts',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.PositiveIntegerField('Общее количество')
+
+    class Meta:
+        verbose_name = 'ингредиент списка покупок'
+        verbose_name_plural = 'Ингредиенты списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='shopping_cart_ingredient_unique'
+            )
+        ]
+
+    def __str__(self) -> str:
+        return truncate_with_ellipsis(
+            f'{self.user.username}: {self.ingredient.name}'
+        )
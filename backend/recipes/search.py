@@ -0,0 +1,207 @@
+"""
+Полнотекстовый поиск рецептов.
+
+Документ рецепта — название (вес A), теги (B), названия ингредиентов
+(C) и описание (D).
+
+- PostgreSQL: хранимая колонка Recipe.search_vector (tsvector,
+  конфигурация SEARCH_CONFIG) с GIN-индексом; запрос разбирается
+  websearch_to_tsquery, релевантность — ts_rank.
+- SQLite: теневая таблица FTS5 (rowid = id рецепта); слова запроса
+  ищутся по префиксу (стемминга нет), релевантность — bm25 с теми же
+  весами полей.
+
+Индекс обновляется явно там, где меняются рецепты (API, админка):
+index_recipes() после записи; unindex_recipes() вызывает обработчик
+удаления рецепта (recipes.signals), в том числе каскадного. Рецепты
+переименованных и удаленных тегов и ингредиентов переиндексируют
+обработчики recipes.signals; после загрузки данных в обход ORM есть
+rebuild_search_index.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.expressions import RawSQL
+
+from core.constants import SEARCH_CONFIG, SEARCH_INDEX_BATCH_SIZE
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+
+
+FTS_TABLE = 'recipes_recipe_fts'
+# Веса полей name, tags, ingredients, text — как у ts_rank для A-D.
+FTS_WEIGHTS = (1.0, 0.4, 0.2, 0.1)
+
+WORD = re.compile(r'\w+')
+
+
+def _names_sql(aggregate, table, through, column):
+    """Подзапрос: названия из table, связанные с рецептом r, через пробел."""
+    return (
+        f'COALESCE((SELECT {aggregate}(x.name, \' \') '
+        f'FROM {table} x JOIN {through} xr ON xr.{column} = x.id '
+        f'WHERE xr.recipe_id = r.id), \'\')'
+    )
+
+
+def _documents_sql(aggregate):
+    """Колонки name, tags, ingredients, text документа рецепта r."""
+    tags = Recipe.tags.through
+    return (
+        'r.name',
+        _names_sql(
+            aggregate, Tag._meta.db_table, tags._meta.db_table,
+            tags._meta.get_field('tag').column,
+        ),
+        _names_sql(
+            aggregate, Ingredient._meta.db_table,
+            IngredientRecipe._meta.db_table,
+            IngredientRecipe._meta.get_field('ingredient').column,
+        ),
+        'r.text',
+    )
+
+
+def _recipes_sql(recipe_ids):
+    """Условие WHERE на рецепты r и его параметры (все, если None)."""
+    if recipe_ids is None:
+        return '', []
+    return 'WHERE r.id IN ({})'.format(
+        ', '.join(['%s'] * len(recipe_ids))
+    ), list(recipe_ids)
+
+
+def create_search_index(schema_editor):
+    """Создает индекс для текущей БД и заполняет его (для миграции)."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX recipe_search_vector_idx '
+            f'ON {Recipe._meta.db_table} USING gin (search_vector)'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5('
+            f'name, tags, ingredients, text, '
+            f'tokenize = "unicode61 remove_diacritics 2")'
+        )
+    else:
+        return
+    index_recipes()
+
+
+def drop_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS recipe_search_vector_idx')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def index_recipes(recipe_ids=None):
+    """Пересчитывает документы рецептов recipe_ids (или всех)."""
+    if recipe_ids is not None and not recipe_ids:
+        return
+    where, params = _recipes_sql(recipe_ids)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            name, tags, ingredients, text = _documents_sql('string_agg')
+            cursor.execute(
+                f'UPDATE {Recipe._meta.db_table} r SET search_vector = '
+                + ' || '.join(
+                    f'setweight(to_tsvector(%s::regconfig, {column}), '
+                    f'\'{weight}\')'
+                    for column, weight in (
+                        (name, 'A'), (tags, 'B'),
+                        (ingredients, 'C'), (text, 'D'),
+                    )
+                ) + f' {where}',
+                [SEARCH_CONFIG] * 4 + params,
+            )
+        elif connection.vendor == 'sqlite':
+            if recipe_ids is None:
+                cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            else:
+                cursor.execute(
+                    f'DELETE FROM {FTS_TABLE} '
+                    f'WHERE rowid IN ({", ".join(["%s"] * len(params))})',
+                    params,
+                )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} '
+                f'(rowid, name, tags, ingredients, text) '
+                f'SELECT r.id, {", ".join(_documents_sql("group_concat"))} '
+                f'FROM {Recipe._meta.db_table} r {where}',
+                params,
+            )
+
+
+def unindex_recipes(recipe_ids):
+    """Убирает рецепты из индекса (в PostgreSQL — вместе со строкой)."""
+    if connection.vendor != 'sqlite' or not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} '
+            f'WHERE rowid IN ({", ".join(["%s"] * len(recipe_ids))})',
+            list(recipe_ids),
+        )
+
+
+def rebuild_index(batch_size=SEARCH_INDEX_BATCH_SIZE):
+    """
+    Перестраивает индекс пачками по batch_size рецептов.
+
+    Генератор: после каждой пачки возвращает число проиндексированных
+    рецептов. Пока идет перестроение, поиск продолжает работать по
+    старым документам.
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid NOT IN '
+                f'(SELECT id FROM {Recipe._meta.db_table})'
+            )
+    last_pk = 0
+    while True:
+        ids = list(Recipe.objects.filter(pk__gt=last_pk).order_by(
+            'pk'
+        ).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        with transaction.atomic():
+            index_recipes(ids)
+        last_pk = ids[-1]
+        yield len(ids)
+
+
+def search_recipes(queryset, text):
+    """
+    Рецепты queryset, подходящие под запрос text, по убыванию
+    релевантности (search_rank), затем по дате публикации.
+    """
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(
+            text, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        queryset = queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        )
+    else:
+        words = WORD.findall(text)
+        if not words:
+            return queryset.none()
+        # Слова в кавычках — без операторов FTS5 из пользовательского ввода.
+        match = ' '.join(f'"{word}"*' for word in words)
+        queryset = queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (match,),
+        )).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, '
+            f'{", ".join(map(str, FTS_WEIGHTS))}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s '
+            f'AND rowid = {Recipe._meta.db_table}.id',
+            (match,),
+        ))
+    return queryset.order_by('-search_rank', '-pub_date', '-id')
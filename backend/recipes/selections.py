@@ -0,0 +1,28 @@
+"""
+Учет добавления рецептов в избранное и список покупок.
+
+Вместе со связью Favorite/ShoppingCart меняются счетчик рецепта
+(recipe_counter) и, для списка покупок, суммы ингредиентов
+(recipes.shopping_cart). selections_changed() вызывают и API, и админка
+в той же транзакции, что и запись связи; удаление связей каскадом от
+рецепта или пользователя учитывают обработчики recipes.signals.
+"""
+from .models import Recipe, ShoppingCart
+from .shopping_cart import add_recipes_to_totals, subtract_recipes_from_totals
+from core.counters import change_counters_by_pk
+
+
+def selections_changed(model, user_id, added=(), removed=()):
+    """
+    Учитывает добавленные (added) и удаленные (removed) связи model
+    пользователя user_id с рецептами; вызывается после записи связей.
+    """
+    added = [recipe_id for recipe_id in added if recipe_id is not None]
+    removed = [recipe_id for recipe_id in removed if recipe_id is not None]
+    change_counters_by_pk(Recipe, {
+        **{(recipe_id, model.recipe_counter): 1 for recipe_id in added},
+        **{(recipe_id, model.recipe_counter): -1 for recipe_id in removed},
+    })
+    if model is ShoppingCart:
+        add_recipes_to_totals(added, user_id)
+        subtract_recipes_from_totals(removed, user_id)
@@ -0,0 +1,149 @@
+"""
+Поддержка таблицы ShoppingCartIngredient.
+
+Суммы ингредиентов в списках покупок меняются на вклад одного рецепта:
+при добавлении рецепта в список покупок, при удалении из него и при
+изменении ингредиентов рецепта (вычитание старого вклада, затем
+добавление нового). Функции нужно вызывать в той же транзакции, что и
+изменение ShoppingCart/IngredientRecipe.
+"""
+from django.db import connection
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Greatest
+
+from .models import IngredientRecipe, ShoppingCart, ShoppingCartIngredient
+
+
+def _live_totals():
+    """Суммы ингредиентов по спискам покупок, посчитанные по рецептам."""
+    return IngredientRecipe.objects.values_list(
+        'recipe__in_shoppingcart__user', 'ingredient'
+    ).annotate(Sum('amount')).order_by()
+
+
+def add_recipes_to_totals(recipe_ids, user_id=None):
+    """
+    Добавляет вклад рецептов recipe_ids в суммы списков покупок.
+
+    Если user_id не указан — всем пользователям, у кого рецепт в списке.
+    Выполняется одним INSERT ... SELECT ... ON CONFLICT DO UPDATE.
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    quote = connection.ops.quote_name
+    totals = quote(ShoppingCartIngredient._meta.db_table)
+    params = recipe_ids
+    user_filter = ''
+    if user_id is not None:
+        user_filter = 'AND cart.user_id = %s'
+        params = [*recipe_ids, user_id]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {totals} (user_id, ingredient_id, total_amount) '
+            f'SELECT cart.user_id, item.ingredient_id, SUM(item.amount) '
+            f'FROM {quote(ShoppingCart._meta.db_table)} cart '
+            f'JOIN {quote(IngredientRecipe._meta.db_table)} item '
+            f'ON item.recipe_id = cart.recipe_id '
+            f'WHERE cart.recipe_id IN ({", ".join(["%s"] * len(recipe_ids))}) '
+            f'{user_filter} '
+            f'GROUP BY cart.user_id, item.ingredient_id '
+            f'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+            f'SET total_amount = {totals}.total_amount '
+            f'+ excluded.total_amount',
+            params
+        )
+
+
+def add_recipe_to_totals(recipe_id, user_id=None):
+    """
+    Добавляет вклад рецепта в суммы списков покупок.
+
+    Если user_id не указан — всем пользователям, у кого рецепт в списке.
+    """
+    add_recipes_to_totals((recipe_id,), user_id)
+
+
+def subtract_recipe_from_totals(recipe_id, user_id=None):
+    """
+    Вычитает вклад рецепта из сумм списков покупок.
+
+    Если user_id не указан — у всех пользователей, у кого рецепт в списке.
+    Нулевые суммы удаляются.
+    """
+    users = ShoppingCart.objects.filter(recipe=recipe_id).values('user')
+    if user_id is not None:
+        users = (user_id,)
+    _subtract_from_totals((recipe_id,), users)
+
+
+def subtract_recipes_from_totals(recipe_ids, user_id):
+    """
+    Вычитает вклад рецептов recipe_ids из сумм списка покупок user_id.
+
+    Нулевые суммы удаляются.
+    """
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        _subtract_from_totals(recipe_ids, (user_id,))
+
+
+def _subtract_from_totals(recipe_ids, users):
+    items = IngredientRecipe.objects.filter(recipe__in=recipe_ids)
+    totals = ShoppingCartIngredient.objects.filter(
+        user__in=users,
+        ingredient__in=items.values('ingredient'),
+    )
+    totals.update(total_amount=Greatest(
+        F('total_amount') - Subquery(
+            items.filter(ingredient=OuterRef('ingredient')).order_by()
+            .values('ingredient').annotate(amount=Sum('amount'))
+            .values('amount')
+        ),
+        Value(0)
+    ))
+    totals.filter(total_amount__lte=0).delete()
+
+
+def rebuild_totals():
+    """Пересчитывает таблицу сумм целиком по спискам покупок."""
+    ShoppingCartIngredient.objects.all().delete()
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(ShoppingCartIngredient._meta.db_table)} '
+            f'(user_id, ingredient_id, total_amount) '
+            f'SELECT cart.user_id, item.ingredient_id, SUM(item.amount) '
+            f'FROM {quote(ShoppingCart._meta.db_table)} cart '
+            f'JOIN {quote(IngredientRecipe._meta.db_table)} item '
+            f'ON item.recipe_id = cart.recipe_id '
+            f'GROUP BY cart.user_id, item.ingredient_id'
+        )
+        return cursor.rowcount
+
+
+def find_totals_mismatches():
+    """
+    Сравнивает таблицу сумм с суммами, посчитанными по рецептам.
+
+    Возвращает список (user_id, ingredient_id, в таблице, по рецептам).
+    """
+    stored = {
+        (user_id, ingredient_id): total_amount
+        for user_id, ingredient_id, total_amount in
+        ShoppingCartIngredient.objects.values_list(
+            'user', 'ingredient', 'total_amount'
+        ).iterator()
+    }
+    mismatches = []
+    for user_id, ingredient_id, amount in _live_totals().iterator():
+        if user_id is None:
+            continue
+        key = (user_id, ingredient_id)
+        stored_amount = stored.pop(key, None)
+        if stored_amount != amount:
+            mismatches.append((*key, stored_amount, amount))
+    mismatches.extend(
+        (*key, stored_amount, None) for key, stored_amount in stored.items()
+    )
+    return mismatches
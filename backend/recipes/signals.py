@@ -0,0 +1,109 @@
+"""
+Учет удаления рецептов и пользователей любым путем.
+
+API, админка и каскадное удаление (пользователь -> его рецепты,
+избранное и список покупок) удаляют связи рецептов без сигналов по
+каждой строке, поэтому счетчики, суммы списков покупок и поисковый
+индекс поправляются в pre_delete рецепта и пользователя — пока связи
+еще в базе. После импорта в админке счетчики и суммы пересчитываются.
+
+Названия тегов и ингредиентов входят в документы поискового индекса:
+после переименования или удаления записи справочника документы ее
+рецептов пересчитываются.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+from import_export.signals import post_import
+
+from .models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from .search import index_recipes, unindex_recipes
+from .shopping_cart import rebuild_totals, subtract_recipe_from_totals
+from core.constants import SEARCH_INDEX_BATCH_SIZE
+from core.counters import change_counters, fill_counters
+
+
+User = get_user_model()
+
+SELECTION_MODELS = (Favorite, ShoppingCart)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    """Убирает рецепт из списков покупок, счетчика автора и индекса."""
+    subtract_recipe_from_totals(instance.id)
+    change_counters(
+        User.objects.filter(id=instance.author_id), 'recipes_count', delta=-1
+    )
+    unindex_recipes([instance.id])
+
+
+def _reindex(recipe_ids):
+    for start in range(0, len(recipe_ids), SEARCH_INDEX_BATCH_SIZE):
+        index_recipes(recipe_ids[start:start + SEARCH_INDEX_BATCH_SIZE])
+
+
+@receiver(pre_save, sender=Ingredient)
+@receiver(pre_save, sender=Tag)
+def catalog_item_saving(sender, instance, **kwargs):
+    """Запоминает название записи справочника до изменения."""
+    instance._indexed_name = sender.objects.filter(
+        pk=instance.pk
+    ).values_list('name', flat=True).first() if instance.pk else None
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+def catalog_item_saved(sender, instance, created, **kwargs):
+    """Переиндексирует рецепты переименованного тега или ингредиента."""
+    old_name = getattr(instance, '_indexed_name', None)
+    if not created and old_name is not None and old_name != instance.name:
+        _reindex(list(instance.recipes.values_list('id', flat=True)))
+
+
+@receiver(pre_delete, sender=Ingredient)
+@receiver(pre_delete, sender=Tag)
+def catalog_item_deleting(sender, instance, **kwargs):
+    """Запоминает рецепты записи справочника, пока связи еще в базе."""
+    instance._indexed_recipes = list(
+        instance.recipes.values_list('id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Tag)
+def catalog_item_deleted(sender, instance, **kwargs):
+    """Переиндексирует рецепты удаленного тега или ингредиента."""
+    _reindex(getattr(instance, '_indexed_recipes', []))
+
+
+@receiver(pre_delete, sender=User)
+def user_selections_deleting(sender, instance, **kwargs):
+    """
+    Уменьшает счетчики рецептов из избранного и списка покупок
+    пользователя; его суммы списка покупок удаляются каскадом.
+    """
+    for model in SELECTION_MODELS:
+        change_counters(
+            Recipe.objects.filter(**{
+                f'in_{model._meta.model_name}__user': instance
+            }),
+            model.recipe_counter, delta=-1
+        )
+
+
+@receiver(post_import)
+def recipes_imported(model, **kwargs):
+    """Пересчитывает счетчики и суммы списков покупок после импорта."""
+    if model is Recipe:
+        fill_counters(
+            User.objects.all(), {'recipes_count': (Recipe, 'author')}
+        )
+    if model in (Recipe, *SELECTION_MODELS):
+        fill_counters(Recipe.objects.all(), {
+            selection.recipe_counter: (selection, 'recipe')
+            for selection in SELECTION_MODELS
+        })
+        rebuild_totals()
@@ -0,0 +1,196 @@
+"""
+Синтетические данные для нагрузочных замеров (seed_benchmark_data).
+
+Популярность распределена по Ципфу: у k-го по популярности автора,
+рецепта, ингредиента или тега вес 1 / k ** exponent. Поэтому у немногих
+авторов много рецептов и подписчиков, немногие рецепты собирают
+большую часть избранного и списков покупок, а соль и сахар встречаются
+чаще экзотики — как в реальной базе. Записи создаются bulk_create
+пачками, без сигналов и пересчета счетчиков: это делают команды
+reconcile_counters, rebuild_shopping_cart_totals и rebuild_search_index.
+"""
+import io
+from itertools import accumulate, islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from .models import Ingredient, IngredientRecipe, Recipe, Tag
+from users.models import Follow
+
+
+User = get_user_model()
+
+IMAGE_NAME = 'recipe_image/benchmark.png'
+TAGS = (
+    ('Завтрак', 'breakfast'),
+    ('Обед', 'lunch'),
+    ('Ужин', 'dinner'),
+    ('Десерт', 'dessert'),
+    ('Выпечка', 'bakery'),
+    ('Салат', 'salad'),
+    ('Суп', 'soup'),
+    ('Вегетарианское', 'vegetarian'),
+)
+STYLES = (
+    'по-домашнему', 'на скорую руку', 'по рецепту бабушки', 'в духовке',
+    'на гриле', 'праздничный вариант', 'в мультиварке', 'по-деревенски',
+)
+WEIGHT_AMOUNTS = (5, 10, 20, 50, 100, 150, 200, 250, 300, 500, 1000)
+PIECE_AMOUNTS = (1, 1, 1, 2, 2, 3, 4, 5)
+WEIGHT_UNITS = frozenset(('г', 'мл', 'кг', 'л'))
+
+
+class Zipf:
+    """Выбор из population с весами 1 / rank ** exponent."""
+
+    def __init__(self, population, exponent, rng):
+        self.population = population
+        self.rng = rng
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent for rank in range(1, len(population) + 1)
+        ))
+
+    def choice(self):
+        return self.rng.choices(
+            self.population, cum_weights=self.cum_weights
+        )[0]
+
+    def sample(self, count, exclude=None):
+        """До count разных элементов (не больше половины population)."""
+        count = min(count, len(self.population) // 2)
+        chosen = set()
+        while len(chosen) < count:
+            chosen.update(
+                item for item in self.rng.choices(
+                    self.population,
+                    cum_weights=self.cum_weights,
+                    k=count - len(chosen),
+                ) if item != exclude
+            )
+        return chosen
+
+
+def count_around(mean, rng):
+    """Случайное число с экспоненциальным распределением и средним mean."""
+    return int(rng.expovariate(1 / mean)) if mean > 0 else 0
+
+
+def bulk_insert(model, objects, batch_size):
+    """Сохраняет objects пачками; возвращает id созданных записей."""
+    ids = []
+    objects = iter(objects)
+    while batch := list(islice(objects, batch_size)):
+        with transaction.atomic():
+            ids += [obj.pk for obj in model.objects.bulk_create(batch)]
+    return ids
+
+
+def ensure_image():
+    """Картинка-заглушка, общая для всех рецептов."""
+    if not default_storage.exists(IMAGE_NAME):
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 400), (230, 180, 120)).save(buffer, 'PNG')
+        default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+    return IMAGE_NAME
+
+
+def create_tags():
+    Tag.objects.bulk_create(
+        (Tag(name=name, slug=slug) for name, slug in TAGS),
+        ignore_conflicts=True,
+    )
+    return list(Tag.objects.filter(
+        slug__in=[slug for _, slug in TAGS]
+    ).values_list('id', flat=True))
+
+
+def create_users(count, prefix, password, batch_size):
+    password = make_password(password)
+    return bulk_insert(User, (
+        User(
+            username=f'{prefix}{number}',
+            email=f'{prefix}{number}@example.com',
+            first_name='Тестовый',
+            last_name=f'Пользователь {number}',
+            password=password,
+        ) for number in range(count)
+    ), batch_size)
+
+
+def create_recipes(count, authors, ingredients, tags, rng, batch_size):
+    """
+    Рецепты с 3–15 ингредиентами (чаще 5–8) и 1–3 тегами;
+    ingredients — кортежи (id, name, measurement_unit).
+    """
+    recipes = []
+    image = ensure_image()
+    for start in range(0, count, batch_size):
+        compositions = []
+        objects = []
+        for _ in range(min(batch_size, count - start)):
+            # Порядок множества строк зависит от PYTHONHASHSEED.
+            composition = sorted(
+                ingredients.sample(round(rng.triangular(3, 15, 6)))
+            )
+            compositions.append(composition)
+            objects.append(Recipe(
+                author_id=authors.choice(),
+                name=f'{composition[0][1].capitalize()} {rng.choice(STYLES)}',
+                image=image,
+                text='Понадобится: ' + ', '.join(
+                    name for _, name, _ in composition
+                ) + '.',
+                cooking_time=rng.randint(5, 180),
+            ))
+        with transaction.atomic():
+            batch = Recipe.objects.bulk_create(objects)
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe=recipe,
+                    ingredient_id=ingredient_id,
+                    amount=rng.choice(
+                        WEIGHT_AMOUNTS if unit in WEIGHT_UNITS
+                        else PIECE_AMOUNTS
+                    ),
+                )
+                for recipe, composition in zip(batch, compositions)
+                for ingredient_id, _, unit in composition
+            )
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe=recipe, tag_id=tag_id)
+                for recipe in batch
+                for tag_id in sorted(tags.sample(rng.randint(1, 3)))
+            )
+        recipes += [recipe.pk for recipe in batch]
+    return recipes
+
+
+def create_selections(model, users, recipes, mean, rng, batch_size):
+    """Избранное или список покупок: в среднем mean рецептов на человека."""
+    return len(bulk_insert(model, (
+        model(user_id=user_id, recipe_id=recipe_id)
+        for user_id in users
+        for recipe_id in recipes.sample(count_around(mean, rng))
+    ), batch_size))
+
+
+def create_follows(users, authors, mean, rng, batch_size):
+    """Подписки: в среднем mean на человека, чаще на популярных авторов."""
+    return len(bulk_insert(Follow, (
+        Follow(user_id=user_id, following_id=following_id)
+        for user_id in users
+        for following_id in authors.sample(
+            count_around(mean, rng), exclude=user_id
+        )
+    ), batch_size))
+
+
+def ingredient_catalog():
+    return list(Ingredient.objects.order_by('id').values_list(
+        'id', 'name', 'measurement_unit'
+    ))
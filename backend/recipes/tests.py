@@ -0,0 +1,334 @@
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIClient, APITestCase
+
+from .models import (
+    Favorite, Ingredient, IngredientRecipe, Recipe, ShoppingCart,
+    ShoppingCartIngredient, Tag
+)
+from .search import index_recipes
+from .shopping_cart import find_totals_mismatches, rebuild_totals
+from core.catalog import get_catalog_version
+from core.counters import fill_counters, reconcile_counters
+from recipes.management.commands.reconcile_counters import COUNTERS
+
+
+User = get_user_model()
+
+
+class BookkeepingTests(TestCase):
+    """
+    Счетчики и суммы списков покупок сходятся с данными после изменений
+    в админке и каскадных удалений.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@foodgram.ru', password='admin',
+            first_name='admin', last_name='admin',
+        )
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(3)
+        ]
+        cls.author, cls.reader, cls.other = (
+            User.objects.create(
+                username=username, email=f'{username}@foodgram.ru',
+                first_name=username, last_name=username,
+            )
+            for username in ('author', 'reader', 'other')
+        )
+        cls.recipes = [
+            cls.create_recipe(cls.author, 'Первый', cls.ingredients[:2]),
+            cls.create_recipe(cls.author, 'Второй', cls.ingredients[1:]),
+            cls.create_recipe(cls.reader, 'Третий', cls.ingredients),
+        ]
+        for user in (cls.reader, cls.other):
+            for recipe in cls.recipes:
+                Favorite.objects.create(user=user, recipe=recipe)
+                ShoppingCart.objects.create(user=user, recipe=recipe)
+        ShoppingCart.objects.create(user=cls.author, recipe=cls.recipes[2])
+        for model, counters in COUNTERS:
+            fill_counters(model.objects.all(), counters)
+        rebuild_totals()
+
+    @classmethod
+    def create_recipe(cls, author, name, ingredients):
+        recipe = Recipe.objects.create(
+            author=author, name=name, image='recipe_image/test.png',
+            text='Описание', cooking_time=10,
+        )
+        recipe.tags.set([cls.tag])
+        for number, ingredient in enumerate(ingredients, 1):
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=number * 10
+            )
+        return recipe
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.assert_consistent()
+
+    def assert_consistent(self):
+        self.assertEqual(find_totals_mismatches(), [])
+        for model, counters in COUNTERS:
+            mismatches = sum(
+                changed for _, changed in
+                reconcile_counters(model, counters, dry_run=True)
+            )
+            self.assertEqual(mismatches, 0, model._meta.label)
+
+    def recipe_form(self, recipe, **data):
+        """Данные формы изменения рецепта в админке с его ингредиентами."""
+        items = list(recipe.ingredient_recipe.order_by('id'))
+        form = {
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'author': recipe.author_id,
+            'tags': [self.tag.id],
+            'ingredient_recipe-TOTAL_FORMS': len(items) + 1,
+            'ingredient_recipe-INITIAL_FORMS': len(items),
+            'ingredient_recipe-MIN_NUM_FORMS': 0,
+            'ingredient_recipe-MAX_NUM_FORMS': 1000,
+        }
+        for number, item in enumerate(items):
+            form.update({
+                f'ingredient_recipe-{number}-id': item.id,
+                f'ingredient_recipe-{number}-recipe': recipe.id,
+                f'ingredient_recipe-{number}-ingredient': item.ingredient_id,
+                f'ingredient_recipe-{number}-amount': item.amount,
+            })
+        form.update(data)
+        return form
+
+    def test_admin_recipe_ingredients_change(self):
+        recipe = self.recipes[0]
+        response = self.client.post(
+            f'/admin/recipes/recipe/{recipe.id}/change/',
+            self.recipe_form(recipe, **{
+                'ingredient_recipe-0-amount': 500,
+                'ingredient_recipe-1-DELETE': 'on',
+                'ingredient_recipe-2-recipe': recipe.id,
+                'ingredient_recipe-2-ingredient': self.ingredients[2].id,
+                'ingredient_recipe-2-amount': 7,
+            })
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            set(recipe.ingredient_recipe.values_list(
+                'ingredient', 'amount'
+            )),
+            {(self.ingredients[0].id, 500), (self.ingredients[2].id, 7)}
+        )
+        self.assert_consistent()
+
+    def test_admin_recipe_author_change(self):
+        recipe = self.recipes[0]
+        response = self.client.post(
+            f'/admin/recipes/recipe/{recipe.id}/change/',
+            self.recipe_form(recipe, author=self.other.id)
+        )
+        self.assertEqual(response.status_code, 302)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.recipes_count, 1)
+        self.assert_consistent()
+
+    def test_admin_recipe_delete(self):
+        response = self.client.post(
+            f'/admin/recipes/recipe/{self.recipes[2].id}/delete/',
+            {'post': 'yes'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Recipe.objects.filter(id=self.recipes[2].id))
+        self.assert_consistent()
+
+    def test_admin_recipe_bulk_delete(self):
+        response = self.client.post('/admin/recipes/recipe/', {
+            'action': 'delete_selected',
+            '_selected_action': [recipe.id for recipe in self.recipes[:2]],
+            'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Recipe.objects.count(), 1)
+        self.assert_consistent()
+
+    def test_admin_selections(self):
+        cart = ShoppingCart.objects.get(
+            user=self.other, recipe=self.recipes[0]
+        )
+        response = self.client.post(
+            f'/admin/recipes/shoppingcart/{cart.id}/change/',
+            {'user': self.author.id, 'recipe': self.recipes[0].id}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assert_consistent()
+        response = self.client.post('/admin/recipes/shoppingcart/add/', {
+            'user': self.author.id, 'recipe': self.recipes[1].id
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assert_consistent()
+        for model in (Favorite, ShoppingCart):
+            name = model._meta.model_name
+            response = self.client.post(f'/admin/recipes/{name}/', {
+                'action': 'delete_selected',
+                '_selected_action': list(model.objects.filter(
+                    user=self.reader
+                ).values_list('id', flat=True)),
+                'post': 'yes',
+            })
+            self.assertEqual(response.status_code, 302)
+            self.assert_consistent()
+        self.assertFalse(ShoppingCartIngredient.objects.filter(
+            user=self.reader
+        ))
+
+    def test_user_delete_cascade(self):
+        self.author.delete()
+        self.assertEqual(Recipe.objects.count(), 1)
+        self.assert_consistent()
+        response = self.client.post(
+            f'/admin/users/fguser/{self.reader.id}/delete/', {'post': 'yes'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(ShoppingCartIngredient.objects.exists())
+        self.assert_consistent()
+
+    def test_api_recipe_delete(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        response = client.delete(f'/api/recipes/{self.recipes[0].id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_consistent()
+
+
+class LoadIngredientsTests(TestCase):
+    """
+    Повторная загрузка файла обновляет существующие ингредиенты по
+    названию, не создавая дублей (COPY и ON CONFLICT в PostgreSQL,
+    bulk_create с update_conflicts в остальных БД).
+    """
+
+    ROWS = [
+        ('name', 'measurement_unit'),
+        ('Картофель', 'г'),
+        ('Молоко', 'мл'),
+        ('Соль', 'по вкусу'),
+        ('Яйцо', 'шт.'),
+        ('Мука', 'г'),
+    ]
+
+    def load(self, rows, *args):
+        with TemporaryDirectory() as directory:
+            path = Path(directory) / 'ingredients.csv'
+            path.write_text(
+                ''.join(f'{name},{unit}\n' for name, unit in rows),
+                encoding='utf-8'
+            )
+            output = StringIO()
+            call_command(
+                'load_ingredients', str(path), '--batch-size', '2', *args,
+                stdout=output, verbosity=0
+            )
+        return output.getvalue()
+
+    def units(self):
+        return dict(Ingredient.objects.values_list('name', 'measurement_unit'))
+
+    def test_reload_updates_unit(self):
+        self.assertIn('Добавлено 5, обновлено 0', self.load(self.ROWS))
+        version = get_catalog_version(Ingredient)
+        changed = [*self.ROWS[:2], ('Молоко', 'л'), *self.ROWS[3:]]
+        self.assertIn(
+            'Будет добавлено 0, будет обновлено 1',
+            self.load(changed, '--dry-run')
+        )
+        self.assertEqual(self.units()['Молоко'], 'мл')
+        self.assertIn(
+            'Добавлено 0, обновлено 1, без изменений 4',
+            self.load(changed)
+        )
+        self.assertEqual(Ingredient.objects.count(), 5)
+        self.assertEqual(self.units(), dict(changed[1:]))
+        self.assertNotEqual(get_catalog_version(Ingredient), version)
+        self.assertIn('Добавлено 0, обновлено 0', self.load(changed))
+
+
+class SearchIndexTests(APITestCase):
+    """
+    Поиск q видит рецепты сразу после создания, изменения и удаления,
+    а также после переименования и удаления тегов и ингредиентов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(
+            name='Фасоль', measurement_unit='г'
+        )
+        cls.author = User.objects.create(
+            username='author', email='author@foodgram.ru',
+            first_name='author', last_name='author',
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рагу', image='recipe_image/test.png',
+            text='Овощное', cooking_time=10,
+        )
+        cls.recipe.tags.set([cls.tag])
+        IngredientRecipe.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=5
+        )
+        index_recipes([cls.recipe.id])
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+
+    def found(self, text):
+        response = self.client.get('/api/recipes/', {'q': text})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_recipe_changes(self):
+        self.assertEqual(self.found('рагу'), [self.recipe.id])
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.id}/', {
+                'name': 'Гуляш', 'text': 'Мясное', 'cooking_time': 10,
+                'tags': [self.tag.id],
+                'ingredients': [{'id': self.ingredient.id, 'amount': 5}],
+            }, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.found('рагу'), [])
+        self.assertEqual(self.found('гуляш'), [self.recipe.id])
+        response = self.client.delete(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.found('гуляш'), [])
+
+    def test_ingredient_rename_and_delete(self):
+        self.assertEqual(self.found('фасоль'), [self.recipe.id])
+        self.ingredient.name = 'Чечевица'
+        self.ingredient.save()
+        self.assertEqual(self.found('фасоль'), [])
+        self.assertEqual(self.found('чечевица'), [self.recipe.id])
+        self.ingredient.delete()
+        self.assertEqual(self.found('чечевица'), [])
+
+    def test_tag_rename_and_delete(self):
+        self.assertEqual(self.found('завтрак'), [self.recipe.id])
+        self.tag.name = 'Ужин'
+        self.tag.save()
+        self.assertEqual(self.found('завтрак'), [])
+        self.assertEqual(self.found('ужин'), [self.recipe.id])
+        self.tag.delete()
+        self.assertEqual(self.found('ужин'), [])
+        self.assertEqual(self.found('рагу'), [self.recipe.id])
@@ -4,6 +4,7 @@ from django.contrib.auth.models import Group
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
 
+from .follows import follows_changed
 from .models import Follow
 from recipes.admin import FavoriteInline
 
@@ -23,7 +24,11 @@ class UserAdmin(ImportExportModelAdmin):
     """Административный интерфейс для управления пользователями."""
 
     resource_class = UserResource
-    list_display = ('username', 'email', 'first_name', 'last_name')
+    list_display = (
+        'username', 'email', 'first_name', 'last_name',
+        'recipes_count', 'followers_count', 'following_count'
+    )
+    readonly_fields = ('recipes_count', 'followers_count', 'following_count')
     search_fields = ('username', 'email')
     inlines = (FavoriteInline,)
 
@@ -34,6 +39,31 @@ class FollowAdmin(ImportExportModelAdmin):
 
     list_display = ('user_username', 'following_username')
 
+    def save_model(self, request, obj, form, change):
+        """Переносит счетчики со старой подписки на новую."""
+        super().save_model(request, obj, form, change)
+        if change and not form.changed_data:
+            return
+        if change:
+            follows_changed(
+                form.initial['user'], removed=(form.initial['following'],)
+            )
+        follows_changed(obj.user_id, added=(obj.following_id,))
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        follows_changed(obj.user_id, removed=(obj.following_id,))
+
+    def delete_queryset(self, request, queryset):
+        removed = {}
+        for user_id, following_id in queryset.values_list(
+            'user', 'following'
+        ):
+            removed.setdefault(user_id, []).append(following_id)
+        super().delete_queryset(request, queryset)
+        for user_id, following_ids in removed.items():
+            follows_changed(user_id, removed=following_ids)
+
     @admin.display(description='Пользователь')
     def user_username(self, sub):
         return sub.user.username
@@ -0,0 +1,26 @@
+"""
+Учет подписок.
+
+Вместе с записями Follow меняются счетчики following_count подписчика и
+followers_count автора. follows_changed() вызывают и API, и админка в
+той же транзакции, что и запись подписок; удаление подписок каскадом от
+пользователя учитывает обработчик users.signals.
+"""
+from django.contrib.auth import get_user_model
+
+from core.counters import change_counters_by_pk
+
+
+User = get_user_model()
+
+
+def follows_changed(user_id, added=(), removed=()):
+    """
+    Учитывает подписки пользователя user_id на авторов added и отписки
+    от авторов removed; вызывается после записи подписок.
+    """
+    change_counters_by_pk(User, {
+        (user_id, 'following_count'): len(added) - len(removed),
+        **{(author_id, 'followers_count'): 1 for author_id in added},
+        **{(author_id, 'followers_count'): -1 for author_id in removed},
+    })
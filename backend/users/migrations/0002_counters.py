@@ -0,0 +1,43 @@
+# Generated by Django 5.1.1 on 2026-10-17 06:04
+
+from django.db import migrations, models
+
+from core.counters import fill_counters
+
+
+def fill_user_counters(apps, schema_editor):
+    Follow = apps.get_model('users', 'Follow')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FgUser = apps.get_model('users', 'FgUser')
+    fill_counters(FgUser.objects.all(), {
+        'recipes_count': (Recipe, 'author'),
+        'followers_count': (Follow, 'following'),
+        'following_count': (Follow, 'user'),
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fguser',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='fguser',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписок'),
+        ),
+        migrations.AddField(
+            model_name='fguser',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Рецептов'),
+        ),
+        migrations.RunPython(fill_user_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-17 06:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fguser',
+            name='avatar_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Уменьшенные копии аватара'),
+        ),
+    ]
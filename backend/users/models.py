@@ -14,6 +14,10 @@ class FgUser(AbstractUser):
     avatar = models.ImageField(
         'Аватар', upload_to='avatars/', null=True, blank=True
     )
+    avatar_variants = models.JSONField(
+        'Уменьшенные копии аватара', default=dict, blank=True,
+        editable=False
+    )
     first_name = models.CharField('Имя', max_length=150)
     last_name = models.CharField('Фамилия', max_length=150)
     username = models.CharField(
@@ -22,6 +26,15 @@ class FgUser(AbstractUser):
         unique=True,
         validators=(UnicodeUsernameValidator(),)
     )
+    recipes_count = models.PositiveIntegerField(
+        'Рецептов', default=0, editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        'Подписчиков', default=0, editable=False
+    )
+    following_count = models.PositiveIntegerField(
+        'Подписок', default=0, editable=False
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')
 
@@ -29,6 +42,11 @@ class FgUser(AbstractUser):
         verbose_name = 'пользователь'
         verbose_name_plural = 'Пользователи'
         ordering = ('-date_joined',)
+        indexes = [
+            models.Index(
+                fields=('-date_joined', '-id'), name='user_date_joined_id_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return truncate_with_ellipsis(self.username)
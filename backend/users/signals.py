@@ -0,0 +1,42 @@
+"""
+Учет удаления пользователей любым путем.
+
+Подписки удаляются каскадом без сигналов по каждой строке, поэтому
+счетчики подписок поправляются в pre_delete пользователя — пока
+подписки еще в базе. После импорта в админке счетчики пересчитываются.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from import_export.signals import post_import
+
+from .models import Follow
+from core.counters import change_counters, fill_counters
+
+
+User = get_user_model()
+
+FOLLOW_COUNTERS = {
+    'followers_count': (Follow, 'following'),
+    'following_count': (Follow, 'user'),
+}
+
+
+@receiver(pre_delete, sender=User)
+def user_follows_deleting(sender, instance, **kwargs):
+    """Уменьшает счетчики авторов и подписчиков пользователя."""
+    change_counters(
+        User.objects.filter(followers__user=instance),
+        'followers_count', delta=-1
+    )
+    change_counters(
+        User.objects.filter(follows__following=instance),
+        'following_count', delta=-1
+    )
+
+
+@receiver(post_import)
+def follows_imported(model, **kwargs):
+    """Пересчитывает счетчики подписок после импорта в админке."""
+    if model in (User, Follow):
+        fill_counters(User.objects.all(), FOLLOW_COUNTERS)
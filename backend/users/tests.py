@@ -0,0 +1,108 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .models import Follow
+from .signals import FOLLOW_COUNTERS
+from core.counters import fill_counters, reconcile_counters
+
+
+User = get_user_model()
+
+
+class FollowCountersTests(TestCase):
+    """
+    Счетчики подписок сходятся с данными после изменений в админке и
+    каскадного удаления пользователей.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@foodgram.ru', password='admin',
+            first_name='admin', last_name='admin',
+        )
+        cls.users = [
+            User.objects.create(
+                username=f'user{number}', email=f'user{number}@foodgram.ru',
+                first_name='user', last_name='user',
+            )
+            for number in range(4)
+        ]
+        Follow.objects.bulk_create(
+            Follow(user=user, following=following)
+            for user in cls.users
+            for following in cls.users
+            if user != following
+        )
+        fill_counters(User.objects.all(), FOLLOW_COUNTERS)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.assert_consistent()
+
+    def assert_consistent(self):
+        mismatches = sum(
+            changed for _, changed in
+            reconcile_counters(User, FOLLOW_COUNTERS, dry_run=True)
+        )
+        self.assertEqual(mismatches, 0)
+
+    def test_admin_follows(self):
+        first, second, third, _ = self.users
+        follow = Follow.objects.get(user=first, following=second)
+        response = self.client.post(
+            f'/admin/users/follow/{follow.id}/change/',
+            {'user': third.id, 'following': self.admin.id}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assert_consistent()
+        response = self.client.post('/admin/users/follow/add/', {
+            'user': first.id, 'following': self.admin.id
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assert_consistent()
+        response = self.client.post(
+            f'/admin/users/follow/{follow.id}/delete/', {'post': 'yes'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assert_consistent()
+        response = self.client.post('/admin/users/follow/', {
+            'action': 'delete_selected',
+            '_selected_action': list(Follow.objects.filter(
+                following=third
+            ).values_list('id', flat=True)),
+            'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+        third.refresh_from_db()
+        self.assertEqual(third.followers_count, 0)
+        self.assert_consistent()
+
+    def test_user_delete_cascade(self):
+        self.users[0].delete()
+        self.assert_consistent()
+        response = self.client.post(
+            f'/admin/users/fguser/{self.users[1].id}/delete/', {'post': 'yes'}
+        )
+        self.assertEqual(response.status_code, 302)
+        response = self.client.post('/admin/users/fguser/', {
+            'action': 'delete_selected',
+            '_selected_action': [self.users[2].id],
+            'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+        last = User.objects.get(id=self.users[3].id)
+        self.assertEqual(
+            (last.followers_count, last.following_count), (0, 0)
+        )
+        self.assert_consistent()
+
+    def test_api_unsubscribe(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        response = client.delete(
+            f'/api/users/{self.users[1].id}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assert_consistent()